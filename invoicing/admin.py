@@ -208,7 +208,9 @@ class InvoiceAdmin(admin.ModelAdmin):
         return actions
 
     def get_queryset(self, request):
-        return self.model.objects.annotate(annotated_subtotal=F('total')-Coalesce(F('vat'), 0, output_field=DecimalField()))
+        return self.model.objects \
+            .annotate(annotated_subtotal=F('total')-Coalesce(F('vat'), 0, output_field=DecimalField())) \
+            .annotate_overdue()
 
     def annotated_subtotal(self, invoice):
         return invoice.annotated_subtotal
@@ -227,8 +229,9 @@ class InvoiceAdmin(admin.ModelAdmin):
     payment_term_days.short_description = _(u'payment term')
 
     def is_overdue_boolean(self, invoice):
-        return invoice.is_overdue
+        return invoice.annotated_is_overdue
     is_overdue_boolean.boolean = True
+    is_overdue_boolean.admin_order_field = 'annotated_is_overdue'
     is_overdue_boolean.short_description = _(u'is overdue')
 
     def is_paid(self, invoice):
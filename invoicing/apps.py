@@ -37,3 +37,15 @@ class Config(AppConfig):
 
         if invoice1._get_number() == invoice2._get_number():
             raise ImproperlyConfigured("The INVOICING_NUMBER_FORMAT is incorrect for the current INVOICING_COUNTER_PERIOD")
+
+        self.check_pdf_fonts()
+
+    def check_pdf_fonts(self):
+        from django.utils.module_loading import import_string
+        from invoicing.formatters.pdf import PDFFormatter, get_font_paths
+
+        formatter = getattr(settings, 'INVOICING_FORMATTER', 'invoicing.formatters.html.BootstrapHTMLFormatter')
+
+        if issubclass(import_string(formatter), PDFFormatter):
+            # fail on startup instead of on first rendered invoice
+            get_font_paths()
@@ -0,0 +1,124 @@
+import hashlib
+import posixpath
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.utils import timezone
+
+
+def get_pdf_cache():
+    """
+    Returns PDF cache if enabled by ``INVOICING_PDF_CACHE_ENABLED``, otherwise None.
+    """
+    if not getattr(settings, 'INVOICING_PDF_CACHE_ENABLED', False):
+        return None
+
+    return PDFCache(
+        storage=storages[getattr(settings, 'INVOICING_PDF_CACHE_STORAGE', 'default')],
+        location=getattr(settings, 'INVOICING_PDF_CACHE_LOCATION', 'invoicing/pdf_cache'),
+        max_age=getattr(settings, 'INVOICING_PDF_CACHE_MAX_AGE', None),
+        max_size=getattr(settings, 'INVOICING_PDF_CACHE_MAX_SIZE', None),
+    )
+
+
+class PDFCache(object):
+    """
+    Content-addressed cache of rendered invoice PDFs stored on a file storage.
+
+    Cache key is derived from invoice pk, its ``modified`` timestamp, formatter class and language,
+    so any saved change of the invoice (or its items) makes previously cached documents unreachable.
+    Unreachable documents are removed by ``evict()``.
+    """
+    def __init__(self, storage, location, max_age=None, max_size=None):
+        self.storage = storage
+        self.location = location
+        self.max_age = max_age  # seconds
+        self.max_size = max_size  # bytes
+
+    @staticmethod
+    def get_key(invoice, formatter_class):
+        formatter_path = f'{formatter_class.__module__}.{formatter_class.__qualname__}'
+        modified = invoice.modified.isoformat() if invoice.modified else ''
+        value = f'{invoice.pk}:{modified}:{formatter_path}:{invoice.language}'
+        return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+    def get_path(self, key):
+        return posixpath.join(self.location, key[:2], f'{key}.pdf')
+
+    def has(self, invoice, formatter_class):
+        return invoice.pk is not None and self.storage.exists(self.get_path(self.get_key(invoice, formatter_class)))
+
+    def get(self, invoice, formatter_class):
+        """
+        Returns cached PDF content or None.
+        """
+        if invoice.pk is None:
+            return None
+
+        path = self.get_path(self.get_key(invoice, formatter_class))
+
+        try:
+            with self.storage.open(path, 'rb') as file:
+                return file.read()
+        except OSError:
+            return None
+
+    def set(self, invoice, formatter_class, content):
+        if invoice.pk is None:
+            return
+
+        path = self.get_path(self.get_key(invoice, formatter_class))
+
+        if self.storage.exists(path):
+            # same key means same content
+            return
+
+        self.storage.save(path, ContentFile(content))
+
+    def iter_files(self):
+        """
+        Yields ``(path, modified_time, size)`` of cached documents.
+        """
+        try:
+            directories, files = self.storage.listdir(self.location)
+        except OSError:
+            return
+
+        for directory in directories:
+            directory_path = posixpath.join(self.location, directory)
+
+            for name in self.storage.listdir(directory_path)[1]:
+                path = posixpath.join(directory_path, name)
+                yield path, self.storage.get_modified_time(path), self.storage.size(path)
+
+    def evict(self, max_age=None, max_size=None):
+        """
+        Deletes documents older than ``max_age`` seconds and then the oldest documents
+        until the cache is smaller than ``max_size`` bytes. Returns number of deleted documents.
+        """
+        max_age = max_age if max_age is not None else self.max_age
+        max_size = max_size if max_size is not None else self.max_size
+        files = sorted(self.iter_files(), key=lambda file: file[1], reverse=True)
+        deleted = 0
+
+        if max_age is not None:
+            expiration = timezone.now() - timedelta(seconds=max_age)
+            expired = [file for file in files if file[1] < expiration]
+            files = [file for file in files if file[1] >= expiration]
+
+            for path, modified_time, size in expired:
+                self.storage.delete(path)
+                deleted += 1
+
+        if max_size is not None:
+            total_size = sum(size for path, modified_time, size in files)
+
+            while files and total_size > max_size:
+                path, modified_time, size = files.pop()
+                self.storage.delete(path)
+                total_size -= size
+                deleted += 1
+
+        return deleted
@@ -3,120 +3,198 @@ import logging
 
 import requests
 from django.contrib import messages
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import EMPTY_VALUES
-from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
 
+from invoicing.exporters.ikros.list import InvoiceIKrosApiExporter
 from invoicing.exporters.mixins import InvoiceManagerMixin
 from invoicing.models import Invoice
+from invoicing.utils import get_http_session, iter_concurrently
 
 logger = logging.getLogger(__name__)
 
 
 class IKrosManager(InvoiceManagerMixin):
-    def export_via_api(self, request, queryset):
+    exporter_class = InvoiceIKrosApiExporter
+    request_timeout = 60
+    chunk_size = 100
+    chunk_max_bytes = 1024 * 1024
+
+    def export_via_api(self, request, queryset=None, exporter_params=None):
         if self.manager_settings.get('API_URL', None) in EMPTY_VALUES:
             raise EnvironmentError(_('Missing invoicing manager API url'), self.__class__.__name__)
 
         if self.manager_settings.get('API_KEY', None) in EMPTY_VALUES:
             raise EnvironmentError(_('Missing invoicing manager API key'), self.__class__.__name__)
 
-        invoices_data = []
-
-        for invoice in queryset:
-            invoice_data = {
-                "documentNumber": invoice.number,
-                "createDate": invoice.date_issue.strftime('%Y-%m-%dT00:00:00'),
-                "dueDate": invoice.date_due.strftime('%Y-%m-%dT00:00:00'),
-                "completionDate": invoice.date_tax_point.strftime('%Y-%m-%dT00:00:00'),
-                "clientName": invoice.customer_name,
-                "clientStreet": invoice.customer_street,
-                "clientPostCode": invoice.customer_zip,
-                "clientTown": invoice.customer_city,
-                "clientCountry": invoice.get_customer_country_display(),
-                "clientRegistrationId": invoice.customer_registration_id,
-                "clientTaxId": invoice.customer_tax_id,
-                "clientVatId": invoice.customer_vat_id,
-                "clientPhone": invoice.customer_phone,
-                "clientEmail": invoice.customer_email,
-                "variableSymbol": invoice.variable_symbol,
-                "paymentType": invoice.get_payment_method_display(),
-                "deliveryType": invoice.get_delivery_method_display(),
-                "senderContactName": invoice.issuer_name,
-                "clientPostalName": invoice.shipping_name,
-                "clientPostalStreet": invoice.shipping_street,
-                "clientPostalPostCode": invoice.shipping_zip,
-                "clientPostalTown": invoice.shipping_city,
-                "clientPostalCountry": invoice.get_shipping_country_display(),
-                "clientInternalId": f'{invoice.customer_country}001',  # TODO: custom mapping
-                "currency": invoice.currency,
-                "items": []
-            }
+        from invoicing.exporters.ikros.tasks import send_invoices_to_ikros
+        export = self._execute_task_export(request, send_invoices_to_ikros, exporter_params, queryset)
 
-            for item in invoice.item_set.all():
-                item_data = {
-                    "name": item.title,
-                    "count": str(item.quantity),
-                    "measureType": item.get_unit_display(),
-                    "unitPrice": str(item.unit_price),
-                    "vat": item.vat
-                }
+        if export is not None:
+            messages.info(request, _('Export of %d invoice(s) queued for IKROS API processing') % export.total)
 
-                if invoice.status == Invoice.STATUS.CANCELED:
-                    item_data['count'] = 0
-                    item_data['unitPrice'] = 0
+    export_via_api.short_description = _('Export to IKROS (API)')
 
-                invoice_data['items'].append(item_data)
+    def iter_export_results(self, queryset, documents=None):
+        """
+        Sends invoices in payload chunks and yields ``(invoice_id, invoice_number, success, detail)``
+        for the export task. Detail of successfully sent invoices are download URLs of documents
+        created from their chunk, all download URLs are appended to ``documents`` list (if given).
+
+        Chunks are limited by ``CHUNK_SIZE`` invoices and ``CHUNK_MAX_BYTES`` bytes of payload
+        and sent by pool of ``CONCURRENCY`` threads sharing one HTTP session, each request limited by ``TIMEOUT`` seconds.
+        """
+        concurrency = max(int(self.manager_settings.get('CONCURRENCY', 1)), 1)
+        url = self.manager_settings['API_URL']
+        timeout = self.manager_settings.get('TIMEOUT', self.request_timeout)
+        headers = {
+            'Authorization': 'Bearer ' + str(self.manager_settings['API_KEY']),
+            'Content-Type': 'application/json'
+        }
+        session = get_http_session(concurrency)
 
-            if invoice.status == Invoice.STATUS.CANCELED:
-                invoice_data['closingText'] = 'STORNO'
+        try:
+            responses = iter_concurrently(
+                lambda chunk: self.post_payload(session, url, chunk[1], headers, timeout),
+                self.iter_payload_chunks(queryset),
+                max_workers=concurrency,
+            )
+
+            for (invoices, payload), (data, error) in responses:
+                success, detail, download_urls = self.get_response_result(data, error)
+
+                if documents is not None:
+                    documents.extend(download_urls)
+
+                for invoice_id, invoice_number in invoices:
+                    yield invoice_id, invoice_number, success, detail
+        finally:
+            session.close()
+
+    def iter_payload_chunks(self, queryset):
+        """
+        Yields ``(invoices, payload)`` chunks, where invoices are ``(invoice_id, invoice_number)`` tuples
+        and payload is JSON array of their data with at most ``CHUNK_SIZE`` invoices and ``CHUNK_MAX_BYTES`` bytes
+        (unless data of a single invoice is larger).
+        """
+        chunk_size = max(int(self.manager_settings.get('CHUNK_SIZE', self.chunk_size)), 1)
+        max_bytes = int(self.manager_settings.get('CHUNK_MAX_BYTES', self.chunk_max_bytes))
+        invoices = []
+        parts = []
+        size = 2  # brackets of JSON array
+
+        for invoice in queryset.prefetch_related('item_set').iterator(chunk_size=chunk_size):
+            part = json.dumps(self.get_invoice_data(invoice), cls=DjangoJSONEncoder).encode('utf-8')
+
+            if parts and (len(parts) >= chunk_size or size + len(part) + 1 > max_bytes):
+                yield self.get_payload_chunk(invoices, parts)
+                invoices, parts, size = [], [], 2
+
+            invoices.append((invoice.id, invoice.number))
+            parts.append(part)
+            size += len(part) + (1 if len(parts) > 1 else 0)
+
+        if parts:
+            yield self.get_payload_chunk(invoices, parts)
+
+    @staticmethod
+    def get_payload_chunk(invoices, parts):
+        payload = b'[' + b','.join(parts) + b']'
+        logger.info(f"IKROS payload of {len(invoices)} invoices ({len(payload)} bytes)")
+        logger.debug("IKROS payload invoices data: %s", payload)
+        return invoices, payload
+
+    def post_payload(self, session, url, payload, headers, timeout):
+        """
+        Posts payload chunk to IKROS API. Runs in worker thread.
+
+        Returns tuple ``(response_data, exception)``.
+        """
+        try:
+            r = session.post(url=url, data=payload, headers=headers, timeout=timeout)
+            return r.json(), None
+        except (requests.exceptions.RequestException, ValueError) as e:
+            return None, e
+
+    def get_response_result(self, data, error):
+        """
+        Returns tuple ``(success, detail, download_urls)`` of IKROS response data (or request error).
+        """
+        if error is not None:
+            logger.error(f"IKROS request failed: {error}")
+            return False, str(error), []
+
+        logger.debug("IKROS response data: %s", data)
+
+        if not isinstance(data, dict):
+            error_msg = _('Unexpected response: %s') % (data,)
+            logger.error(f"IKROS request failed: {error_msg}")
+            return False, str(error_msg), []
+
+        if data.get('message', None) is not None:
+            error_msg = _('Result code: %s. Message: %s (%s)') % (
+                data.get('code', data.get('resultCode')),
+                data['message'],
+                data.get('errorType', '-')
+            )
+            logger.error(f"IKROS request failed: {error_msg}")
+            return False, str(error_msg), []
+
+        download_urls = [document['downloadUrl'] for document in data.get('documents') or []]
+        logger.info(f"IKROS created {len(download_urls)} documents")
+        return True, ' '.join(download_urls), download_urls
+
+    def get_invoice_data(self, invoice):
+        invoice_data = {
+            "documentNumber": invoice.number,
+            "createDate": invoice.date_issue.strftime('%Y-%m-%dT00:00:00'),
+            "dueDate": invoice.date_due.strftime('%Y-%m-%dT00:00:00'),
+            "completionDate": invoice.date_tax_point.strftime('%Y-%m-%dT00:00:00'),
+            "clientName": invoice.customer_name,
+            "clientStreet": invoice.customer_street,
+            "clientPostCode": invoice.customer_zip,
+            "clientTown": invoice.customer_city,
+            "clientCountry": invoice.get_customer_country_display(),
+            "clientRegistrationId": invoice.customer_registration_id,
+            "clientTaxId": invoice.customer_tax_id,
+            "clientVatId": invoice.customer_vat_id,
+            "clientPhone": invoice.customer_phone,
+            "clientEmail": invoice.customer_email,
+            "variableSymbol": invoice.variable_symbol,
+            "paymentType": invoice.get_payment_method_display(),
+            "deliveryType": invoice.get_delivery_method_display(),
+            "senderContactName": invoice.issuer_name,
+            "clientPostalName": invoice.shipping_name,
+            "clientPostalStreet": invoice.shipping_street,
+            "clientPostalPostCode": invoice.shipping_zip,
+            "clientPostalTown": invoice.shipping_city,
+            "clientPostalCountry": invoice.get_shipping_country_display(),
+            "clientInternalId": f'{invoice.customer_country}001',  # TODO: custom mapping
+            "currency": invoice.currency,
+            "items": []
+        }
+
+        for item in invoice.item_set.all():
+            item_data = {
+                "name": item.title,
+                "count": str(item.quantity),
+                "measureType": item.get_unit_display(),
+                "unitPrice": str(item.unit_price),
+                "vat": item.vat
+            }
 
-            if invoice.credit != 0:
-                invoice_data['items'][0]['hasDiscount'] = True
-                invoice_data['items'][0]['discountValue'] = str(invoice.credit * -1)
+            if invoice.status == Invoice.STATUS.CANCELED:
+                item_data['count'] = 0
+                item_data['unitPrice'] = 0
 
-            invoices_data.append(invoice_data)
+            invoice_data['items'].append(item_data)
 
-        logger.info("IKROS payload invoices data: %s", invoices_data)
-        try:
-            payload = json.dumps(invoices_data)
+        if invoice.status == Invoice.STATUS.CANCELED:
+            invoice_data['closingText'] = 'STORNO'
 
-            url = self.manager_settings['API_URL']
-            api_key = self.manager_settings['API_KEY']
-            headers = {
-                'Authorization': 'Bearer ' + str(api_key),
-                'Content-Type': 'application/json'
-            }
-            r = requests.post(url=url, data=payload, headers=headers)
-            data = r.json()
-
-            logger.info("IKROS response data: %s", data)
-
-            if data.get('message', None) is not None:
-                error_msg = _('Result code: %d. Message: %s (%s)') % (
-                    data.get('code', data.get('resultCode')),
-                    data['message'],
-                    data.get('errorType', '-')
-                )
-                messages.error(request, error_msg)
-                raise Exception(error_msg)
-
-            if 'documents' in data:
-                if len(data['documents']) > 0:
-                    download_url = data['documents'][0]['downloadUrl']
-                    result = mark_safe(_('%d invoices sent to IKROS accounting software [<a href="%s" target="_blank">Fetch</a>]') % (
-                        queryset.count(),
-                        download_url
-                    ))
-                else:
-                    result = _('%d invoices sent to IKROS accounting software') % (
-                        queryset.count(),
-                    )
-                messages.success(request, result)
-                return result
-
-        except Exception as e:
-            messages.error(request, str(e))
-            return str(e)
+        if invoice.credit != 0:
+            invoice_data['items'][0]['hasDiscount'] = True
+            invoice_data['items'][0]['discountValue'] = str(invoice.credit * -1)
 
-    export_via_api.short_description = _('Export to IKROS (API)')
+        return invoice_data
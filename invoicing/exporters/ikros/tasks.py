@@ -0,0 +1,18 @@
+from django.utils.translation import gettext_lazy as _
+from pragmatic.utils import get_task_decorator
+
+from invoicing.exporters.tasks import process_api_export
+
+task = get_task_decorator("exports")
+
+
+@task
+def send_invoices_to_ikros(export_id, manager):
+    documents = []
+
+    process_api_export(
+        export_id,
+        lambda queryset: manager.iter_export_results(queryset, documents),
+        _('IKROS export of invoices'),
+        links=documents,
+    )
@@ -10,6 +10,16 @@ from invoicing import settings as invoicing_settings
 logger = logging.getLogger(__name__)
 
 
+class InvoiceExporterQuerysetMixin(object):
+    """
+    Prefetches invoice items, so values computed from them per invoice
+    (items, ``vat_summary``, ``is_reverse_charge()``, item aggregates) don't query database
+    and export takes constant number of queries regardless of number of invoices.
+    """
+    def get_queryset(self):
+        return super().get_queryset().prefetch_related('item_set')
+
+
 class InvoiceManagerMixin(object):
     required_origin = None
 
@@ -116,3 +126,50 @@ class InvoiceManagerMixin(object):
             language=translation.get_language(),
         )
         messages.info(request, _('Export of %d invoice(s) queued and will be sent to email') % qs_count)
+
+    def _execute_task_export(self, request, task, exporter_params, queryset):
+        """
+        Common export logic for exports processed by a background task (API exports).
+
+        Tracks the export (``Export`` with ``ExportItem`` per invoice)
+        and dispatches ``task(export_id, manager)``.
+
+        Args:
+            request: The HTTP request object
+            task: The task processing the export
+            exporter_params: The params of the exporter
+            queryset: The queryset of invoices to export
+
+        Returns:
+            Export instance, or None if there is nothing valid to export
+        """
+        from outputs.models import Export
+        from pragmatic.utils import dispatch_task
+
+        if exporter_params is None:
+            exporter_params = {"user": request.user, "recipients": [request.user], "params": {}}
+
+        if "output_type" not in exporter_params:
+            exporter_params = {**exporter_params, 'output_type': Export.OUTPUT_TYPE_STREAM}
+
+        if queryset is not None and queryset.exists():
+            exporter_params = {**exporter_params, 'queryset': queryset}
+
+        exporter = self.exporter_class(**exporter_params)
+
+        if not self._is_export_qs_valid(request, exporter):
+            return None
+
+        qs_count = exporter.get_queryset().count()
+        logger.info(
+            f"User {request.user} (ID: {request.user.id}) executing export with {qs_count} invoice(s)",
+            extra={
+                'user_id': request.user.id,
+                'exporter_class': self.exporter_class,
+                'exporter_params': exporter_params
+            }
+        )
+
+        export = exporter.save_export()
+        dispatch_task(task, export.id, self)
+        return export
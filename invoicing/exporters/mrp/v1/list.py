@@ -3,13 +3,14 @@ from decimal import Decimal
 
 from django.core.validators import EMPTY_VALUES
 
+from invoicing.exporters.mixins import InvoiceExporterQuerysetMixin
 from invoicing.models import Invoice
 from lxml import etree
 from outputs.mixins import ExporterMixin
 from outputs.models import Export
 
 
-class InvoiceXmlMrpListExporter(ExporterMixin):
+class InvoiceXmlMrpListExporter(InvoiceExporterQuerysetMixin, ExporterMixin):
     export_format = Export.FORMAT_XML
     export_context = Export.CONTEXT_LIST
     model = Invoice
@@ -17,7 +18,7 @@ class InvoiceXmlMrpListExporter(ExporterMixin):
     filename = "MRP_invoice_export.zip"
 
     def get_queryset(self):
-        return self.queryset.order_by("-pk").distinct()
+        return super().get_queryset().order_by("-pk").distinct()
 
     def export(self):
         self.write_data(self.output)
@@ -7,6 +7,7 @@ from django.core.validators import EMPTY_VALUES
 from lxml import etree
 
 
+from invoicing.exporters.mixins import InvoiceExporterQuerysetMixin
 from invoicing.models import Invoice
 
 from outputs.mixins import ExporterMixin
@@ -16,6 +17,7 @@ from invoicing.taxation.eu import EUTaxationPolicy
 from invoicing.utils import format_decimal
 
 from .utils import (
+    get_xsd_schema,
     sanitize_forbidden_chars,
     sanitize_uppercase_only,
     sanitize_zipcode,
@@ -25,7 +27,7 @@ from .utils import (
 logger = logging.getLogger(__name__)
 
 
-class InvoiceMrpListExporterMixin(ExporterMixin):
+class InvoiceMrpListExporterMixin(InvoiceExporterQuerysetMixin, ExporterMixin):
     export_format = Export.FORMAT_XML
     export_context = Export.CONTEXT_LIST
     model = Invoice
@@ -36,6 +38,7 @@ class InvoiceMrpListExporterMixin(ExporterMixin):
     api_request_command = ''
     xml_encoding = 'Windows-1250'
     request_timeout = 30
+    chunk_size = 100
 
     def __init__(self, user, recipients, **kwargs):
         self.outputs = []
@@ -82,6 +85,18 @@ class InvoiceMrpListExporterMixin(ExporterMixin):
         """
         return self.outputs
 
+    def iter_outputs_per_item(self, chunk_size=None):
+        """
+        Generate separate output for each item in queryset lazily.
+
+        Invoices are fetched in chunks of ``chunk_size`` (with prefetched items) and each output
+        is built only when requested, so it can be sent before the next one is generated
+        and memory use doesn't grow with the size of the queryset.
+        Yields the same dictionaries as ``get_outputs_per_item()``, without calling export().
+        """
+        for invoice in self.get_queryset().iterator(chunk_size=chunk_size or self.chunk_size):
+            yield self.get_output_per_item(invoice)
+
     def get_invoice_root_element(self):
         raise NotImplementedError()
 
@@ -93,18 +108,11 @@ class InvoiceMrpListExporterMixin(ExporterMixin):
         raise NotImplementedError()
 
     def get_xsd_schema(self):
-        """Get XSD schema for validation."""
+        """Get XSD schema for validation (compiled once per process, see ``get_xsd_schema()`` util)."""
         xsd_path = self.get_xsd_filename()
 
         try:
-            if not os.path.exists(xsd_path):
-                raise FileNotFoundError(
-                    f"XSD schema file not found: {xsd_path}"
-                )
-
-            # Parse XSD schema
-            xsd_doc = etree.parse(xsd_path)
-            return etree.XMLSchema(xsd_doc)
+            return get_xsd_schema(xsd_path)
 
         except FileNotFoundError as e:
             # If file doesn't exist, log warning but don't fail
@@ -141,11 +149,11 @@ class InvoiceMrpListExporterMixin(ExporterMixin):
         try:
             schema.assertValid(xml_element)
         except etree.DocumentInvalid as e:
-            # Build detailed error message
-            error_log = schema.error_log
+            # Build detailed error message from errors of this validation
+            # (error log of shared schema may be overwritten by other validations)
             errors = []
 
-            for error in error_log:
+            for error in e.error_log:
                 error_msg = (
                     f"Line {error.line}, Column {error.column}: "
                     f"{error.message}"
@@ -233,36 +241,40 @@ class InvoiceMrpListExporterMixin(ExporterMixin):
         """
         Generate separate XML elements for each invoice and store them in self.outputs.
 
-        For each invoice in the queryset, creates a MRPKSData element containing
-        that single invoice, validates it, wraps it in a request envelope,
-        and appends the result to self.outputs as a dictionary with keys
-        'invoice' and 'xml_string'.
-
-        Invoices that fail XML validation are included in the output with an
-        'error' key instead of 'xml_string', so the caller can report them
-        without aborting the entire export.
-
         The outputs can be retrieved later using get_outputs_per_item().
         This method is used when export_per_item=True.
+        See iter_outputs_per_item() for generating outputs on demand instead.
         """
-        for invoice in self.get_queryset():
-            try:
-                invoice_element = self.get_invoice_element(invoice)
+        outputs.extend(self.iter_outputs_per_item())
 
-                mrpks_data = etree.Element("MRPKSData", version="2.0")
-                invoices_container = etree.SubElement(mrpks_data, self.get_invoice_root_element())
-                invoices_container.append(invoice_element)
+    def get_output_per_item(self, invoice):
+        """
+        Generate XML output of a single invoice.
+
+        Creates a MRPKSData element containing the invoice, validates it
+        and wraps it in a request envelope (for stream outputs).
+
+        Returns a dictionary with keys 'invoice' and 'xml_string'.
+        Invoice that fails XML validation gets an 'error' key instead of
+        'xml_string', so the caller can report it without aborting
+        the entire export.
+        """
+        try:
+            invoice_element = self.get_invoice_element(invoice)
+
+            mrpks_data = etree.Element("MRPKSData", version="2.0")
+            invoices_container = etree.SubElement(mrpks_data, self.get_invoice_root_element())
+            invoices_container.append(invoice_element)
 
-                self.validate_xml(mrpks_data)
+            self.validate_xml(mrpks_data)
 
-                if self.output_type == Export.OUTPUT_TYPE_STREAM:
-                    mrpks_data = self.wrap_to_request_envelope(mrpks_data, invoice)
+            if self.output_type == Export.OUTPUT_TYPE_STREAM:
+                mrpks_data = self.wrap_to_request_envelope(mrpks_data, invoice)
 
-                xml_string = self.xml_to_string(mrpks_data)
-                outputs.append({"invoice": invoice, "xml_string": xml_string})
-            except (ValueError, etree.Error) as e:
-                logger.error(f"XML validation failed for invoice {invoice.number}: {e}")
-                outputs.append({"invoice": invoice, "error": str(e)})
+            return {"invoice": invoice, "xml_string": self.xml_to_string(mrpks_data)}
+        except (ValueError, etree.Error) as e:
+            logger.error(f"XML validation failed for invoice {invoice.number}: {e}")
+            return {"invoice": invoice, "error": str(e)}
 
     def xml_to_string(self, xml):
         """
@@ -24,38 +24,11 @@ class MrpApiManagerMixin(InvoiceManagerMixin):
         if self.manager_settings.get('API_URL', None) in EMPTY_VALUES:
             raise EnvironmentError(_('Missing invoicing manager API url'), self.__class__.__name__)
 
-        if exporter_params is None:
-            exporter_params = {"user": request.user, "recipients": [request.user], "params": {}}
-
-        if "output_type" not in exporter_params:
-            from outputs.models import Export
-            exporter_params = {**exporter_params, 'output_type': Export.OUTPUT_TYPE_STREAM}
-
-        if queryset is not None and queryset.exists():
-            exporter_params = {**exporter_params, 'queryset': queryset}
-
-        exporter = self.exporter_class(**exporter_params)
-
-        if not self._is_export_qs_valid(request, exporter):
-            return
-
-        qs_count = exporter.get_queryset().count()
-        logger.info(
-            f"User {request.user} (ID: {request.user.id}) executing export with {qs_count} invoice(s)",
-            extra={
-                'user_id': request.user.id,
-                'exporter_class': self.exporter_class,
-                'exporter_params': exporter_params
-            }
-        )
-
-        export = exporter.save_export()
-
         from invoicing.exporters.mrp.v2.tasks import send_invoices_to_mrp
-        from pragmatic.utils import dispatch_task
-        dispatch_task(send_invoices_to_mrp, export.id, self)
+        export = self._execute_task_export(request, send_invoices_to_mrp, exporter_params, queryset)
 
-        messages.info(request, _('Export of %d invoice(s) queued for MRP API processing') % exporter.get_queryset().count())
+        if export is not None:
+            messages.info(request, _('Export of %d invoice(s) queued for MRP API processing') % export.total)
 
 
 class MrpIssuedManager(MrpApiManagerMixin):
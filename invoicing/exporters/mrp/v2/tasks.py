@@ -1,6 +1,8 @@
 import logging
+import time
 
 import requests
+from urllib3.exceptions import NewConnectionError
 from django.core.mail import EmailMultiAlternatives
 
 from django.utils.translation import gettext_lazy as _
@@ -11,14 +13,29 @@ from pragmatic.utils import get_task_decorator
 
 from invoicing import settings as invoicing_settings
 from invoicing.exporters.mrp.v2.list import InvoiceMrpListExporterMixin
+from invoicing.utils import get_http_session, iter_concurrently
 
 logger = logging.getLogger(__name__)
 
 task = get_task_decorator("exports")
 
+# response of overloaded or restarting MRP server which didn't process the request, worth retrying
+RETRY_STATUS_CODES = (503,)
+
+# the invoice may have been created by MRP server even though the request failed
+UNCERTAIN_STATUS_CODES = (502, 504)
+MANUAL_CHECK_NOTE = 'The invoice may have been created, check it in MRP before sending it again.'
+# prefix of export item detail of such invoices, they are not resent by resumed export
+UNCERTAIN_MARKER = 'UNCERTAIN: '
+
 
 @task
-def send_invoices_to_mrp(export_id, manager_class):
+def send_invoices_to_mrp(export_id, manager_class, resend_uncertain=False):
+    """
+    Sends invoices of export to MRP server. Re-dispatched export resumes: invoices already sent
+    successfully are skipped and so are invoices whose previous request may have created them
+    (see ``UNCERTAIN_MARKER``), unless ``resend_uncertain`` is requested after checking them in MRP.
+    """
     export = Export.objects.get(id=export_id)
 
     export.status = Export.STATUS_PROCESSING
@@ -27,6 +44,8 @@ def send_invoices_to_mrp(export_id, manager_class):
     logger.info(f"Sending {export.total} invoices to MRP server (one invoice per request)")
 
     results = []
+    sent_ids = []
+    uncertain_ids = []
     fatal_error = None
     exporter = export.exporter
 
@@ -38,29 +57,51 @@ def send_invoices_to_mrp(export_id, manager_class):
         return
 
     try:
-        # important - set export_per_item, to split export items to multiple outputs
-        exporter.export_per_item = True
-        exporter.export()
+        # resume of re-dispatched export: invoices already accepted by MRP are not sent again
+        sent_ids = list(export.items.successful().values_list('object_id', flat=True))
 
-        # update status of export
-        export.status = Export.STATUS_PROCESSING
-        export.save(update_fields=['status'])
+        if not resend_uncertain:
+            # POST is not idempotent, these are resent only on explicit request
+            uncertain_ids = list(export.items.failed().filter(detail__startswith=UNCERTAIN_MARKER).values_list('object_id', flat=True))
 
-        manager_class_path = f'{manager_class.__class__.__module__}.{manager_class.__class__.__name__}'
-        api_url = invoicing_settings.INVOICING_MANAGERS.get(manager_class_path)['API_URL']
+        if sent_ids or uncertain_ids:
+            logger.info(f"Skipping {len(sent_ids)} invoices already sent to MRP server and {len(uncertain_ids)} possibly sent ones")
+            exporter.queryset = exporter.queryset.exclude(pk__in=sent_ids + uncertain_ids)
 
-        # MRP autonomous mode handles only one invoice per request
-        # Process each invoice separately and collect results
-        for output in exporter.get_outputs_per_item():
-            invoice = output['invoice']
+        manager_class_path = f'{manager_class.__class__.__module__}.{manager_class.__class__.__name__}'
+        manager_settings = invoicing_settings.INVOICING_MANAGERS.get(manager_class_path)
+        api_url = manager_settings['API_URL']
+        concurrency = max(int(manager_settings.get('CONCURRENCY', 1)), 1)
+        retries = max(int(manager_settings.get('RETRIES', 3)), 0)
+        backoff = float(manager_settings.get('BACKOFF', 1))
+
+        def iter_outputs():
+            # runs in this thread, so validation failures are recorded right away;
+            # outputs are generated on demand, so sending starts with the first invoice
+            for output in exporter.iter_outputs_per_item():
+                if 'error' in output:
+                    results.append(_record_validation_failure(output['invoice'], output['error'], export, exporter))
+                    continue
+
+                yield output
+
+        # MRP autonomous mode handles only one invoice per request,
+        # up to `concurrency` requests are in flight at once sharing pooled connections
+        session = get_http_session(concurrency)
+
+        try:
+            responses = iter_concurrently(
+                lambda output: _post_invoice_xml(session, api_url, output['xml_string'], retries, backoff),
+                iter_outputs(),
+                max_workers=concurrency,
+            )
 
-            if 'error' in output:
-                result = _record_validation_failure(invoice, output['error'], export, exporter)
+            for output, (response, error) in responses:
+                # results are recorded in this thread as soon as each request completes
+                result = _record_response(output['invoice'], output['xml_string'], export, response, error)
                 results.append(result)
-                continue
-
-            result = _send_request_per_invoice_item(invoice, output['xml_string'], export, api_url)
-            results.append(result)
+        finally:
+            session.close()
 
     except Exception as e:
         logger.exception(f"Fatal error during MRP export: {e}")
@@ -77,20 +118,77 @@ def send_invoices_to_mrp(export_id, manager_class):
         export.save(update_fields=['status'])
 
         # Always send email summary to user
-        _send_mail_with_summary(export.creator, results, fatal_error=fatal_error)
+        _send_mail_with_summary(export.creator, results, fatal_error=fatal_error, skipped=len(sent_ids), skipped_uncertain=len(uncertain_ids))
 
 
-def _send_request_per_invoice_item(invoice, xml_string, export, api_url):
+def _post_invoice_xml(session, api_url, xml_string, retries=0, backoff=0):
     """
-    Send a single invoice to MRP server.
+    Post a single invoice XML to MRP server.
 
-    Args:
-        invoice: Invoice instance being sent to MRP server
-        xml_string: XML string (bytes) for single invoice, wrapped in MRP envelope
-        export: Export instance to track the export status
+    Requests which didn't reach MRP server (connection errors and timeouts before the connection
+    was established) and 503 responses are retried up to ``retries`` times, waiting ``backoff`` seconds
+    before the first retry and doubling the wait before each next one. Read timeouts and other
+    errors are not retried, the invoice could already be created and POST is not idempotent.
+
+    Runs in worker threads, so it doesn't touch the database and returns
+    the raised exception instead of propagating it.
 
     Returns:
-        dict: Result with invoice_number, request_id, status, and optional error
+        tuple: (response, exception)
+    """
+    headers = {
+        'Content-Type': f'application/xml; charset={InvoiceMrpListExporterMixin.xml_encoding}'
+    }
+
+    for attempt in range(retries + 1):
+        if attempt:
+            delay = backoff * 2 ** (attempt - 1)
+            logger.warning(f"Retrying request to MRP server in {delay} seconds (attempt {attempt + 1} of {retries + 1})")
+            time.sleep(delay)
+
+        try:
+            logger.debug(f"Sending invoice XML to MRP server: {api_url}")
+            response = session.post(
+                api_url,
+                data=xml_string,
+                headers=headers,
+                timeout=InvoiceMrpListExporterMixin.request_timeout
+            )
+
+            if response.status_code in RETRY_STATUS_CODES and attempt < retries:
+                continue
+
+            response.raise_for_status()
+            return response, None
+        except Exception as e:
+            if _is_connect_error(e) and attempt < retries:
+                continue
+
+            return None, e
+
+
+def _is_connect_error(error):
+    """
+    Returns whether request failed before connection to the server was established,
+    so it is safe to send it again.
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+
+    if not isinstance(error, requests.exceptions.ConnectionError) or isinstance(error, requests.exceptions.ReadTimeout):
+        return False
+
+    # requests wraps urllib3 errors, e.g. MaxRetryError caused by NewConnectionError
+    reason = error.args[0] if error.args else None
+    return isinstance(reason, NewConnectionError) or isinstance(getattr(reason, 'reason', None), NewConnectionError)
+
+
+def _record_response(invoice, xml_string, export, response, error):
+    """
+    Record MRP server response (or request error) of a single invoice.
+
+    Fires the export_item_changed signal and returns result dict
+    for inclusion in the email summary.
     """
     root = etree.fromstring(xml_string)
     request_id = root.find(".//request").get("requestId")
@@ -98,17 +196,9 @@ def _send_request_per_invoice_item(invoice, xml_string, export, api_url):
     export_detail = ''
 
     try:
-        headers = {
-            'Content-Type': f'application/xml; charset={InvoiceMrpListExporterMixin.xml_encoding}'
-        }
-        logger.debug(f"Sending invoice {invoice.number} to MRP server: {api_url}")
-        response = requests.post(
-            api_url,
-            data=xml_string,
-            headers=headers,
-            timeout=InvoiceMrpListExporterMixin.request_timeout
-        )
-        response.raise_for_status()
+        if error is not None:
+            raise error
+
         logger.info(f"Received response for invoice {invoice.number}: {response.status_code}")
 
         # Parse and check response
@@ -137,10 +227,13 @@ def _send_request_per_invoice_item(invoice, xml_string, export, api_url):
     except requests.exceptions.Timeout as e:
         logger.error(f"Timeout when sending invoice {invoice.number}: {e}")
         timeout_msg = f'Request timeout: The MRP server did not respond within {InvoiceMrpListExporterMixin.request_timeout} seconds'
-        export_result, export_detail, result = _build_failure(invoice.number, request_id, timeout_msg)
+
+        uncertain = not isinstance(e, requests.exceptions.ConnectTimeout)
+        export_result, export_detail, result = _build_failure(invoice.number, request_id, timeout_msg, uncertain=uncertain)
     except requests.exceptions.RequestException as e:
         logger.error(f"Request error when sending invoice {invoice.number}: {e}")
-        export_result, export_detail, result = _build_failure(invoice.number, request_id, f'Network error: {str(e)}')
+        uncertain = getattr(e.response, 'status_code', None) in UNCERTAIN_STATUS_CODES
+        export_result, export_detail, result = _build_failure(invoice.number, request_id, f'Network error: {str(e)}', uncertain=uncertain)
     except Exception as e:
         logger.exception(f"Unexpected error when sending invoice {invoice.number}: {e}")
         export_result, export_detail, result = _build_failure(invoice.number, request_id, f'Unexpected error: {str(e)}')
@@ -158,7 +251,7 @@ def _send_request_per_invoice_item(invoice, xml_string, export, api_url):
     return result
 
 
-def _send_mail_with_summary(user, results, fatal_error=None):
+def _send_mail_with_summary(user, results, fatal_error=None, skipped=0, skipped_uncertain=0):
     """
     Send email summary of MRP export results to the user.
 
@@ -166,6 +259,8 @@ def _send_mail_with_summary(user, results, fatal_error=None):
         user: User object to send email to
         results: List of result dictionaries from invoice processing
         fatal_error: Optional string describing a fatal error that aborted the export
+        skipped: Number of invoices skipped because they were sent by previous run of the export
+        skipped_uncertain: Number of invoices skipped because previous run of the export may have sent them
     """
     lines = [
         str(_('MRP export of invoices')),
@@ -185,6 +280,12 @@ def _send_mail_with_summary(user, results, fatal_error=None):
         f"{_('Errors')}: {sum(1 for r in results if r['status'] == 'error')}",
     ])
 
+    if skipped:
+        lines.append(f"{_('Already sent')}: {skipped}")
+
+    if skipped_uncertain:
+        lines.append(f"{_('Not resent, check them in MRP')}: {skipped_uncertain}")
+
     error_results = [r for r in results if r['status'] == 'error']
     if error_results:
         lines.extend([
@@ -232,9 +333,10 @@ def _record_validation_failure(invoice, error_msg, export, exporter):
     return result
 
 
-def _build_failure(invoice_number, request_id, error_message, error_code=None, error_class=None):
+def _build_failure(invoice_number, request_id, error_message, error_code=None, error_class=None, uncertain=False):
     """
     Build a failure tuple for a failed invoice export.
+    Failure of ``uncertain`` request, which may have created the invoice, is marked by ``UNCERTAIN_MARKER``.
 
     Returns:
         tuple: (export_result, export_detail, result_dict)
@@ -249,6 +351,9 @@ def _build_failure(invoice_number, request_id, error_message, error_code=None, e
         result['error_code'] = str(error_code)
     if error_class is not None:
         result['error_class'] = str(error_class)
+    if uncertain:
+        result['error'] = f"{error_message}. {MANUAL_CHECK_NOTE}"
+        return ExportItem.RESULT_FAILURE, UNCERTAIN_MARKER + result['error'], result
     return ExportItem.RESULT_FAILURE, str(error_message), result
 
 
@@ -1,6 +1,49 @@
 """
-Utility functions for sanitizing data according to MRP XSD patterns.
+Utility functions for sanitizing data according to MRP XSD patterns
+and loading of the XSD schemas.
 """
+import os
+import threading
+
+from lxml import etree
+
+
+_xsd_schemas = {}
+_xsd_schemas_lock = threading.Lock()
+
+
+def get_xsd_schema(xsd_path):
+    """
+    Get compiled XSD schema. Schema is parsed and compiled once per process
+    and cached by file path and modification time, so changed file is reloaded.
+
+    Args:
+        xsd_path: Path to the XSD file
+
+    Returns:
+        etree.XMLSchema: Compiled schema
+
+    Raises:
+        FileNotFoundError: If the XSD file doesn't exist
+        etree.Error: If the XSD file can't be parsed or compiled
+    """
+    key = (xsd_path, os.path.getmtime(xsd_path))
+    schema = _xsd_schemas.get(key)
+
+    if schema is None:
+        with _xsd_schemas_lock:
+            schema = _xsd_schemas.get(key)
+
+            if schema is None:
+                schema = etree.XMLSchema(etree.parse(xsd_path))
+
+                # forget previous versions of the file
+                for cached_key in [cached_key for cached_key in _xsd_schemas if cached_key[0] == xsd_path]:
+                    del _xsd_schemas[cached_key]
+
+                _xsd_schemas[key] = schema
+
+    return schema
 
 
 def sanitize_forbidden_chars(value, max_length=None):
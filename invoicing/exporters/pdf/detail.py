@@ -1,14 +1,16 @@
+import itertools
+
+from invoicing.exporters.mixins import InvoiceExporterQuerysetMixin
 from invoicing.models import Invoice
-from invoicing.utils import get_invoices_in_pdf
+from invoicing.utils import iter_invoices_in_pdf, write_zip_archive
 
 from django.utils.translation import gettext_lazy as _
 
 from outputs.mixins import ExporterMixin
 from outputs.models import Export
-from pragmatic.utils import compress
 
 
-class InvoicePdfDetailExporter(ExporterMixin):
+class InvoicePdfDetailExporter(InvoiceExporterQuerysetMixin, ExporterMixin):
     model = Invoice
     queryset = Invoice.objects.all()
     export_format = Export.FORMAT_PDF
@@ -19,13 +21,15 @@ class InvoicePdfDetailExporter(ExporterMixin):
         self.write_data(self.output)
 
     def write_data(self, output):
-        export_files = get_invoices_in_pdf(self.get_queryset())
+        export_files = iter_invoices_in_pdf(self.get_queryset())
+        first_file = next(export_files, None)
+        second_file = next(export_files, None)
 
-        if len(export_files) == 1:
+        if first_file is not None and second_file is None:
             # directly export 1 PDF file
-            file_data = export_files[0]
-            self.filename = file_data['name']
-            output.write(file_data['content'])
+            self.filename = first_file['name']
+            output.write(first_file['content'])
         else:
-            # compress all invoices into single archive file
-            output.write(compress(export_files).read())
+            # stream all invoices into single archive file
+            leading_files = [file for file in (first_file, second_file) if file is not None]
+            write_zip_archive(output, itertools.chain(leading_files, export_files))
@@ -0,0 +1,18 @@
+from outputs.mixins import ExporterMixin
+from outputs.models import Export
+
+from invoicing.exporters.mixins import InvoiceExporterQuerysetMixin
+from invoicing.models import Invoice
+
+
+class InvoiceProfit365ApiExporter(InvoiceExporterQuerysetMixin, ExporterMixin):
+    """
+    Tracks export of invoices to Profit365 API (``Export`` with ``ExportItem`` per invoice).
+    Invoices are sent by ``invoicing.exporters.profit365.tasks.send_invoices_to_profit365`` task.
+    """
+    # no file is generated, the format only has to be one of Export.FORMATS
+    export_format = Export.FORMAT_XML
+    export_context = Export.CONTEXT_LIST
+    output_type = Export.OUTPUT_TYPE_STREAM
+    model = Invoice
+    queryset = Invoice.objects.all()
@@ -8,117 +8,179 @@ from django.utils import translation
 from django.utils.translation import gettext_lazy as _
 
 from invoicing.exporters.mixins import InvoiceManagerMixin
+from invoicing.exporters.profit365.list import InvoiceProfit365ApiExporter
 from invoicing.models import Invoice
+from invoicing.utils import get_http_session, iter_concurrently
 
 logger = logging.getLogger(__name__)
 
 
 class Profit365Manager(InvoiceManagerMixin):
-    def export_via_api(self, request, queryset):
+    exporter_class = InvoiceProfit365ApiExporter
+    request_timeout = 30
+    chunk_size = 100
+
+    def export_via_api(self, request, queryset=None, exporter_params=None):
         if self.manager_settings.get('API_URL', None) in EMPTY_VALUES:
             raise EnvironmentError(_('Missing invoicing manager API url'), self.__class__.__name__)
 
         if self.manager_settings.get('API_DATA', None) in EMPTY_VALUES:
             raise EnvironmentError(_('Missing invoicing manager API data'), self.__class__.__name__)
 
-        results = []
+        from invoicing.exporters.profit365.tasks import send_invoices_to_profit365
+        export = self._execute_task_export(request, send_invoices_to_profit365, exporter_params, queryset)
+
+        if export is not None:
+            messages.info(request, _('Export of %d invoice(s) queued for Profit365 API processing') % export.total)
+
+    export_via_api.short_description = _('Export to Profit365 (API)')
+
+    def send_invoices(self, queryset):
+        """
+        Sends every invoice of the queryset to Profit365 as a separate request.
+
+        Returns list of results ``{'invoice', 'invoice_id', 'status_code', 'reason'}`` in order of completion.
+        """
+        return list(self.iter_results(queryset))
+
+    def iter_export_results(self, queryset):
+        """
+        Sends invoices and yields ``(invoice_id, invoice_number, success, detail)`` for the export task.
+        """
+        for r in self.iter_results(queryset):
+            if r['status_code'] is None:
+                detail = r['reason']
+            else:
+                detail = f"{r['status_code']} ({r['reason']})"
+
+            yield r['invoice_id'], r['invoice'], r['status_code'] == 200, detail
+
+    def iter_results(self, queryset):
+        """
+        Sends every invoice of the queryset to Profit365 as a separate request and yields results as they complete.
+
+        Requests are sent by pool of ``CONCURRENCY`` threads sharing one HTTP session,
+        each limited by ``TIMEOUT`` seconds. Payloads are built (and results collected)
+        in the calling thread, invoices are fetched in chunks with prefetched items.
+        """
+        concurrency = max(int(self.manager_settings.get('CONCURRENCY', 1)), 1)
+        url = f"{self.manager_settings['API_URL']}/sales/invoices"
+        headers = self.get_headers()
+        timeout = self.manager_settings.get('TIMEOUT', self.request_timeout)
+
+        def iter_payloads():
+            for invoice in queryset.prefetch_related('item_set').iterator(chunk_size=self.chunk_size):
+                payload = json.dumps(self.get_invoice_data(invoice))
+                logger.debug(f"Profit365: Created payload {payload} for invoice {invoice.number}")
+                yield invoice, payload
 
         logger.info(f"Sending {queryset.count()} invoices to Profit365 server (one invoice per request)")
-        for invoice in queryset:
-            with translation.override(invoice.language):
-                partnerAddress = [
-                    invoice.customer_name,
-                    invoice.customer_street,
-                    invoice.customer_zip,
-                    invoice.customer_city,
-                    invoice.get_customer_country_display()
-                ]
+        session = get_http_session(concurrency)
+
+        try:
+            responses = iter_concurrently(
+                lambda item: self.post_invoice(session, url, item[1], headers, timeout),
+                iter_payloads(),
+                max_workers=concurrency,
+            )
+
+            for (invoice, payload), (status_code, reason) in responses:
+                if status_code == 200:
+                    logger.info(f"Received success response for invoice {invoice.number}: {status_code}")
+                else:
+                    logger.error(f"Received error response for invoice {invoice.number}: {status_code} {reason}")
 
-                if invoice.customer_registration_id:
-                    partnerAddress += [
-                        '%s: %s' % (_('Reg. No.'), invoice.customer_registration_id),
-                    ]
-
-                if invoice.customer_tax_id:
-                    partnerAddress += [
-                        '%s: %s' % (_('Tax No.'), invoice.customer_tax_id),
-                    ]
-
-                if invoice.customer_vat_id:
-                    partnerAddress += [
-                        '%s: %s' % (_('VAT No.'), invoice.customer_vat_id),
-                    ]
-
-                invoice_data = {
-                    "recordNumber": invoice.number,
-                    "bankAccountId": self.manager_settings['API_DATA']['bankAccountId'],
-                    "partnerAddress": '\r\n'.join(partnerAddress),
-                    "phone": invoice.customer_phone,
-                    "email": invoice.customer_email,
-                    "dateCreated": invoice.date_issue.strftime('%Y-%m-%dT00:00:00'),
-                    "dateAccounting": invoice.date_tax_point.strftime('%Y-%m-%dT00:00:00'),
-                    "dateValidTo": invoice.date_due.strftime('%Y-%m-%dT00:00:00'),
-                    "symbolSpecific": invoice.specific_symbol,
-                    "symbolVariable": invoice.variable_symbol,
-                    "symbolConstant": invoice.constant_symbol,
-                    "localCurrencyID": invoice.currency,
-                    "currencyID": invoice.currency,
-                    "issuedBy": invoice.issuer_name,
-                    "rows": []
+                yield {
+                    'invoice': invoice.number,
+                    'invoice_id': invoice.id,
+                    'status_code': status_code,
+                    'reason': reason
                 }
+        finally:
+            session.close()
+
+    def post_invoice(self, session, url, payload, headers, timeout):
+        """
+        Posts single invoice payload. Runs in worker thread.
+
+        Returns tuple ``(status_code, reason)``, status code is None if request failed.
+        """
+        try:
+            r = session.post(url=url, data=payload, headers=headers, timeout=timeout)
+            return r.status_code, r.reason
+        except requests.exceptions.RequestException as e:
+            return None, str(e)
+
+    def get_headers(self):
+        api_data = self.manager_settings['API_DATA']
+        headers = {
+            'Authorization': api_data['Authorization'],
+            'ClientID': api_data['ClientID'],
+            'ClientSecret': api_data['ClientSecret'],
+            'Content-Type': 'application/json'
+        }
+        if 'CompanyID' in api_data:
+            headers['CompanyID'] = api_data['CompanyID']
+
+        return headers
+
+    def get_invoice_data(self, invoice):
+        with translation.override(invoice.language):
+            partnerAddress = [
+                invoice.customer_name,
+                invoice.customer_street,
+                invoice.customer_zip,
+                invoice.customer_city,
+                invoice.get_customer_country_display()
+            ]
+
+            if invoice.customer_registration_id:
+                partnerAddress += [
+                    '%s: %s' % (_('Reg. No.'), invoice.customer_registration_id),
+                ]
 
-                if invoice.status == Invoice.STATUS.CANCELED:
-                    invoice_data['description'] = 'STORNO'
-                    invoice_data['commentBelowItems'] = 'STORNO 2'
-                else:
-                    for item in invoice.item_set.all():
-                        item_data = {
-                            "name": item.title,
-                            "price": str(item.unit_price),
-                            "quantity": str(item.quantity)
-                        }
-
-                        if item.discount > 0:
-                            item_data['discountPercent'] = str(item.discount)
-
-                        invoice_data['rows'].append(item_data)
-
-            payload = json.dumps(invoice_data)
-
-            url = self.manager_settings['API_URL']
-            headers = {
-                'Authorization': self.manager_settings['API_DATA']['Authorization'],
-                'ClientID': self.manager_settings['API_DATA']['ClientID'],
-                'ClientSecret': self.manager_settings['API_DATA']['ClientSecret'],
-                'Content-Type': 'application/json'
-            }
-            if 'CompanyID' in self.manager_settings['API_DATA']:
-                headers['CompanyID'] = self.manager_settings['API_DATA']['CompanyID']
+            if invoice.customer_tax_id:
+                partnerAddress += [
+                    '%s: %s' % (_('Tax No.'), invoice.customer_tax_id),
+                ]
 
-            logger.debug(f"Profit365: Created payload {payload} for invoice {invoice.number}")
-            r = requests.post(url=f'{url}/sales/invoices', data=payload, headers=headers)
+            if invoice.customer_vat_id:
+                partnerAddress += [
+                    '%s: %s' % (_('VAT No.'), invoice.customer_vat_id),
+                ]
 
-            if r.status_code == 200:
-                logger.info(f"Received success response for invoice {invoice.number}: {r.status_code}")
-            else:
-                logger.error(f"Received error response for invoice {invoice.number}: {r.status_code} {r.reason}")
-
-            results.append({
-                'invoice': invoice.number,
-                'status_code': r.status_code,
-                'reason': r.reason
-            })
-
-        success_count = 0
-        for r in results:
-            if r['status_code'] == 200:
-                success_count += 1
+            invoice_data = {
+                "recordNumber": invoice.number,
+                "bankAccountId": self.manager_settings['API_DATA']['bankAccountId'],
+                "partnerAddress": '\r\n'.join(partnerAddress),
+                "phone": invoice.customer_phone,
+                "email": invoice.customer_email,
+                "dateCreated": invoice.date_issue.strftime('%Y-%m-%dT00:00:00'),
+                "dateAccounting": invoice.date_tax_point.strftime('%Y-%m-%dT00:00:00'),
+                "dateValidTo": invoice.date_due.strftime('%Y-%m-%dT00:00:00'),
+                "symbolSpecific": invoice.specific_symbol,
+                "symbolVariable": invoice.variable_symbol,
+                "symbolConstant": invoice.constant_symbol,
+                "localCurrencyID": invoice.currency,
+                "currencyID": invoice.currency,
+                "issuedBy": invoice.issuer_name,
+                "rows": []
+            }
+
+            if invoice.status == Invoice.STATUS.CANCELED:
+                invoice_data['description'] = 'STORNO'
+                invoice_data['commentBelowItems'] = 'STORNO 2'
             else:
-                messages.error(request, f"[{r['invoice']}]: {r['status_code']} ({r['reason']})")
+                for item in invoice.item_set.all():
+                    item_data = {
+                        "name": item.title,
+                        "price": str(item.unit_price),
+                        "quantity": str(item.quantity)
+                    }
 
-        if success_count > 0:
-            messages.success(request, _('%d invoices sent to Profit365 accounting software') % success_count)
+                    if item.discount > 0:
+                        item_data['discountPercent'] = str(item.discount)
 
-        return results
+                    invoice_data['rows'].append(item_data)
 
-    export_via_api.short_description = _('Export to Profit365 (API)')
+        return invoice_data
@@ -0,0 +1,11 @@
+from django.utils.translation import gettext_lazy as _
+from pragmatic.utils import get_task_decorator
+
+from invoicing.exporters.tasks import process_api_export
+
+task = get_task_decorator("exports")
+
+
+@task
+def send_invoices_to_profit365(export_id, manager):
+    process_api_export(export_id, manager.iter_export_results, _('Profit365 export of invoices'))
@@ -0,0 +1,86 @@
+import logging
+
+from django.core.mail import EmailMultiAlternatives
+from django.utils.translation import gettext_lazy as _
+from outputs.models import Export, ExportItem
+from outputs.signals import export_item_changed
+
+logger = logging.getLogger(__name__)
+
+
+def process_api_export(export_id, iter_results, title, links=None):
+    """
+    Runs export of invoices to an accounting API tracked by ``Export``.
+
+    ``iter_results(queryset)`` sends invoices of the export and yields
+    ``(invoice_id, invoice_number, success, detail)`` as they are processed.
+    Result of each invoice is recorded to its ``ExportItem`` right away
+    and a summary email (listing ``links``, if given) is sent to the creator of the export at the end.
+    """
+    export = Export.objects.get(id=export_id)
+    export.status = Export.STATUS_PROCESSING
+    export.save(update_fields=['status'])
+
+    exporter = export.exporter
+    succeeded = 0
+    failures = []
+    fatal_error = None
+
+    try:
+        for invoice_id, invoice_number, success, detail in iter_results(exporter.get_queryset()):
+            export_item_changed.send(
+                sender=exporter,
+                export_id=export.id,
+                content_type=export.content_type,
+                object_id=invoice_id,
+                result=ExportItem.RESULT_SUCCESS if success else ExportItem.RESULT_FAILURE,
+                detail=detail,
+            )
+
+            if success:
+                succeeded += 1
+            else:
+                failures.append((invoice_number, detail))
+
+    except Exception as e:
+        logger.exception(f"Fatal error during {title}: {e}")
+        fatal_error = str(e)
+    finally:
+        export.status = Export.STATUS_FAILED if fatal_error or failures else Export.STATUS_FINISHED
+        export.save(update_fields=['status'])
+        _send_mail_with_summary(export.creator, title, succeeded, failures, fatal_error, links)
+
+
+def _send_mail_with_summary(user, title, succeeded, failures, fatal_error=None, links=None):
+    creator_email = getattr(user, "email", None)
+
+    if not creator_email:
+        return
+
+    lines = [str(title), ""]
+
+    if fatal_error:
+        lines.extend([
+            str(_('Export failed with a fatal error:')),
+            f"  {fatal_error}",
+            "",
+        ])
+
+    lines.extend([
+        f"{_('Total invoices processed')}: {succeeded + len(failures)}",
+        f"{_('Successful')}: {succeeded}",
+        f"{_('Errors')}: {len(failures)}",
+    ])
+
+    if failures:
+        lines.extend(["", str(_('Error details:'))])
+
+        for invoice_number, detail in failures:
+            lines.append(f"• {invoice_number} - {' '.join(str(detail).split())}")
+
+    if links:
+        lines.extend(["", str(_('Documents:'))])
+        lines.extend(f"• {link}" for link in links)
+
+    message = EmailMultiAlternatives(subject=str(title), body="\n".join(lines), to=[creator_email])
+    message.send(fail_silently=False)
@@ -1,5 +1,6 @@
 from collections import OrderedDict
 
+from invoicing.exporters.mixins import InvoiceExporterQuerysetMixin
 from invoicing.models import Invoice
 
 from django.utils.translation import gettext_lazy as _, gettext
@@ -7,7 +8,7 @@ from django.utils.translation import gettext_lazy as _, gettext
 from outputs.mixins import ExcelExporterMixin
 
 
-class InvoiceXlsxListExporter(ExcelExporterMixin):
+class InvoiceXlsxListExporter(InvoiceExporterQuerysetMixin, ExcelExporterMixin):
     model = Invoice
     queryset = Invoice.objects.all()
     filename = _('invoices.xlsx')
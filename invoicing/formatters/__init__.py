@@ -1,6 +1,38 @@
+from django.db.models import prefetch_related_objects
+
+
 class InvoiceFormatter(object):
+    # MIME type of rendered content, None if unknown (content is detected by the PDF pipeline)
+    content_type = None
+
     def __init__(self, invoice):
         self.invoice = invoice
 
+    def get_data(self):
+        """
+        Returns render context. Items are loaded once and all values computed from them
+        are precomputed, so the number of queries doesn't depend on the number of items.
+        """
+        invoice = self.invoice
+        prefetch_related_objects([invoice], 'item_set')
+        has_discount = invoice.has_discount
+
+        return {
+            "invoice": invoice,
+            "items": invoice.get_prefetched_items(),
+            "vat_summary": invoice.vat_summary,
+            "subtotal": invoice.subtotal,
+            "has_discount": has_discount,
+            "discount": invoice.discount if has_discount else 0,
+            "total_before_discount": invoice.total_before_discount if has_discount else None,
+            "discount_percentage": invoice.discount_percentage if has_discount else None,
+        }
+
+    def get_content(self):
+        """
+        Returns rendered invoice as bytes.
+        """
+        return self.get_response().content
+
     def get_response(self):
         raise NotImplementedError()
@@ -6,24 +6,28 @@ from . import InvoiceFormatter
 
 class HTMLFormatter(InvoiceFormatter):
     template_name = 'invoicing/formatters/html.html'
+    content_type = 'text/html'
 
     def get_data(self):
-        return {
-            "invoice": self.invoice,
-            "INVOICING_DATE_FORMAT_TAG": "d.m.Y"  # TODO: move to settings
-        }
+        data = super().get_data()
+        data["INVOICING_DATE_FORMAT_TAG"] = "d.m.Y"  # TODO: move to settings
+        return data
 
-    def get_response(self, context={}):
+    def get_content(self, context={}):
+        return self.render(context).encode('utf-8')
+
+    def render(self, context={}):
         template = loader.get_template(self.template_name)
         data = self.get_data()
         data.update(context)
 
         try:
-            response_data = template.render(Context(data))
+            return template.render(Context(data))
         except TypeError:
-            response_data = template.render(data)
+            return template.render(data)
 
-        return HttpResponse(response_data)
+    def get_response(self, context={}):
+        return HttpResponse(self.render(context))
 
 
 class BootstrapHTMLFormatter(HTMLFormatter):
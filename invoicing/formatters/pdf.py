@@ -1,5 +1,279 @@
+import functools
+import io
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+from django.template.defaultfilters import date as date_format, floatformat
+from django.utils import translation
+from django.utils.translation import gettext as _
+
 from . import InvoiceFormatter
 
+logger = logging.getLogger(__name__)
+
+# font files looked up in FONT_DIRS unless INVOICING_PDF_FONT / INVOICING_PDF_FONT_BOLD is set
+DEFAULT_FONT = 'DejaVuSans.ttf'
+DEFAULT_FONT_BOLD = 'DejaVuSans-Bold.ttf'
+FONT_DIRS = (
+    '/usr/share/fonts',
+    '/usr/local/share/fonts',
+    '~/.local/share/fonts',
+    '~/.fonts',
+    '/Library/Fonts',
+    '~/Library/Fonts',
+    'C:\\Windows\\Fonts',
+)
+
+# drawn instead of characters missing in the font
+REPLACEMENT_CHARACTERS = ('\ufffd', '?')
+
+# fonts are registered globally by ReportLab, but formatters may run in worker threads
+_fonts_lock = threading.Lock()
+
+
+@functools.lru_cache()
+def find_font(file_name):
+    """
+    Returns path of font file found in ``FONT_DIRS`` (including subdirectories) or ``None``.
+    """
+    for font_dir in FONT_DIRS:
+        for root, dirs, files in os.walk(os.path.expanduser(font_dir)):
+            if file_name in files:
+                return os.path.join(root, file_name)
+
+    return None
+
+
+def get_font_paths():
+    """
+    Returns paths of regular and bold font used by ``PDFFormatter``.
+    Raises ``ImproperlyConfigured`` if any of them doesn't exist.
+    """
+    paths = []
+
+    for setting, default in (('INVOICING_PDF_FONT', DEFAULT_FONT), ('INVOICING_PDF_FONT_BOLD', DEFAULT_FONT_BOLD)):
+        path = getattr(settings, setting, None) or find_font(default)
+
+        if path is None or not os.path.isfile(path):
+            raise ImproperlyConfigured(
+                f'PDF font {path or default} not found. Install DejaVu fonts or set {setting} to path of TrueType font file.')
+
+        paths.append(path)
+
+    return paths
+
+
+def register_font(path):
+    """
+    Registers TrueType font file in ReportLab and returns its name.
+    """
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont, TTFError
+
+    name = os.path.splitext(os.path.basename(path))[0]
+
+    with _fonts_lock:
+        if name not in pdfmetrics.getRegisteredFontNames():
+            try:
+                pdfmetrics.registerFont(TTFont(name, path))
+            except (OSError, TTFError) as e:
+                raise ImproperlyConfigured(f'PDF font {path} can not be loaded: {e}')
+
+    return name
+
 
 class PDFFormatter(InvoiceFormatter):
-    pass
\ No newline at end of file
+    """
+    Renders invoice directly into PDF document by ReportLab, without HTML to PDF conversion.
+    Text is set in TrueType fonts ``INVOICING_PDF_FONT`` and ``INVOICING_PDF_FONT_BOLD``
+    (DejaVu Sans found in system font directories by default) embedded (subsetted) into the document
+    and wrapped to the width of its column.
+    """
+    content_type = 'application/pdf'
+    date_format = 'd.m.Y'
+
+    # A4 in points
+    page_width = 595
+    page_height = 842
+    margin = 40
+    column_gap = 5
+
+    # left edges of items table columns
+    columns = (40, 270, 345, 425, 470)
+
+    def get_response(self):
+        response = HttpResponse(self.get_content(), content_type=self.content_type)
+        response['Content-Disposition'] = f'inline; filename="{self.invoice}.pdf"'
+        return response
+
+    def get_content(self):
+        fonts = self.get_fonts()
+
+        with translation.override(self.invoice.language):
+            rows = self.get_rows(self.get_data())
+
+        return self.render(self.paginate(rows, fonts), fonts)
+
+    def get_fonts(self):
+        """
+        Returns names of registered regular and bold font.
+        """
+        return tuple(register_font(path) for path in get_font_paths())
+
+    def get_rows(self, data):
+        """
+        Returns document content as list of ``(font_size, bold, cells)`` rows
+        where cells are ``(x, text)`` pairs. Text of a cell is wrapped before the next cell
+        of the row, even if the next one is empty.
+        """
+        invoice = data['invoice']
+        currency = invoice.currency
+        left, right = self.columns[0], self.page_width // 2
+
+        def line(*cells, size=9, bold=False):
+            return size, bold, list(cells)
+
+        def money(value):
+            return f'{floatformat(value, 2)} {currency}'
+
+        rows = [
+            line((left, f'{invoice.get_type_display()} {invoice}'), size=16, bold=True),
+            line((left, invoice.subtitle or '')),
+            line(),
+            line((left, _('Supplier')), (right, _('Customer')), bold=True),
+            line((left, invoice.supplier_name), (right, invoice.customer_name)),
+            line((left, invoice.supplier_street), (right, invoice.customer_street)),
+            line(
+                (left, f'{invoice.supplier_zip or ""} {invoice.supplier_city or ""}'.strip()),
+                (right, f'{invoice.customer_zip or ""} {invoice.customer_city or ""}'.strip())
+            ),
+            line((left, invoice.get_supplier_country_display()), (right, invoice.get_customer_country_display())),
+            line(
+                (left, invoice.supplier_registration_id and f"{_('Reg. No.')}: {invoice.supplier_registration_id}"),
+                (right, invoice.customer_registration_id and f"{_('Reg. No.')}: {invoice.customer_registration_id}")
+            ),
+            line(
+                (left, invoice.supplier_tax_id and f"{_('Tax No.')}: {invoice.supplier_tax_id}"),
+                (right, invoice.customer_tax_id and f"{_('Tax No.')}: {invoice.customer_tax_id}")
+            ),
+            line(
+                (left, invoice.supplier_vat_id and f"{_('VAT No.')}: {invoice.supplier_vat_id}"),
+                (right, invoice.customer_vat_id and f"{_('VAT No.')}: {invoice.customer_vat_id}")
+            ),
+            line(),
+            line((left, f"{_('Issue date')}: {date_format(invoice.date_issue, self.date_format)}")),
+            line((left, f"{_('Time of supply')}: {date_format(invoice.date_tax_point, self.date_format)}")),
+            line((left, f"{_('Due date')}: {date_format(invoice.date_due, self.date_format)}")),
+            line((left, invoice.payment_method and f"{_('Payment method')}: {invoice.get_payment_method_display()}")),
+            line((left, invoice.bank_iban and f"{_('Bank IBAN code')}: {invoice.bank_iban}")),
+            line((left, invoice.bank_swift_bic and f"{_('SWIFT / BIC')}: {invoice.bank_swift_bic}")),
+            line((left, invoice.variable_symbol and f"{_('Variable symbol')}: {invoice.variable_symbol}")),
+            line(),
+        ]
+
+        description, quantity, unit_price, tax_rate, total = self.columns
+        rows.append(line(
+            (description, _('Description')), (quantity, _('Quantity')), (unit_price, _('Unit price')),
+            (tax_rate, _('Tax rate')), (total, _('Line total')), bold=True
+        ))
+
+        for item in data['items']:
+            title_lines = item.title.splitlines() or ['']
+            rows.append(line(
+                (description, title_lines[0]),
+                (quantity, f'{floatformat(item.quantity, -3)} {item.get_unit_display()}'),
+                (unit_price, money(item.unit_price)),
+                (tax_rate, f'{floatformat(item.tax_rate)} %' if item.tax_rate is not None else '-'),
+                (total, money(item.total)),
+            ))
+            rows.extend(line((description, title_line)) for title_line in title_lines[1:])
+
+        rows += [line(), line((tax_rate, _('Summary')), bold=True)]
+
+        for vat in data['vat_summary']:
+            rate = floatformat(vat['rate']) if vat['rate'] is not None else '-'
+            rows.append(line((left, f"{_('Tax rate')} {rate} %"), (unit_price, money(vat['base'])), (total, money(vat['vat']))))
+
+        if data['has_discount']:
+            rows.append(line((unit_price, _('total discount')), (total, money(data['discount']))))
+
+        if invoice.already_paid > 0:
+            rows.append(line((unit_price, _('Already paid')), (total, money(-invoice.already_paid))))
+
+        rows.append(line((unit_price, _('Total due')), (total, money(invoice.to_pay)), size=12, bold=True))
+
+        if invoice.note:
+            rows += [line(), line((left, _('Note')), bold=True)]
+            rows.extend(line((left, note_line)) for note_line in invoice.note.splitlines())
+
+        return rows
+
+    def paginate(self, rows, fonts):
+        """
+        Wraps cells of rows, splits them into pages and returns list of
+        ``(x, y, font_size, bold, text)`` text runs per page.
+        """
+        pages = [[]]
+        y = self.page_height - self.margin
+
+        for size, bold, cells in rows:
+            leading = size * 1.5
+            edges = [x for x, text in cells[1:]] + [self.page_width - self.margin]
+            cell_lines = [
+                (x, self.wrap(text, fonts[bold], size, right - x - self.column_gap))
+                for (x, text), right in zip(cells, edges)
+            ]
+
+            for index in range(max([len(lines) for x, lines in cell_lines], default=0) or 1):
+                if y - leading < self.margin:
+                    pages.append([])
+                    y = self.page_height - self.margin
+
+                y -= leading
+                pages[-1].extend((x, y, size, bold, lines[index]) for x, lines in cell_lines if index < len(lines))
+
+        return pages
+
+    def wrap(self, text, font, size, width):
+        """
+        Returns lines of text fitting into width. Characters missing in font are replaced
+        by replacement character and logged as warning, so the invoice is still rendered.
+        """
+        from reportlab.lib.utils import simpleSplit
+        from reportlab.pdfbase import pdfmetrics
+
+        if not text:
+            return []
+
+        text = str(text)
+        glyphs = pdfmetrics.getFont(font).face.charToGlyph
+        missing = sorted({character for character in text if not character.isspace() and ord(character) not in glyphs})
+
+        if missing:
+            replacement = next((character for character in REPLACEMENT_CHARACTERS if ord(character) in glyphs), '?')
+            logger.warning(
+                f'PDF font {font} has no glyphs for characters {"".join(missing)} of invoice {self.invoice}, '
+                f'they are replaced by {replacement}')
+            text = ''.join(replacement if character in missing else character for character in text)
+
+        return simpleSplit(text, font, size, width)
+
+    def render(self, pages, fonts):
+        from reportlab.pdfgen.canvas import Canvas
+
+        content = io.BytesIO()
+        canvas = Canvas(content, pagesize=(self.page_width, self.page_height), invariant=True)
+        canvas.setTitle(str(self.invoice))
+
+        for runs in pages:
+            for x, y, size, bold, text in runs:
+                canvas.setFont(fonts[bold], size)
+                canvas.drawString(x, y, text)
+            canvas.showPage()
+
+        canvas.save()
+        return content.getvalue()
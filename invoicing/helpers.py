@@ -1,18 +1,27 @@
+import re
+from functools import lru_cache
+
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from django.core.validators import EMPTY_VALUES
 from django.db import transaction
-from django.db.models import Max
-from django.template import Template, Context
+from django.template import Template, Context, defaultfilters
+from django.utils.formats import localize
+from django.utils.html import conditional_escape
+from django.utils.timezone import template_localtime
 from django.utils.translation import gettext_lazy as _
 
-from invoicing.models import Invoice
+from invoicing.models import Invoice, SequenceCounter
 
 
-def sequence_generator(type, important_date, number_prefix=None, counter_period=None, related_invoices=None, start_from=None):
+def sequence_generator(type, important_date, number_prefix=None, counter_period=None, related_invoices=None, start_from=None, count=None):
     """
     Returns next invoice sequence based on ``settings.INVOICING_COUNTER_PERIOD``.
 
+    If ``count`` is given, ``count`` consecutive sequences starting by the returned one are reserved:
+    the last of them is stored in ``SequenceCounter`` of the counter and next sequences follow it,
+    even before the reserved sequences are used by inserted invoices.
+
     .. warning::
 
         This is only used to prepopulate ``sequence`` field on saving new invoice.
@@ -24,45 +33,112 @@ def sequence_generator(type, important_date, number_prefix=None, counter_period=
 
     :return: string (generated next sequence)
     """
+    counter_key = get_counter_key(type, important_date, number_prefix, counter_period)
+
     with transaction.atomic():
         Invoice.objects.lock()
 
-        if not counter_period:
-            counter_period = getattr(settings, 'INVOICING_COUNTER_PERIOD', Invoice.COUNTER_PERIOD.YEARLY)
+        last_sequence = get_last_sequence(type, important_date, number_prefix, counter_period, related_invoices, start_from)
+        reserved_sequence = SequenceCounter.objects.filter(**counter_key).values_list('value', flat=True).first()
+        sequence = max(last_sequence, reserved_sequence or last_sequence) + 1
+
+        if count is not None:
+            SequenceCounter.objects.update_or_create(defaults={'value': sequence + count - 1}, **counter_key)
+
+        return sequence
+
+
+def counter_sequence_generator(type, important_date, number_prefix=None, counter_period=None, related_invoices=None, start_from=None, count=None):
+    """
+    Returns next invoice sequence using ``SequenceCounter`` table.
+    If ``count`` is given, the sequence is the first of ``count`` reserved consecutive sequences.
+
+    Unlike ``sequence_generator`` it doesn't lock whole invoice table, only the row of the counter
+    identified by period, type and number prefix. Missing counter is created and seeded
+    from existing invoices (``related_invoices`` are used for that only).
+
+    :return: int (generated next sequence)
+    """
+    counter_key = get_counter_key(type, important_date, number_prefix, counter_period)
+    count = count or 1
+
+    with transaction.atomic():
+        counter = SequenceCounter.objects.select_for_update().filter(**counter_key).first()
+
+        if counter is None:
+            last_sequence = get_last_sequence(type, important_date, number_prefix, counter_period, related_invoices, start_from)
+            counter, created = SequenceCounter.objects.select_for_update().get_or_create(
+                defaults={'value': last_sequence}, **counter_key)
+
+        counter.value += count
+        counter.save(update_fields=['value', 'modified'])
+
+        return counter.value - count + 1
+
+
+def get_last_sequence(type, important_date, number_prefix=None, counter_period=None, related_invoices=None, start_from=None):
+    """
+    Returns the highest sequence of invoices sharing the counter with given attributes
+    or ``start_from - 1`` if there are no such invoices.
+    """
+    if not counter_period:
+        counter_period = getattr(settings, 'INVOICING_COUNTER_PERIOD', Invoice.COUNTER_PERIOD.YEARLY)
+
+    if related_invoices is None:
+        related_invoices = Invoice.objects.all()
+
+    related_invoices = related_invoices.in_counter_period(important_date, counter_period)
+
+    if is_counter_per_type(type):
+        related_invoices = related_invoices.filter(type=type)
+
+    if number_prefix is not None:
+        related_invoices = related_invoices.filter(number__startswith=number_prefix)
+
+    start_from = start_from if start_from is not None else getattr(settings, 'INVOICING_NUMBER_START_FROM', 1)
+    return related_invoices.max_sequence() or start_from - 1
+
 
-        if related_invoices is None:
-            related_invoices = Invoice.objects.all()
+def is_counter_per_type(type):
+    invoice_counter_per_type = getattr(settings, 'INVOICING_COUNTER_PER_TYPE', False)
 
-        if counter_period == Invoice.COUNTER_PERIOD.DAILY:
-            related_invoices = related_invoices.filter(date_issue=important_date)
+    if invoice_counter_per_type:
+        if type in EMPTY_VALUES:
+            raise ValueError(_('Invoice type is required when INVOICING_COUNTER_PER_TYPE is enabled'))
+    elif type not in EMPTY_VALUES:
+        # TODO: log instead
+        print(_('Invoice type specified but INVOICING_COUNTER_PER_TYPE is disabled'))
 
-        elif counter_period == Invoice.COUNTER_PERIOD.YEARLY:
-            related_invoices = related_invoices.filter(date_issue__year=important_date.year)
+    return invoice_counter_per_type
 
-        elif counter_period == Invoice.COUNTER_PERIOD.MONTHLY:
-            related_invoices = related_invoices.filter(date_issue__year=important_date.year, date_issue__month=important_date.month)
 
-        elif counter_period != Invoice.COUNTER_PERIOD.INFINITE:
-            raise ImproperlyConfigured("INVOICING_COUNTER_PERIOD can be set only to these values: DAILY, MONTHLY, YEARLY, INFINITE.")
+def get_counter_key(type, important_date, number_prefix=None, counter_period=None):
+    """
+    Returns lookup of ``SequenceCounter`` shared by invoices with given attributes.
+    """
+    if not counter_period:
+        counter_period = getattr(settings, 'INVOICING_COUNTER_PERIOD', Invoice.COUNTER_PERIOD.YEARLY)
 
-        invoice_counter_per_type = getattr(settings, 'INVOICING_COUNTER_PER_TYPE', False)
+    if counter_period == Invoice.COUNTER_PERIOD.DAILY:
+        period = important_date.strftime('%Y-%m-%d')
 
-        if invoice_counter_per_type:
-            if type in EMPTY_VALUES:
-                raise ValueError(_('Invoice type is required when INVOICING_COUNTER_PER_TYPE is enabled'))
+    elif counter_period == Invoice.COUNTER_PERIOD.YEARLY:
+        period = important_date.strftime('%Y')
 
-            related_invoices = related_invoices.filter(type=type)
-        elif type not in EMPTY_VALUES:
-            # TODO: log instead
-            print(_('Invoice type specified but INVOICING_COUNTER_PER_TYPE is disabled'))
+    elif counter_period == Invoice.COUNTER_PERIOD.MONTHLY:
+        period = important_date.strftime('%Y-%m')
 
-        if number_prefix is not None:
-            related_invoices = related_invoices.filter(number__startswith=number_prefix)
+    elif counter_period == Invoice.COUNTER_PERIOD.INFINITE:
+        period = ''
 
-        start_from = start_from if start_from is not None else getattr(settings, 'INVOICING_NUMBER_START_FROM', 1)
-        last_sequence = related_invoices.aggregate(Max('sequence'))['sequence__max'] or start_from - 1
+    else:
+        raise ImproperlyConfigured("INVOICING_COUNTER_PERIOD can be set only to these values: DAILY, MONTHLY, YEARLY, INFINITE.")
 
-        return last_sequence + 1
+    return {
+        'period': period,
+        'type': type if is_counter_per_type(type) else '',
+        'number_prefix': number_prefix or ''
+    }
 
 
 def number_formatter(invoice):
@@ -71,6 +147,9 @@ def number_formatter(invoice):
     ``Invoice`` object is provided as ``invoice`` variable to the template, therefore all object fields
     can be used to generate number format.
 
+    Compiled templates are cached. Common formats consisting only of date parts and sequence
+    are rendered without template engine unless ``settings.INVOICING_NUMBER_FORMAT_FAST_PATH`` is disabled.
+
     .. warning::
 
         This is only used to prepopulate ``number`` field on saving new invoice.
@@ -84,5 +163,76 @@ def number_formatter(invoice):
     # specific invoice number format
     number_format = getattr(invoice, 'number_format', default_number_format)
 
+    if getattr(settings, 'INVOICING_NUMBER_FORMAT_FAST_PATH', True):
+        formatter = compile_number_format(number_format)
+
+        if formatter is not None:
+            return formatter(invoice)
+
     # render number by given format
-    return Template(number_format).render(Context({'invoice': invoice}))
+    return get_number_template(number_format).render(Context({'invoice': invoice}))
+
+
+@lru_cache(maxsize=128)
+def get_number_template(number_format):
+    return Template(number_format)
+
+
+# {{ invoice.<attribute> }} optionally followed by date or stringformat filter with quoted argument
+NUMBER_FORMAT_VARIABLE = re.compile(
+    r"{{\s*invoice\.(?P<attribute>\w+)(?:\|(?P<filter>\w+):(?P<quote>['\"])(?P<argument>[^'\"]*)(?P=quote))?\s*}}")
+
+NUMBER_FORMAT_DATE_ATTRIBUTES = ['date_issue', 'date_tax_point', 'date_due']
+
+
+@lru_cache(maxsize=128)
+def compile_number_format(number_format):
+    """
+    Compiles number format to Python function rendering the same number as the template would.
+    Supported are ``invoice.sequence`` (optionally with ``stringformat`` filter) and invoice dates
+    with ``date`` filter. Returns ``None`` for other formats.
+    """
+    parts = []
+    position = 0
+
+    for match in NUMBER_FORMAT_VARIABLE.finditer(number_format):
+        parts.append(number_format[position:match.start()])
+        position = match.end()
+
+        attribute, filter_name, argument = match.group('attribute', 'filter', 'argument')
+
+        if attribute == 'sequence' and filter_name in [None, 'stringformat']:
+            parts.append((attribute, filter_name, argument))
+        elif attribute in NUMBER_FORMAT_DATE_ATTRIBUTES and filter_name == 'date':
+            parts.append((attribute, filter_name, argument))
+        else:
+            return None
+
+    parts.append(number_format[position:])
+
+    for part in parts:
+        if isinstance(part, str) and any(tag in part for tag in ['{{', '}}', '{%', '%}', '{#', '#}']):
+            # other template syntax
+            return None
+
+    def format_number(invoice):
+        number = []
+
+        for part in parts:
+            if isinstance(part, str):
+                number.append(part)
+                continue
+
+            attribute, filter_name, argument = part
+            value = getattr(invoice, attribute)
+
+            if filter_name == 'date':
+                value = defaultfilters.date(template_localtime(value), argument)
+            elif filter_name == 'stringformat':
+                value = defaultfilters.stringformat(value, argument)
+
+            number.append(conditional_escape(localize(value)))
+
+        return ''.join(number)
+
+    return format_number
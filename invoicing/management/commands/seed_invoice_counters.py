@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from invoicing.helpers import get_counter_key
+from invoicing.models import Invoice, SequenceCounter
+
+
+class Command(BaseCommand):
+    help = 'Seeds sequence counters used by counter_sequence_generator from existing invoices.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--number-prefix', action='append', dest='number_prefixes', default=[],
+            help='Seed also counters of given number prefix (can be used multiple times).')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        counter_per_type = getattr(settings, 'INVOICING_COUNTER_PER_TYPE', False)
+        fields = ['date_issue', 'type'] if counter_per_type else ['date_issue']
+
+        for number_prefix in [None] + options['number_prefixes']:
+            invoices = Invoice.objects.all()
+
+            if number_prefix is not None:
+                invoices = invoices.filter(number__startswith=number_prefix)
+
+            # highest sequence of every counter
+            counters = {}
+            for row in invoices.order_by().values(*fields).annotate(last_sequence=Max('sequence')):
+                counter_key = get_counter_key(row.get('type'), row['date_issue'], number_prefix)
+                key = tuple(counter_key.values())
+                counters[key] = max(counters.get(key, row['last_sequence']), row['last_sequence'])
+
+            for (period, type, prefix), last_sequence in counters.items():
+                counter, created = SequenceCounter.objects.select_for_update().get_or_create(
+                    period=period, type=type, number_prefix=prefix,
+                    defaults={'value': last_sequence})
+
+                if not created and counter.value < last_sequence:
+                    counter.value = last_sequence
+                    counter.save(update_fields=['value', 'modified'])
+
+                self.stdout.write(f'{counter}')
+
+        self.stdout.write(self.style.SUCCESS('Sequence counters seeded.'))
@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+from invoicing.cache import get_pdf_cache
+from invoicing.models import Invoice
+from invoicing.utils import iter_invoices_in_pdf
+
+
+class Command(BaseCommand):
+    help = 'Renders PDFs of invoices missing in the PDF cache and evicts expired cached documents.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--status', action='append', dest='statuses', default=[],
+            help='Warm cache only for invoices of given status (can be used multiple times).')
+        parser.add_argument(
+            '--issued-since', dest='issued_since',
+            help='Warm cache only for invoices issued since given date (YYYY-MM-DD).')
+        parser.add_argument(
+            '--chunk-size', dest='chunk_size', type=int, default=500,
+            help='Number of invoices loaded from database at once.')
+
+    def handle(self, *args, **options):
+        pdf_cache = get_pdf_cache()
+
+        if pdf_cache is None:
+            raise CommandError('PDF cache is disabled (INVOICING_PDF_CACHE_ENABLED).')
+
+        invoices = Invoice.objects.order_by('pk')
+
+        if options['statuses']:
+            invoices = invoices.filter(status__in=options['statuses'])
+
+        if options['issued_since']:
+            invoices = invoices.filter(date_issue__gte=options['issued_since'])
+
+        formatter_class = import_string(getattr(settings, 'INVOICING_FORMATTER', 'invoicing.formatters.html.BootstrapHTMLFormatter'))
+        uncached_invoices = (
+            invoice for invoice in invoices.iterator(chunk_size=options['chunk_size'])
+            if not pdf_cache.has(invoice, formatter_class)
+        )
+
+        count = 0
+        for file in iter_invoices_in_pdf(uncached_invoices):
+            count += 1
+
+        deleted = pdf_cache.evict()
+
+        self.stdout.write(self.style.SUCCESS(f'PDF cache warmed for {count} invoices, {deleted} documents evicted.'))
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoicing', '0035_alter_item_quantity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SequenceCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(blank=True, help_text='YYYY-MM-DD, YYYY-MM, YYYY or empty according to counter period', max_length=10, verbose_name='period')),
+                ('type', models.CharField(blank=True, max_length=11, verbose_name='type')),
+                ('number_prefix', models.CharField(blank=True, max_length=128, verbose_name='number prefix')),
+                ('value', models.IntegerField(verbose_name='value')),
+                ('modified', models.DateTimeField(auto_now=True, verbose_name='modified')),
+            ],
+            options={
+                'verbose_name': 'sequence counter',
+                'verbose_name_plural': 'sequence counters',
+                'db_table': 'invoicing_sequence_counters',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='sequencecounter',
+            constraint=models.UniqueConstraint(fields=('period', 'type', 'number_prefix'), name='invoicing_sequence_counter_unique'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+import django.db.models.functions.datetime
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # indexes are built without blocking writes to invoices table
+    atomic = False
+
+    dependencies = [
+        ('invoicing', '0036_sequencecounter'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='invoice',
+            index=models.Index(fields=['date_issue', 'sequence'], name='invoicing_seq_day_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='invoice',
+            index=models.Index(django.db.models.functions.datetime.ExtractYear('date_issue'), django.db.models.functions.datetime.ExtractMonth('date_issue'), models.F('sequence'), name='invoicing_seq_month_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='invoice',
+            index=models.Index(django.db.models.functions.datetime.ExtractYear('date_issue'), models.F('sequence'), name='invoicing_seq_year_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='invoice',
+            index=models.Index(fields=['type', 'date_issue', 'sequence'], name='invoicing_seq_type_day_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='invoice',
+            index=models.Index(models.F('type'), django.db.models.functions.datetime.ExtractYear('date_issue'), django.db.models.functions.datetime.ExtractMonth('date_issue'), models.F('sequence'), name='invoicing_seq_type_month_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='invoice',
+            index=models.Index(models.F('type'), django.db.models.functions.datetime.ExtractYear('date_issue'), models.F('sequence'), name='invoicing_seq_type_year_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='invoice',
+            index=models.Index(fields=['type', 'sequence'], name='invoicing_seq_type_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # indexes are built without blocking writes to invoices table
+    atomic = False
+
+    dependencies = [
+        ('invoicing', '0037_invoice_sequence_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='invoice',
+            index=models.Index(condition=models.Q(('status__in', ['PAID', 'CANCELED', 'CREDITED']), ('total', 0), _connector='OR', _negated=True), fields=['date_due'], name='invoicing_unpaid_due_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='invoice',
+            index=models.Index(fields=['status'], name='invoicing_status_idx'),
+        ),
+    ]
@@ -1,12 +1,15 @@
 from __future__ import division  # TODO: refactor
 
-from decimal import Decimal
+import threading
+from contextlib import contextmanager
+from decimal import Decimal, ROUND_HALF_UP
 
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericRelation
 from django.core.validators import EMPTY_VALUES, MaxValueValidator, MinValueValidator
 from django.db import models, transaction
-from django.db.models import JSONField, Max, Sum
+from django.db.models import JSONField, Q
+from django.db.models.functions import ExtractMonth, ExtractYear
 from django.urls import reverse
 from django.utils.timezone import now
 from django.utils.functional import cached_property
@@ -17,16 +20,20 @@ from django_countries.fields import CountryField
 from djmoney.forms.widgets import CURRENCY_CHOICES
 from internationalflavor.vat_number import VATNumberField
 from localflavor.generic.models import IBANField, BICField
-from model_utils import Choices
+from model_utils import Choices, FieldTracker
 from model_utils.fields import MonitorField
 
 from invoicing import settings as invoicing_settings
-from invoicing.querysets import InvoiceQuerySet, ItemQuerySet
+from invoicing.querysets import InvoiceQuerySet, ItemQuerySet, get_item_aggregates
 from invoicing.taxation import TaxationPolicy
 from invoicing.taxation.eu import EUTaxationPolicy
 from invoicing.utils import deprecated
 
 
+# invoices waiting for recalculation inside Invoice.deferred_recalculation() block (per thread)
+_deferred_recalculation = threading.local()
+
+
 def default_supplier(attribute_lookup):
     supplier = getattr(settings, 'INVOICING_SUPPLIER', None)
 
@@ -218,6 +225,13 @@ class Invoice(models.Model):
     created = models.DateTimeField(_(u'created'), auto_now_add=True)
     modified = models.DateTimeField(_(u'modified'), auto_now=True)
     objects = InvoiceQuerySet.as_manager()
+    tracker = FieldTracker(fields=['credit'])
+
+    # memoized result of vat_summary
+    _vat_summary = None
+
+    # set by save() for recalculate_total_by_invoice signal
+    _recalculate_totals = False
 
     class Meta:
         db_table = 'invoicing_invoices'
@@ -225,6 +239,21 @@ class Invoice(models.Model):
         verbose_name_plural = _(u'invoices')
         ordering = ('date_issue', 'sequence')
         default_permissions = ('list', 'view', 'add', 'change', 'delete')
+        indexes = [
+            # sequence lookups of every counter period (see InvoiceQuerySet.in_counter_period)
+            models.Index(fields=['date_issue', 'sequence'], name='invoicing_seq_day_idx'),
+            models.Index(ExtractYear('date_issue'), ExtractMonth('date_issue'), 'sequence', name='invoicing_seq_month_idx'),
+            models.Index(ExtractYear('date_issue'), 'sequence', name='invoicing_seq_year_idx'),
+            # the same with INVOICING_COUNTER_PER_TYPE
+            models.Index(fields=['type', 'date_issue', 'sequence'], name='invoicing_seq_type_day_idx'),
+            models.Index('type', ExtractYear('date_issue'), ExtractMonth('date_issue'), 'sequence', name='invoicing_seq_type_month_idx'),
+            models.Index('type', ExtractYear('date_issue'), 'sequence', name='invoicing_seq_type_year_idx'),
+            models.Index(fields=['type', 'sequence'], name='invoicing_seq_type_idx'),
+            # unpaid and overdue invoices (see InvoiceQuerySet.unpaid and InvoiceQuerySet.overdue)
+            models.Index(fields=['date_due'], name='invoicing_unpaid_due_idx',
+                         condition=~(Q(status__in=['PAID', 'CANCELED', 'CREDITED']) | Q(total=0))),
+            models.Index(fields=['status'], name='invoicing_status_idx'),
+        ]
 
     def __str__(self):
         return self.number
@@ -233,7 +262,11 @@ class Invoice(models.Model):
         return self.number
 
     @transaction.atomic
-    def save(self, **kwargs):
+    def save(self, recalculate_totals=False, **kwargs):
+        """
+        Saves invoice. Totals are recalculated only if they can change (new invoice, changed credit,
+        ``total`` or ``vat`` in ``update_fields``) or if explicitly requested by ``recalculate_totals``.
+        """
         if self.sequence in EMPTY_VALUES:
             self.sequence = Invoice.get_next_sequence(
                 type=self.type,
@@ -243,7 +276,34 @@ class Invoice(models.Model):
         if self.number in EMPTY_VALUES:
             self.number = self._get_number()
 
-        return super(Invoice, self).save(**kwargs)
+        update_fields = kwargs.get('update_fields')
+        self._recalculate_totals = recalculate_totals or self._is_totals_recalculation_needed(update_fields)
+
+        if self._recalculate_totals and update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'total', 'vat'}
+
+        if kwargs.get('update_fields'):
+            # modified timestamp identifies cached documents of invoice
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'modified'}
+
+        try:
+            return super(Invoice, self).save(**kwargs)
+        finally:
+            self._recalculate_totals = False
+
+    def _is_totals_recalculation_needed(self, update_fields=None):
+        if update_fields is not None:
+            return bool({'total', 'vat', 'credit'} & set(update_fields))
+
+        if self._state.adding or self.pk is None:
+            # there are no items yet, so it is cheap
+            return True
+
+        return self.tracker.has_changed('credit')
+
+    def refresh_from_db(self, *args, **kwargs):
+        self.invalidate_vat_summary()
+        return super(Invoice, self).refresh_from_db(*args, **kwargs)
 
     def get_absolute_url(self):
         return getattr(settings, 'INVOICING_INVOICE_ABSOLUTE_URL',
@@ -251,21 +311,26 @@ class Invoice(models.Model):
         )(self)
 
     @staticmethod
-    def get_next_sequence(type, important_date, number_prefix=None, related_invoices=None, generator=None):
+    def get_next_sequence(type, important_date, number_prefix=None, related_invoices=None, generator=None, count=None):
         """
         Returns next invoice sequence based on ``settings.INVOICING_SEQUENCE_GENERATOR``.
+        If ``count`` is given, reserves ``count`` consecutive sequences and returns the first of them
+        (the generator has to support ``count`` argument).
         """
 
         if not generator:
             generator = getattr(settings, 'INVOICING_SEQUENCE_GENERATOR', 'invoicing.helpers.sequence_generator')
             generator = import_string(generator)
 
+        kwargs = {'count': count} if count is not None else {}
+
         return generator(
             type=type,
             important_date=important_date,
             number_prefix=number_prefix,
             counter_period=None,
-            related_invoices=related_invoices
+            related_invoices=related_invoices,
+            **kwargs
         )
 
     def _get_number(self):
@@ -398,56 +463,141 @@ class Invoice(models.Model):
         return EUTaxationPolicy.is_in_EU(self.customer_country.code) if self.customer_country else False
 
     def is_reverse_charge(self):
-        if self.item_set.exists() and not self.item_set.filter(tax_rate=None).exists():
+        items = self.get_prefetched_items()
+
+        if items is not None:
+            if items and all(item.tax_rate is not None for item in items):
+                return False
+
+        elif self.item_set.exists() and not self.item_set.filter(tax_rate=None).exists():
             return False
 
         return self.taxation_policy.is_reverse_charge(self.supplier_vat_id, self.customer_vat_id)
 
     @property
     def vat_summary(self):
+        """
+        Returns VAT breakdown by tax rate. The result is memoized per instance,
+        use ``invalidate_vat_summary()`` after changing items.
+        """
+        if self._vat_summary is None:
+            self._vat_summary = self._get_vat_summary()
+
+        return self._vat_summary
+
+    def _get_vat_summary(self, use_prefetched_items=True):
         # rates_and_sum = self.item_set.all().annotate(base=Sum(F('qty')*F('price_per_unit'))).values('tax_rate', 'base')
         # rates_and_sum = self.item_set.all().values('tax_rate').annotate(Sum('price_per_unit'))
         # rates_and_sum = self.item_set.all().values('tax_rate').annotate(Sum(F('qty')*F('price_per_unit')))
 
+        if self.pk is None:
+            # unsaved invoice can't have any items
+            return []
+
+        items = self.get_prefetched_items() if use_prefetched_items else None
+
+        if items is not None:
+            return self._get_vat_summary_from_items(items)
+
         from django.db import connection
-        cursor = connection.cursor()
-        cursor.execute('select tax_rate as rate, SUM(quantity*unit_price*(100-discount)/100) as base, ROUND(CAST(SUM(quantity*unit_price*((100-discount)/100)*(tax_rate/100)) AS numeric), 2) as vat from invoicing_items where invoice_id = %s group by tax_rate;', [self.pk])
+        with connection.cursor() as cursor:
+            cursor.execute('select tax_rate as rate, SUM(quantity*unit_price*(100-discount)/100) as base, ROUND(CAST(SUM(quantity*unit_price*((100-discount)/100)*(tax_rate/100)) AS numeric), 2) as vat from invoicing_items where invoice_id = %s group by tax_rate;', [self.pk])
 
-        desc = cursor.description
-        return [
-            dict(zip([col[0] for col in desc], row))
-            for row in cursor.fetchall()
-        ]
+            desc = cursor.description
+            return [
+                dict(zip([col[0] for col in desc], row))
+                for row in cursor.fetchall()
+            ]
+
+    @staticmethod
+    def _get_vat_summary_from_items(items):
+        """
+        Computes VAT breakdown from loaded items the same way as SQL query in ``_get_vat_summary()``.
+        """
+        summary = {}
+
+        for item in items:
+            base = item.quantity * item.unit_price * (100 - item.discount) / 100
+            rate_summary = summary.setdefault(item.tax_rate, {'rate': item.tax_rate, 'base': Decimal(0), 'vat': Decimal(0)})
+            rate_summary['base'] += base
+
+            if item.tax_rate is not None:
+                rate_summary['vat'] += base * item.tax_rate / 100
+
+        for rate_summary in summary.values():
+            if rate_summary['rate'] is None:
+                rate_summary['vat'] = None
+            else:
+                rate_summary['vat'] = rate_summary['vat'].quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+        return list(summary.values())
+
+    def invalidate_vat_summary(self):
+        self._vat_summary = None
+
+    @cached_property
+    def item_aggregates(self):
+        """
+        Returns aggregated values of invoice items. Uses values annotated by
+        ``InvoiceQuerySet.with_item_aggregates()`` or prefetched ``item_set`` if available,
+        otherwise runs single aggregate query.
+        """
+        aggregates = get_item_aggregates()
+
+        if all(key in self.__dict__ for key in aggregates):
+            return {key: self.__dict__[key] for key in aggregates}
+
+        items = self.get_prefetched_items()
+
+        if items is None:
+            return self.item_set.order_by().aggregate(**aggregates)
+
+        quantities = [item.quantity for item in items]
+        discounts = [item.discount for item in items]
+
+        return {
+            'item_count': len(items),
+            'item_sum_quantity': sum(quantities) if items else None,
+            'item_max_quantity': max(quantities, default=None),
+            'item_max_discount': max(discounts, default=None),
+            'item_min_discount': min(discounts, default=None),
+            'item_unit_count': len([item for item in items if item.unit != Item.UNIT_EMPTY]),
+        }
+
+    def get_prefetched_items(self):
+        """
+        Returns list of items if ``item_set`` is prefetched, otherwise ``None``.
+        """
+        if 'item_set' not in getattr(self, '_prefetched_objects_cache', {}):
+            return None
+
+        return list(self.item_set.all())
 
     @cached_property
     def has_discount(self):
-        if not self.item_set.exists():
+        max_discount = self.item_aggregates['item_max_discount']
+        min_discount = self.item_aggregates['item_min_discount']
+
+        if max_discount is None:
             return False
 
-        discounts = list(set(self.item_set.values_list('discount', flat=True)))
-        return len(discounts) > 1 or discounts[0] > 0
+        return max_discount > 0 or min_discount != max_discount
 
     @cached_property
     def has_unit(self):
-        if not self.item_set.exists():
-            return False
-
-        units = list(set(self.item_set.values_list('unit', flat=True)))
-        return len(units) > 1 or units[0] != Item.UNIT_EMPTY
+        return self.item_aggregates['item_unit_count'] > 0
 
     @cached_property
     def max_quantity(self):
-        quantity = self.item_set.aggregate(Max('quantity'))
-        return quantity.get('quantity__max', 1) if quantity else 0
+        return self.item_aggregates['item_max_quantity']
 
     @cached_property
     def sum_quantity(self):
-        quantity = self.item_set.aggregate(Sum('quantity'))
-        return quantity.get('quantity__sum') or 0 if quantity else 0
+        return self.item_aggregates['item_sum_quantity'] or 0
 
     @cached_property
     def all_items_with_single_quantity(self):
-        return self.item_set.count() == self.sum_quantity
+        return self.item_aggregates['item_count'] == self.sum_quantity
 
     @property
     def subtotal(self):
@@ -485,11 +635,13 @@ class Invoice(models.Model):
         return self.total - self.already_paid
 
     def calculate_vat(self):
-        if len(self.vat_summary) == 1 and self.vat_summary[0]['vat'] is None:
+        vat_summary = self.vat_summary
+
+        if len(vat_summary) == 1 and vat_summary[0]['vat'] is None:
             return None
 
         vat = 0
-        for vat_rate in self.vat_summary:
+        for vat_rate in vat_summary:
             vat += vat_rate['vat'] or 0
         return vat
 
@@ -502,10 +654,80 @@ class Invoice(models.Model):
         total -= Decimal(self.credit)  # subtract credit
         return round(total, 2)
 
+    def recalculate_totals(self):
+        """
+        Recalculates ``total`` and ``vat`` from invoice items and stores them.
+        """
+        # totals are calculated from fresh summary by pre_save signal
+        self.save(update_fields=['total', 'vat'], recalculate_totals=True)
+
+    @classmethod
+    @contextmanager
+    def deferred_recalculation(cls):
+        """
+        Defers recalculation of invoice totals triggered by saved or deleted items.
+
+        Every touched invoice is recalculated only once, when the outermost block exits.
+        The whole block runs in a single transaction.
+        """
+        if getattr(_deferred_recalculation, 'invoices', None) is not None:
+            # nested block, invoices are recalculated by the outermost one
+            yield
+            return
+
+        _deferred_recalculation.invoices = {}
+
+        try:
+            with transaction.atomic():
+                yield
+
+                invoices = list(_deferred_recalculation.invoices.values())
+                _deferred_recalculation.invoices = None
+
+                # skip invoices deleted within the block
+                existing = set(cls.objects.filter(pk__in=[invoice.pk for invoice in invoices]).values_list('pk', flat=True))
+
+                for invoice in invoices:
+                    if invoice.pk in existing:
+                        invoice.recalculate_totals()
+        finally:
+            _deferred_recalculation.invoices = None
+
+    @staticmethod
+    def defer_recalculation(invoice):
+        """
+        Registers invoice for recalculation at the end of ``deferred_recalculation()`` block.
+        Returns ``False`` if there is no such block active.
+        """
+        invoices = getattr(_deferred_recalculation, 'invoices', None)
+
+        if invoices is None:
+            return False
+
+        invoices.setdefault(invoice.pk, invoice)
+        return True
+
+    def bulk_create_items(self, items, batch_size=None):
+        """
+        Creates invoice items by single ``bulk_create()`` and recalculates totals only once.
+        """
+        items = list(items)
+
+        for item in items:
+            item.invoice = self
+            item.check_tax_rate()
+
+        with transaction.atomic():
+            items = Item.objects.bulk_create(items, batch_size=batch_size)
+            self.recalculate_totals()
+
+        return items
+
     def recalculate_tax(self):
-        for item in self.item_set.all():
-            item.calculate_tax()
-            item.save()
+        with Invoice.deferred_recalculation():
+            for item in self.item_set.all():
+                item.calculate_tax()
+                item.save()
 
     def create_copy(self, **kwargs):
         # prepare new instance data
@@ -535,10 +757,11 @@ class Invoice(models.Model):
         new_instance.related_invoices.set([self])
 
         # duplicate items
-        for item in self.item_set.all():
-            item_kwargs = model_to_dict(item, exclude=['id', 'invoice'])
-            item_kwargs.update({'invoice': new_instance})
-            Item.objects.create(**item_kwargs)
+        with Invoice.deferred_recalculation():
+            for item in self.item_set.all():
+                item_kwargs = model_to_dict(item, exclude=['id', 'invoice'])
+                item_kwargs.update({'invoice': new_instance})
+                Item.objects.create(**item_kwargs)
 
         # return copied invoice
         return new_instance
@@ -622,11 +845,14 @@ class Item(models.Model):
     def calculate_tax(self):
         self.tax_rate = self.invoice.get_tax_rate()
 
-    def save(self, **kwargs):
+    def check_tax_rate(self):
         # TODO: move to validator
         if self.tax_rate not in EMPTY_VALUES and self.invoice.supplier_vat_id in EMPTY_VALUES:
             raise ValueError(f'Tax rate is {self.tax_rate}% but supplier VAT ID is not set. Invoice #{self.invoice.pk}, number {self.invoice.number}')
 
+    def save(self, **kwargs):
+        self.check_tax_rate()
+
         # TODO: find out if user explicitly set None as value or should be set automatically
         # self.calculate_tax()
         # if self.tax_rate in EMPTY_VALUES and self.pk is None:
@@ -635,4 +861,29 @@ class Item(models.Model):
 
         return super(Item, self).save(**kwargs)
 
+
+class SequenceCounter(models.Model):
+    """
+    Last sequence allocated to invoices sharing the counter
+    (see ``invoicing.helpers.counter_sequence_generator``).
+    """
+    period = models.CharField(_(u'period'), max_length=10, blank=True,
+        help_text=_(u'YYYY-MM-DD, YYYY-MM, YYYY or empty according to counter period'))
+    type = models.CharField(_(u'type'), max_length=11, blank=True)
+    number_prefix = models.CharField(_(u'number prefix'), max_length=128, blank=True)
+    value = models.IntegerField(_(u'value'))
+    modified = models.DateTimeField(_(u'modified'), auto_now=True)
+
+    class Meta:
+        db_table = 'invoicing_sequence_counters'
+        verbose_name = _(u'sequence counter')
+        verbose_name_plural = _(u'sequence counters')
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'type', 'number_prefix'], name='invoicing_sequence_counter_unique')
+        ]
+
+    def __str__(self):
+        return f'{self.period}/{self.type}/{self.number_prefix}: {self.value}'
+
+
 from .signals import *
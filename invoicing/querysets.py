@@ -1,12 +1,32 @@
 import datetime
 
-from django.db import connection
-from django.db.models import Q, Count
+from django.core.exceptions import ImproperlyConfigured
+from django.core.validators import EMPTY_VALUES
+from django.db import connection, transaction
+from django.db.models import Q, Count, Max, Min, Sum, Case, When, Value, F, OuterRef, Subquery, BooleanField, DateField, DurationField, ExpressionWrapper, IntegerField
+from django.db.models.functions import Cast, Coalesce, ExtractDay, ExtractMonth, ExtractYear
+from django.db.models.lookups import Exact
 from django.db.models.query import QuerySet
+from django.db.transaction import TransactionManagementError
 from django.db.utils import OperationalError
 from django.utils.timezone import now
 
 
+def get_item_aggregates(prefix=''):
+    """
+    Returns aggregates of invoice items used by ``Invoice.item_aggregates``.
+    Use ``prefix='item__'`` to aggregate items of invoices.
+    """
+    return {
+        'item_count': Count(f'{prefix}pk'),
+        'item_sum_quantity': Sum(f'{prefix}quantity'),
+        'item_max_quantity': Max(f'{prefix}quantity'),
+        'item_max_discount': Max(f'{prefix}discount'),
+        'item_min_discount': Min(f'{prefix}discount'),
+        'item_unit_count': Count(f'{prefix}pk', filter=~Q(**{f'{prefix}unit': 'EMPTY'})),
+    }
+
+
 class InvoiceQuerySet(QuerySet):
     def overdue(self):
         return self.unpaid() \
@@ -16,6 +36,44 @@ class InvoiceQuerySet(QuerySet):
     def not_overdue(self):
         return self.filter(Q(date_due__gt=datetime.datetime.combine(now().date(), datetime.time.max)) | Q(status__in=[self.model.STATUS.PAID, self.model.STATUS.CANCELED, self.model.STATUS.CREDITED]))
 
+    def annotate_overdue(self):
+        """
+        Annotates ``annotated_is_overdue`` and ``annotated_overdue_days`` computed in SQL
+        the same way as ``Invoice.is_overdue`` and ``Invoice.overdue_days`` properties.
+        """
+        today = now().date()
+
+        return self.annotate(
+            annotated_is_overdue=Case(
+                When(Q(total=0) | Q(status__in=[self.model.STATUS.PAID, self.model.STATUS.CANCELED, self.model.STATUS.CREDITED]) | Q(type=self.model.TYPE.CREDIT_NOTE), then=Value(False)),
+                When(date_due__lt=today, then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField()
+            ),
+            annotated_overdue_days=Cast(ExtractDay(
+                ExpressionWrapper(Value(today, output_field=DateField()) - F('date_due'), output_field=DurationField())
+            ), output_field=IntegerField())
+        )
+
+    def with_item_aggregates(self):
+        """
+        Annotates aggregates of invoice items, so ``has_discount``, ``has_unit``, ``max_quantity``,
+        ``sum_quantity`` and ``all_items_with_single_quantity`` of every invoice don't query items.
+        Aggregates are computed by subqueries, so they aren't multiplied by other joins.
+        """
+        items = self.model.item_set.field.model.objects \
+            .filter(invoice=OuterRef('pk')) \
+            .order_by() \
+            .values('invoice')
+        annotations = {}
+
+        for name, aggregate in get_item_aggregates().items():
+            subquery = Subquery(items.annotate(value=aggregate).values('value'))
+            # invoice without items has no row to count
+            annotations[name] = Coalesce(subquery, 0) if isinstance(aggregate, Count) else subquery
+
+        return self.annotate(**annotations)
+
     def paid(self):
         return self.filter(status=self.model.STATUS.PAID)
 
@@ -60,6 +118,99 @@ class InvoiceQuerySet(QuerySet):
     def issued(self):
         return self.filter(origin=self.model.ORIGIN.ISSUED)
 
+    def in_counter_period(self, important_date, counter_period):
+        """
+        Returns invoices issued in the same counter period as ``important_date``.
+        Lookups match expressions of the sequence indexes of ``Invoice`` model.
+        """
+        if counter_period == self.model.COUNTER_PERIOD.DAILY:
+            return self.filter(date_issue=important_date)
+
+        if counter_period == self.model.COUNTER_PERIOD.YEARLY:
+            return self.filter(Exact(ExtractYear('date_issue'), important_date.year))
+
+        if counter_period == self.model.COUNTER_PERIOD.MONTHLY:
+            return self.filter(
+                Exact(ExtractYear('date_issue'), important_date.year),
+                Exact(ExtractMonth('date_issue'), important_date.month))
+
+        if counter_period == self.model.COUNTER_PERIOD.INFINITE:
+            return self
+
+        raise ImproperlyConfigured("INVOICING_COUNTER_PERIOD can be set only to these values: DAILY, MONTHLY, YEARLY, INFINITE.")
+
+    def max_sequence(self):
+        """
+        Returns the highest sequence of invoices. Filtered by ``in_counter_period()``
+        (and ``type``) it is resolved from the end of matching index without scanning the period.
+        """
+        return self.order_by().aggregate(Max('sequence'))['sequence__max']
+
+    def reserve_sequences(self, count, type, important_date, number_prefix=None, generator=None):
+        """
+        Reserves ``count`` consecutive sequences of the counter given by ``type``, ``important_date``
+        and ``number_prefix`` at once and returns them as ``range``.
+
+        Reserved sequences are stored in ``SequenceCounter``, so following reservations and saved
+        invoices get sequences after them. It has to be called within ``transaction.atomic()`` block,
+        so rolled back reservation doesn't leave a gap in the sequence.
+        """
+        if not transaction.get_connection(self.db).in_atomic_block:
+            raise TransactionManagementError('Sequences can be reserved only inside an atomic block.')
+
+        first = self.model.get_next_sequence(
+            type=type,
+            important_date=important_date,
+            number_prefix=number_prefix,
+            generator=generator,
+            count=count)
+
+        return range(first, first + count)
+
+    def bulk_issue(self, invoices, batch_size=None):
+        """
+        Assigns sequence and number to new invoices and inserts them by ``bulk_create()``.
+        Sequences are reserved by ``reserve_sequences()`` once per group of invoices
+        with the same type, issue date, number prefix and sequence generator.
+
+        .. note::
+
+            Like ``bulk_create()``, it doesn't call ``save()`` nor send any signals.
+        """
+        invoices = list(invoices)
+        groups = {}
+
+        for invoice in invoices:
+            key = None
+
+            if invoice.sequence in EMPTY_VALUES:
+                key = (invoice.type, invoice.date_issue, getattr(invoice, 'number_prefix', None), getattr(invoice, 'sequence_generator', None))
+
+            groups.setdefault(key, []).append(invoice)
+
+        with transaction.atomic():
+            # every group is inserted before reserving sequences of the next one,
+            # so generators aggregating existing invoices take them into account
+            for key, group in groups.items():
+                if key is not None:
+                    type, important_date, number_prefix, generator = key
+                    sequences = self.reserve_sequences(len(group), type, important_date, number_prefix, generator)
+
+                    for invoice, sequence in zip(group, sequences):
+                        invoice.sequence = sequence
+
+                for invoice in group:
+                    if invoice.number in EMPTY_VALUES:
+                        invoice.number = invoice._get_number()
+
+                    # new invoices don't have any items yet
+                    invoice.total = invoice.calculate_total()
+                    invoice.vat = invoice.calculate_vat()
+
+                self.bulk_create(group, batch_size=batch_size)
+
+        return invoices
+
     def lock(self):
         """Lock the model table for atomic updates.
 
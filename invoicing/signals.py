@@ -11,14 +11,27 @@ logger = logging.getLogger(__name__)
 @receiver(post_delete, sender=Item)
 def recalculate_total_by_items(instance, **kwargs):
     invoice = instance.invoice
-    invoice.total = invoice.calculate_total()
-    invoice.vat = invoice.calculate_vat()
-    # with temporary_disconnect_signal(signal=post_save, receiver=recalculate_total_by_invoice, sender=Invoice):
-    invoice.save(update_fields=['total', 'vat'])
+    invoice.invalidate_vat_summary()
+    # prefetched items don't reflect the change
+    getattr(invoice, '_prefetched_objects_cache', {}).pop('item_set', None)
+
+    if Invoice.defer_recalculation(invoice):
+        # recalculated at the end of Invoice.deferred_recalculation() block
+        return
+
+    invoice.recalculate_totals()
 
 
 @receiver(pre_save, sender=Invoice)
 def recalculate_total_by_invoice(instance, **kwargs):
     invoice = instance
+
+    if not invoice._recalculate_totals:
+        # totals can't change (e.g. status update)
+        return
+
+    # stored totals are always aggregated in SQL: memoized summary and prefetched items
+    # could be outdated by items changed through other instances or queryset updates
+    invoice._vat_summary = invoice._get_vat_summary(use_prefetched_items=False)
     invoice.total = invoice.calculate_total()
     invoice.vat = invoice.calculate_vat()
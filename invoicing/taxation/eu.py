@@ -1,6 +1,7 @@
 from datetime import date
 from decimal import Decimal
 from django.conf import settings
+from django.core.cache import caches
 from django.core.exceptions import ImproperlyConfigured, ValidationError
 from django.core.validators import EMPTY_VALUES
 from internationalflavor.vat_number import VATNumberValidator
@@ -136,19 +137,107 @@ class EUTaxationPolicy(TaxationPolicy):
             if not getattr(settings, 'INVOICING_USE_VIES_VALIDATOR', True):
                 return None
 
-            try:
-                # Verify VAT ID in VIES
-                VATNumberValidator(eu_only=True, vies_check=True)(customer_vat_id)
-
+            # Verify VAT ID in VIES
+            if cls.is_valid_in_VIES(customer_vat_id):
                 # Company is registered in VIES
                 # Charge back
                 return None
-            except ValidationError:
-                pass
 
         # return default tax
         return cls.get_default_tax(supplier_country, date_tax_point)
 
+    @classmethod
+    def is_valid_in_VIES(cls, vat_id):
+        """
+        Verifies VAT ID in VIES system.
+
+        Results are cached in ``INVOICING_VIES_CACHE`` cache (Django's cache alias, default ``'default'``)
+        for ``INVOICING_VIES_CACHE_TTL`` seconds if VAT ID is valid and ``INVOICING_VIES_CACHE_NEGATIVE_TTL``
+        seconds if it is not. Results not confirmed by VIES (service unreachable) are not cached.
+
+        :param vat_id: VAT ID
+        :return: bool
+        """
+        cache = caches[getattr(settings, 'INVOICING_VIES_CACHE', 'default')]
+        key = cls.get_VIES_cache_key(vat_id)
+        valid = cache.get(key)
+
+        if valid is not None:
+            return valid
+
+        valid, confirmed = cls.check_VIES(vat_id)
+
+        if confirmed:
+            cls.cache_VIES_result(vat_id, valid)
+
+        return valid
+
+    @classmethod
+    def prevalidate_vat_ids(cls, vat_ids, max_workers=None):
+        """
+        Verifies VAT IDs in VIES system concurrently and caches the results,
+        so following ``is_valid_in_VIES()`` (and tax rate resolution) doesn't reach VIES.
+
+        VAT IDs are deduplicated and those already cached are skipped. The rest are checked
+        by pool of ``max_workers`` threads (``INVOICING_VIES_WORKERS`` by default), results are cached
+        in the calling thread as they complete.
+
+        :param vat_ids: iterable of VAT IDs (empty values are ignored)
+        :param max_workers: number of concurrent VIES requests
+        :return: dict {vat_id: valid}
+        """
+        from invoicing.utils import iter_concurrently
+
+        cache = caches[getattr(settings, 'INVOICING_VIES_CACHE', 'default')]
+        vat_ids = list(dict.fromkeys(vat_id for vat_id in vat_ids if vat_id not in EMPTY_VALUES))
+        keys = {cls.get_VIES_cache_key(vat_id): vat_id for vat_id in vat_ids}
+        results = {keys[key]: valid for key, valid in cache.get_many(keys.keys()).items()}
+
+        if max_workers is None:
+            max_workers = getattr(settings, 'INVOICING_VIES_WORKERS', 4)
+
+        unknown = [vat_id for vat_id in vat_ids if vat_id not in results]
+
+        for vat_id, (valid, confirmed) in iter_concurrently(cls.check_VIES, unknown, max_workers=max_workers):
+            if confirmed:
+                cls.cache_VIES_result(vat_id, valid)
+
+            results[vat_id] = valid
+
+        return results
+
+    @classmethod
+    def check_VIES(cls, vat_id):
+        """
+        Verifies VAT ID in VIES system (without cache).
+
+        :param vat_id: VAT ID
+        :return: tuple (valid, confirmed), VAT ID is valid but not confirmed if VIES can't be reached
+        """
+        validator = VATNumberValidator(eu_only=True, vies_check=True)
+
+        try:
+            validator(vat_id)
+        except ValidationError:
+            return False, True
+
+        return True, getattr(validator, '_wsdl_exception', None) is None
+
+    @classmethod
+    def cache_VIES_result(cls, vat_id, valid):
+        cache = caches[getattr(settings, 'INVOICING_VIES_CACHE', 'default')]
+
+        if valid:
+            timeout = getattr(settings, 'INVOICING_VIES_CACHE_TTL', 60 * 60 * 24)
+        else:
+            timeout = getattr(settings, 'INVOICING_VIES_CACHE_NEGATIVE_TTL', 60 * 60)
+
+        cache.set(cls.get_VIES_cache_key(vat_id), valid, timeout)
+
+    @staticmethod
+    def get_VIES_cache_key(vat_id):
+        return 'invoicing:vies:' + str(vat_id).replace(' ', '_')
+
     @classmethod
     def get_tax_rate_by_invoice(cls, invoice):
         """
@@ -28,6 +28,8 @@ pragmatic  → partially mocked
     can be imported without needing django-pragmatic fully configured.
 """
 import sys
+import threading
+import time
 import types
 from datetime import date, timedelta
 from unittest.mock import MagicMock
@@ -312,6 +314,57 @@ def mock_requests(monkeypatch):
     return mock_post
 
 
+class StandInVIES:
+    """
+    Stand-in for VIES service: VAT IDs in ``valid`` exist, other don't,
+    nothing is confirmed if ``unreachable``. Checked VAT IDs are collected in ``requests``.
+    """
+    def __init__(self):
+        self.valid = set()
+        self.unreachable = False
+        self.requests = []
+        self.delay = 0
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def check_vat(self, validator, country, rest):
+        from django.core.exceptions import ValidationError
+
+        with self.lock:
+            self.requests.append(country + rest)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+
+        time.sleep(self.delay)
+
+        with self.lock:
+            self.active -= 1
+
+        if self.unreachable:
+            validator._wsdl_exception = IOError('VIES is unreachable')
+        elif country + rest not in self.valid:
+            raise ValidationError('This VAT number does not exist.')
+
+
+@pytest.fixture
+def vies_responder(monkeypatch):
+    """Answer VIES checks by stand-in VIES service with empty VIES cache."""
+    from django.core.cache import caches
+    from internationalflavor.vat_number import VATNumberValidator
+
+    responder = StandInVIES()
+
+    def check_vies(validator, country, rest):
+        responder.check_vat(validator, country, rest)
+
+    monkeypatch.setattr(VATNumberValidator, '_check_vies_native', check_vies)
+    monkeypatch.setattr(VATNumberValidator, '_check_vies_suds', check_vies)
+    caches['default'].clear()
+    yield responder
+    caches['default'].clear()
+
+
 @pytest.fixture
 def mock_vies_validator(monkeypatch):
     """Mock VIES VAT validator."""
@@ -0,0 +1,149 @@
+"""
+Tests for PDF cache.
+"""
+import io
+import os
+import time
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import RequestFactory
+
+from invoicing.cache import get_pdf_cache, PDFCache
+from invoicing.formatters.html import HTMLFormatter
+from invoicing.formatters.pdf import PDFFormatter
+from invoicing.utils import get_invoices_in_pdf
+from invoicing.views import InvoiceDetailView
+
+
+class CountingPDFFormatter(PDFFormatter):
+    rendered = 0
+
+    def get_content(self):
+        CountingPDFFormatter.rendered += 1
+        return super().get_content()
+
+
+@pytest.fixture
+def pdf_cache_settings(settings, tmp_path):
+    settings.STORAGES = {
+        **settings.STORAGES,
+        'invoicing_pdf_cache': {
+            'BACKEND': 'django.core.files.storage.FileSystemStorage',
+            'OPTIONS': {'location': str(tmp_path)},
+        },
+    }
+    settings.INVOICING_PDF_CACHE_ENABLED = True
+    settings.INVOICING_PDF_CACHE_STORAGE = 'invoicing_pdf_cache'
+    settings.INVOICING_FORMATTER = 'invoicing.tests.test_cache.CountingPDFFormatter'
+    CountingPDFFormatter.rendered = 0
+    return settings
+
+
+@pytest.mark.django_db
+@pytest.mark.unit
+class TestPDFCache:
+    """Tests for PDFCache."""
+
+    def test_disabled_by_default(self):
+        assert get_pdf_cache() is None
+
+    def test_get_and_set(self, pdf_cache_settings, invoice_factory):
+        pdf_cache = get_pdf_cache()
+        invoice = invoice_factory()
+
+        assert pdf_cache.get(invoice, PDFFormatter) is None
+
+        pdf_cache.set(invoice, PDFFormatter, b'%PDF-1.4')
+
+        assert pdf_cache.has(invoice, PDFFormatter)
+        assert pdf_cache.get(invoice, PDFFormatter) == b'%PDF-1.4'
+        assert pdf_cache.get(invoice, HTMLFormatter) is None
+
+    def test_key(self, invoice_factory):
+        invoice = invoice_factory()
+        key = PDFCache.get_key(invoice, PDFFormatter)
+
+        assert PDFCache.get_key(invoice, HTMLFormatter) != key
+
+        invoice.language = 'sk'
+        assert PDFCache.get_key(invoice, PDFFormatter) != key
+
+    def test_key_changes_with_items(self, invoice_factory, item_factory):
+        invoice = invoice_factory()
+        key = PDFCache.get_key(invoice, PDFFormatter)
+
+        item_factory(invoice=invoice)
+        invoice.refresh_from_db()
+
+        assert PDFCache.get_key(invoice, PDFFormatter) != key
+
+    def test_key_changes_with_partial_update(self, invoice_factory):
+        invoice = invoice_factory()
+        key = PDFCache.get_key(invoice, PDFFormatter)
+
+        invoice.status = invoice.STATUS.SENT
+        invoice.save(update_fields=['status'])
+        invoice.refresh_from_db()
+
+        assert PDFCache.get_key(invoice, PDFFormatter) != key
+
+    def test_evict_by_age(self, pdf_cache_settings, invoice_factory, tmp_path):
+        pdf_cache = get_pdf_cache()
+        old_invoice, new_invoice = invoice_factory(), invoice_factory()
+        pdf_cache.set(old_invoice, PDFFormatter, b'%PDF old')
+        pdf_cache.set(new_invoice, PDFFormatter, b'%PDF new')
+
+        old_path = pdf_cache.storage.path(pdf_cache.get_path(pdf_cache.get_key(old_invoice, PDFFormatter)))
+        os.utime(old_path, (time.time() - 7200, time.time() - 7200))
+
+        assert pdf_cache.evict(max_age=3600) == 1
+        assert not pdf_cache.has(old_invoice, PDFFormatter)
+        assert pdf_cache.has(new_invoice, PDFFormatter)
+
+    def test_evict_by_size(self, pdf_cache_settings, invoice_factory):
+        pdf_cache = get_pdf_cache()
+        invoices = [invoice_factory() for i in range(3)]
+
+        for age, invoice in zip([300, 200, 100], invoices):
+            pdf_cache.set(invoice, PDFFormatter, b'%PDF' + b'0' * 96)
+            path = pdf_cache.storage.path(pdf_cache.get_path(pdf_cache.get_key(invoice, PDFFormatter)))
+            os.utime(path, (time.time() - age, time.time() - age))
+
+        assert pdf_cache.evict(max_size=250) == 1
+        assert [pdf_cache.has(invoice, PDFFormatter) for invoice in invoices] == [False, True, True]
+
+    def test_pipeline_uses_cache(self, pdf_cache_settings, invoice_factory):
+        invoices = [invoice_factory() for i in range(3)]
+
+        first_files = get_invoices_in_pdf(invoices)
+        second_files = get_invoices_in_pdf(invoices)
+
+        assert CountingPDFFormatter.rendered == 3
+        assert sorted(file['content'] for file in first_files) == sorted(file['content'] for file in second_files)
+
+    def test_detail_view_uses_cache(self, pdf_cache_settings, invoice_factory, django_user_model):
+        invoice = invoice_factory()
+        request = RequestFactory().get('/')
+        request.user = django_user_model.objects.create_user(username='user', password='password')
+
+        first_response = InvoiceDetailView.as_view()(request, pk=invoice.pk)
+        second_response = InvoiceDetailView.as_view()(request, pk=invoice.pk)
+
+        assert CountingPDFFormatter.rendered == 1
+        assert second_response['Content-Type'] == 'application/pdf'
+        assert second_response.content == first_response.content
+
+    def test_warm_command(self, pdf_cache_settings, invoice_factory):
+        invoices = [invoice_factory() for i in range(2)]
+        get_invoices_in_pdf(invoices[:1])
+
+        call_command('warm_invoice_pdf_cache', stdout=io.StringIO())
+
+        assert CountingPDFFormatter.rendered == 2
+        assert all(get_pdf_cache().has(invoice, CountingPDFFormatter) for invoice in invoices)
+
+    def test_warm_command_disabled_cache(self):
+        with pytest.raises(CommandError):
+            call_command('warm_invoice_pdf_cache', stdout=io.StringIO())
@@ -0,0 +1,227 @@
+"""
+Tests for background tasks of IKROS and Profit365 API exports.
+"""
+import json
+import logging
+from unittest.mock import Mock, patch
+
+import pytest
+import responses
+from django.core.serializers.json import DjangoJSONEncoder
+from outputs.models import Export, ExportItem
+from outputs.signals import export_item_changed
+
+from invoicing import settings as invoicing_settings
+from invoicing.exporters.ikros import tasks as ikros_tasks
+from invoicing.exporters.ikros.managers import IKrosManager
+from invoicing.exporters.profit365 import tasks as profit365_tasks
+from invoicing.exporters.profit365.managers import Profit365Manager
+from invoicing.models import Invoice
+
+IKROS_URL = 'https://ikros.example.com/api/v1/invoices/'
+PROFIT365_URL = 'https://profit365.example.com/1.6'
+
+
+def manager_path(manager_class):
+    return f'{manager_class.__module__}.{manager_class.__name__}'
+
+
+@pytest.fixture
+def api_export(invoice_factory, item_factory, django_user_model, monkeypatch):
+    def _create_export(manager_class, task_module, task_name, count, manager_settings):
+        monkeypatch.setattr(invoicing_settings, 'INVOICING_MANAGERS', {manager_path(manager_class): dict(manager_settings)})
+        user = django_user_model.objects.create_user(username='api', email='api@example.com', password='api')
+
+        for _ in range(count):
+            item_factory(invoice=invoice_factory())
+
+        request = Mock()
+        request.user = user
+        request.GET = {}
+        manager = manager_class()
+
+        with patch.object(task_module, task_name):
+            manager.export_via_api(request, Invoice.objects.all())
+
+        export_item_changed.reset_mock()
+        return Export.objects.get(), manager
+
+    return _create_export
+
+
+def _signalled_results():
+    return {
+        call.kwargs['object_id']: (call.kwargs['result'], call.kwargs['detail'])
+        for call in export_item_changed.send.call_args_list
+    }
+
+
+@pytest.mark.django_db
+@pytest.mark.exporters
+class TestSendInvoicesToIKros:
+    settings = {'API_URL': IKROS_URL, 'API_KEY': 'test-key'}
+
+    def test_export_tracked(self, api_export):
+        export, manager = api_export(IKrosManager, ikros_tasks, 'send_invoices_to_ikros', 3, self.settings)
+
+        assert export.total == 3
+        assert export.output_type == Export.OUTPUT_TYPE_STREAM
+        assert export.exporter_path == 'invoicing.exporters.ikros.list.InvoiceIKrosApiExporter'
+        assert export.format in dict(Export.FORMATS)
+        assert export.items.count() == 3
+
+    @responses.activate
+    def test_success(self, api_export, mailoutbox):
+        export, manager = api_export(IKrosManager, ikros_tasks, 'send_invoices_to_ikros', 3, self.settings)
+        responses.add(responses.POST, IKROS_URL, json={'documents': [{'downloadUrl': 'https://example.com/file.pdf'}]})
+
+        ikros_tasks.send_invoices_to_ikros(export.id, manager)
+
+        assert len(responses.calls) == 1
+        assert len(json.loads(responses.calls[0].request.body)) == 3
+        results = _signalled_results()
+        assert set(results) == set(Invoice.objects.values_list('id', flat=True))
+        assert set(results.values()) == {(ExportItem.RESULT_SUCCESS, 'https://example.com/file.pdf')}
+        export.refresh_from_db()
+        assert export.status == Export.STATUS_FINISHED
+        assert len(mailoutbox) == 1
+        assert 'Successful: 3' in mailoutbox[0].body
+
+    @responses.activate
+    def test_error_message(self, api_export, mailoutbox):
+        export, manager = api_export(IKrosManager, ikros_tasks, 'send_invoices_to_ikros', 2, self.settings)
+        responses.add(responses.POST, IKROS_URL, json={'code': 400, 'message': 'Invalid data', 'errorType': 'Validation'})
+
+        ikros_tasks.send_invoices_to_ikros(export.id, manager)
+
+        assert set(_signalled_results().values()) == {
+            (ExportItem.RESULT_FAILURE, 'Result code: 400. Message: Invalid data (Validation)')
+        }
+        export.refresh_from_db()
+        assert export.status == Export.STATUS_FAILED
+        assert 'Errors: 2' in mailoutbox[0].body
+
+    @pytest.mark.parametrize('data, detail', [
+        ({'message': 'Invalid data'}, 'Result code: None. Message: Invalid data (-)'),
+        ([], 'Unexpected response: []'),
+        (None, 'Unexpected response: None'),
+    ])
+    @responses.activate
+    def test_unexpected_response(self, api_export, mailoutbox, data, detail):
+        export, manager = api_export(IKrosManager, ikros_tasks, 'send_invoices_to_ikros', 2, self.settings)
+        responses.add(responses.POST, IKROS_URL, body=json.dumps(data), content_type='application/json')
+
+        ikros_tasks.send_invoices_to_ikros(export.id, manager)
+
+        assert set(_signalled_results().values()) == {(ExportItem.RESULT_FAILURE, detail)}
+        assert 'Errors: 2' in mailoutbox[0].body
+
+    @responses.activate
+    def test_chunked_by_count(self, api_export, mailoutbox):
+        export, manager = api_export(
+            IKrosManager, ikros_tasks, 'send_invoices_to_ikros', 5, {**self.settings, 'CHUNK_SIZE': 2, 'CONCURRENCY': 2}
+        )
+
+        def callback(request):
+            numbers = [invoice['documentNumber'] for invoice in json.loads(request.body)]
+            return 200, {}, json.dumps({'documents': [{'downloadUrl': f'https://example.com/{"-".join(numbers)}.pdf'}]})
+
+        responses.add_callback(responses.POST, IKROS_URL, callback=callback)
+
+        ikros_tasks.send_invoices_to_ikros(export.id, manager)
+
+        assert sorted(len(json.loads(call.request.body)) for call in responses.calls) == [1, 2, 2]
+        results = _signalled_results()
+        assert len(results) == 5
+
+        for invoice in Invoice.objects.all():
+            result, detail = results[invoice.id]
+            assert result == ExportItem.RESULT_SUCCESS
+            assert invoice.number in detail
+
+        # links of all chunks are aggregated in the summary
+        assert mailoutbox[0].body.count('https://example.com/') == 3
+
+    @responses.activate
+    @pytest.mark.parametrize('manager_settings, timeout', [({}, 60), ({'TIMEOUT': 5}, 5)])
+    def test_request_timeout(self, api_export, manager_settings, timeout):
+        export, manager = api_export(IKrosManager, ikros_tasks, 'send_invoices_to_ikros', 1, {**self.settings, **manager_settings})
+        responses.add(responses.POST, IKROS_URL, json={'documents': []})
+
+        ikros_tasks.send_invoices_to_ikros(export.id, manager)
+
+        assert responses.calls[0].request.req_kwargs['timeout'] == timeout
+
+    def test_chunked_by_size(self, api_export):
+        export, manager = api_export(IKrosManager, ikros_tasks, 'send_invoices_to_ikros', 5, self.settings)
+        queryset = Invoice.objects.all()
+        invoice_size = max(len(json.dumps(manager.get_invoice_data(invoice), cls=DjangoJSONEncoder)) for invoice in queryset)
+        max_bytes = 2 * invoice_size + 3
+        invoicing_settings.INVOICING_MANAGERS[manager_path(IKrosManager)]['CHUNK_MAX_BYTES'] = max_bytes
+
+        chunks = list(manager.iter_payload_chunks(queryset))
+
+        assert len(chunks) >= 3
+        assert sum(len(invoices) for invoices, payload in chunks) == 5
+
+        for invoices, payload in chunks:
+            assert len(payload) <= max_bytes
+            assert [invoice['documentNumber'] for invoice in json.loads(payload)] == [number for invoice_id, number in invoices]
+
+    @responses.activate
+    def test_payload_logged_at_debug_only(self, api_export, caplog):
+        export, manager = api_export(IKrosManager, ikros_tasks, 'send_invoices_to_ikros', 1, self.settings)
+        invoice = Invoice.objects.get()
+        responses.add(responses.POST, IKROS_URL, json={'documents': []})
+
+        with caplog.at_level(logging.INFO, logger='invoicing.exporters.ikros.managers'):
+            ikros_tasks.send_invoices_to_ikros(export.id, manager)
+
+        assert 'IKROS payload of 1 invoices' in caplog.text
+        assert invoice.customer_name not in caplog.text
+
+
+@pytest.mark.django_db
+@pytest.mark.exporters
+class TestSendInvoicesToProfit365:
+    settings = {
+        'API_URL': PROFIT365_URL,
+        'API_DATA': {
+            'Authorization': 'Bearer token',
+            'ClientID': 'client-id',
+            'ClientSecret': 'client-secret',
+            'bankAccountId': 'account-id',
+        },
+        'CONCURRENCY': 2,
+    }
+
+    def test_export_tracked(self, api_export):
+        export, manager = api_export(Profit365Manager, profit365_tasks, 'send_invoices_to_profit365', 3, self.settings)
+
+        assert export.exporter_path == 'invoicing.exporters.profit365.list.InvoiceProfit365ApiExporter'
+        assert export.format in dict(Export.FORMATS)
+        assert export.items.count() == 3
+
+    @responses.activate
+    def test_results_per_invoice(self, api_export, mailoutbox):
+        export, manager = api_export(Profit365Manager, profit365_tasks, 'send_invoices_to_profit365', 3, self.settings)
+        failing = Invoice.objects.order_by('pk').last()
+
+        def callback(request):
+            if json.loads(request.body)['recordNumber'] == failing.number:
+                return 400, {}, 'Bad Request'
+            return 200, {}, '{}'
+
+        responses.add_callback(responses.POST, f'{PROFIT365_URL}/sales/invoices', callback=callback)
+
+        profit365_tasks.send_invoices_to_profit365(export.id, manager)
+
+        results = _signalled_results()
+        assert len(results) == 3
+        assert results[failing.id] == (ExportItem.RESULT_FAILURE, '400 (Bad Request)')
+        assert [result for invoice_id, (result, detail) in results.items() if invoice_id != failing.id] == [
+            ExportItem.RESULT_SUCCESS, ExportItem.RESULT_SUCCESS
+        ]
+        export.refresh_from_db()
+        assert export.status == Export.STATUS_FAILED
+        assert f'{failing.number} - 400 (Bad Request)' in mailoutbox[0].body
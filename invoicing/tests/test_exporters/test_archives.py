@@ -0,0 +1,61 @@
+"""
+Tests for archive output of multi-invoice exporters.
+"""
+import io
+import zipfile
+
+import pytest
+
+from invoicing.exporters.isdoc.list import InvoiceISDOCXmlListExporter
+from invoicing.exporters.pdf.detail import InvoicePdfDetailExporter
+from invoicing.models import Invoice
+
+
+@pytest.fixture
+def pdf_formatter_settings(settings):
+    settings.INVOICING_FORMATTER = 'invoicing.tests.test_utils.PDFBytesFormatter'
+    return settings
+
+
+@pytest.mark.django_db
+@pytest.mark.exporters
+class TestPdfDetailExporterOutput:
+    """Tests for InvoicePdfDetailExporter output."""
+
+    def test_single_invoice_exported_directly(self, pdf_formatter_settings, invoice_factory):
+        invoice = invoice_factory()
+        exporter = InvoicePdfDetailExporter(user=None, recipients=[], queryset=Invoice.objects.filter(pk=invoice.pk))
+
+        exporter.export()
+
+        assert exporter.filename == f'{invoice}.pdf'
+        assert exporter.get_output().startswith(b'%PDF')
+
+    def test_multiple_invoices_archived(self, pdf_formatter_settings, invoice_factory):
+        invoices = [invoice_factory() for i in range(3)]
+        exporter = InvoicePdfDetailExporter(user=None, recipients=[], queryset=Invoice.objects.all())
+
+        exporter.export()
+
+        with zipfile.ZipFile(io.BytesIO(exporter.get_output())) as archive:
+            assert sorted(archive.namelist()) == sorted(f'{invoice}.pdf' for invoice in invoices)
+            assert all(info.compress_type == zipfile.ZIP_DEFLATED for info in archive.infolist())
+
+
+@pytest.mark.django_db
+@pytest.mark.exporters
+class TestISDOCExporterOutput:
+    """Tests for InvoiceISDOCXmlListExporter output."""
+
+    def test_invoices_archived(self, settings_override, invoice_factory, item_factory):
+        invoices = [invoice_factory() for i in range(2)]
+        for invoice in invoices:
+            item_factory(invoice=invoice)
+
+        exporter = InvoiceISDOCXmlListExporter(user=None, recipients=[], queryset=Invoice.objects.all())
+
+        exporter.export()
+
+        with zipfile.ZipFile(io.BytesIO(exporter.get_output())) as archive:
+            assert sorted(archive.namelist()) == sorted(f'{invoice.number}.{exporter.export_format}' for invoice in invoices)
+            assert archive.read(f'{invoices[0].number}.{exporter.export_format}').startswith(b"<?xml version='1.0' encoding='utf-8'?>")
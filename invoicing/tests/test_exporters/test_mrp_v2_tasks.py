@@ -0,0 +1,306 @@
+"""
+Tests for MRP v2 API submission task.
+"""
+import threading
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+import requests
+import responses
+from lxml import etree
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+from outputs.models import Export, ExportItem
+from outputs.signals import export_item_changed
+
+from invoicing import settings as invoicing_settings
+from invoicing.exporters.mrp.v2 import tasks as mrp_v2_tasks
+from invoicing.exporters.mrp.v2.managers import MrpIssuedManager
+from invoicing.models import Invoice
+
+API_URL = 'https://mrp.example.com/api/'
+SUCCESS_RESPONSE = b'<mrpEnvelope><body><mrpResponse><status/></mrpResponse></body></mrpEnvelope>'
+ERROR_RESPONSE = (
+    b'<mrpEnvelope><body><mrpResponse><error errorCode="1" errorClass="EMrpError">'
+    b'<errorMessage>Invalid document</errorMessage></error></mrpResponse></body></mrpEnvelope>'
+)
+
+
+@pytest.fixture
+def mrp_export(invoice_factory, item_factory, django_user_model, monkeypatch):
+    def _create_export(count, **manager_settings):
+        monkeypatch.setattr(invoicing_settings, 'INVOICING_MANAGERS', {
+            'invoicing.exporters.mrp.v2.managers.MrpIssuedManager': {'API_URL': API_URL, **manager_settings},
+        })
+        user = django_user_model.objects.create_user(username='mrp', email='mrp@example.com', password='mrp')
+
+        for _ in range(count):
+            item_factory(invoice=invoice_factory(origin=Invoice.ORIGIN.ISSUED))
+
+        request = Mock()
+        request.user = user
+        request.GET = {}
+        manager = MrpIssuedManager()
+
+        with patch.object(mrp_v2_tasks, 'send_invoices_to_mrp'):
+            manager.export_via_api(request, Invoice.objects.all())
+
+        export_item_changed.reset_mock()
+        return Export.objects.get(), manager
+
+    return _create_export
+
+
+def _track_concurrency(body=SUCCESS_RESPONSE, delay=0.05):
+    state = {'active': 0, 'max_active': 0, 'calls': 0}
+    lock = threading.Lock()
+
+    def callback(request):
+        with lock:
+            state['active'] += 1
+            state['calls'] += 1
+            state['max_active'] = max(state['max_active'], state['active'])
+
+        time.sleep(delay)
+
+        with lock:
+            state['active'] -= 1
+
+        return 200, {'Content-Type': 'application/xml'}, body
+
+    return state, callback
+
+
+def _signalled_results():
+    return {
+        call.kwargs['object_id']: (call.kwargs['result'], call.kwargs['detail'])
+        for call in export_item_changed.send.call_args_list
+    }
+
+
+@pytest.mark.django_db
+@pytest.mark.exporters
+class TestSendInvoicesToMrp:
+    @responses.activate
+    def test_sequential_by_default(self, mrp_export):
+        export, manager = mrp_export(3)
+        state, callback = _track_concurrency()
+        responses.add_callback(responses.POST, API_URL, callback=callback)
+
+        mrp_v2_tasks.send_invoices_to_mrp(export.id, manager)
+
+        assert state['calls'] == 3
+        assert state['max_active'] == 1
+        results = _signalled_results()
+        assert set(results) == set(Invoice.objects.values_list('id', flat=True))
+        assert all(result == ExportItem.RESULT_SUCCESS for result, detail in results.values())
+        export.refresh_from_db()
+        assert export.status == Export.STATUS_FINISHED
+
+    @responses.activate
+    def test_concurrent_requests(self, mrp_export):
+        export, manager = mrp_export(6, CONCURRENCY=3)
+        state, callback = _track_concurrency(delay=0.1)
+        responses.add_callback(responses.POST, API_URL, callback=callback)
+
+        with patch.object(mrp_v2_tasks, 'get_http_session', wraps=mrp_v2_tasks.get_http_session) as get_session:
+            mrp_v2_tasks.send_invoices_to_mrp(export.id, manager)
+
+        # one pooled session shared by all workers, one invoice per request
+        get_session.assert_called_once_with(3)
+        assert state['calls'] == 6
+        assert 1 < state['max_active'] <= 3
+        results = _signalled_results()
+        assert len(results) == 6
+        assert all(result == ExportItem.RESULT_SUCCESS for result, detail in results.values())
+
+    @responses.activate
+    def test_failures_recorded_per_invoice(self, mrp_export):
+        export, manager = mrp_export(3, CONCURRENCY=2)
+        invoices = list(Invoice.objects.order_by('pk'))
+        responses_by_number = {
+            invoices[0].number: (200, {'Content-Type': 'application/xml'}, SUCCESS_RESPONSE),
+            invoices[1].number: (200, {'Content-Type': 'application/xml'}, ERROR_RESPONSE),
+            invoices[2].number: (500, {}, b''),
+        }
+
+        def callback(request):
+            for number, response in responses_by_number.items():
+                if f'<DocumentNumber>{number}</DocumentNumber>'.encode() in request.body:
+                    return response
+
+        responses.add_callback(responses.POST, API_URL, callback=callback)
+
+        mrp_v2_tasks.send_invoices_to_mrp(export.id, manager)
+
+        results = _signalled_results()
+        assert results[invoices[0].id][0] == ExportItem.RESULT_SUCCESS
+        assert results[invoices[1].id] == (ExportItem.RESULT_FAILURE, 'Invalid document')
+        assert results[invoices[2].id][0] == ExportItem.RESULT_FAILURE
+        assert results[invoices[2].id][1].startswith('Network error')
+
+    @responses.activate
+    def test_transient_errors_retried_with_backoff(self, mrp_export):
+        export, manager = mrp_export(1, RETRIES=3, BACKOFF=0.5)
+        responses.add(responses.POST, API_URL, status=503)
+        responses.add(responses.POST, API_URL, body=requests.exceptions.ConnectionError(
+            MaxRetryError(None, API_URL, NewConnectionError(None, 'Connection refused'))
+        ))
+        responses.add(responses.POST, API_URL, body=SUCCESS_RESPONSE, content_type='application/xml')
+
+        with patch.object(mrp_v2_tasks.time, 'sleep') as sleep:
+            mrp_v2_tasks.send_invoices_to_mrp(export.id, manager)
+
+        assert len(responses.calls) == 3
+        assert [call.args[0] for call in sleep.call_args_list] == [0.5, 1.0]
+        assert [result for result, detail in _signalled_results().values()] == [ExportItem.RESULT_SUCCESS]
+
+    @responses.activate
+    def test_retries_exhausted(self, mrp_export):
+        export, manager = mrp_export(1, RETRIES=2, BACKOFF=0)
+        responses.add(responses.POST, API_URL, body=requests.exceptions.ConnectTimeout('Timed out'))
+
+        mrp_v2_tasks.send_invoices_to_mrp(export.id, manager)
+
+        assert len(responses.calls) == 3
+        [(result, detail)] = _signalled_results().values()
+        assert result == ExportItem.RESULT_FAILURE
+        assert detail.startswith('Request timeout')
+
+    @responses.activate
+    def test_read_timeout_not_resent(self, mrp_export):
+        export, manager = mrp_export(1, RETRIES=2, BACKOFF=0)
+        responses.add(responses.POST, API_URL, body=requests.exceptions.ReadTimeout('Read timed out'))
+
+        mrp_v2_tasks.send_invoices_to_mrp(export.id, manager)
+
+        assert len(responses.calls) == 1
+        [(result, detail)] = _signalled_results().values()
+        assert result == ExportItem.RESULT_FAILURE
+        assert mrp_v2_tasks.MANUAL_CHECK_NOTE in detail
+
+    @pytest.mark.parametrize('error', [
+        requests.exceptions.ConnectionError('Connection aborted'),
+        requests.exceptions.ConnectionError(MaxRetryError(None, API_URL, 'Read timed out')),
+    ])
+    @responses.activate
+    def test_connection_errors_after_sending_not_resent(self, mrp_export, error):
+        export, manager = mrp_export(1, RETRIES=2, BACKOFF=0)
+        responses.add(responses.POST, API_URL, body=error)
+
+        mrp_v2_tasks.send_invoices_to_mrp(export.id, manager)
+
+        assert len(responses.calls) == 1
+
+    @pytest.mark.parametrize('status', [502, 504])
+    @responses.activate
+    def test_gateway_errors_not_resent(self, mrp_export, status):
+        export, manager = mrp_export(1, RETRIES=2, BACKOFF=0)
+        responses.add(responses.POST, API_URL, status=status)
+
+        mrp_v2_tasks.send_invoices_to_mrp(export.id, manager)
+
+        assert len(responses.calls) == 1
+        [(result, detail)] = _signalled_results().values()
+        assert result == ExportItem.RESULT_FAILURE
+        assert mrp_v2_tasks.MANUAL_CHECK_NOTE in detail
+
+    @responses.activate
+    def test_client_errors_not_retried(self, mrp_export):
+        export, manager = mrp_export(1, RETRIES=2, BACKOFF=0)
+        responses.add(responses.POST, API_URL, status=400)
+
+        mrp_v2_tasks.send_invoices_to_mrp(export.id, manager)
+
+        assert len(responses.calls) == 1
+
+    @responses.activate
+    def test_resume_skips_successful_items(self, mrp_export):
+        export, manager = mrp_export(3)
+        invoices = list(Invoice.objects.order_by('pk'))
+        export.items.filter(object_id=invoices[0].id).update(result=ExportItem.RESULT_SUCCESS)
+        export.items.filter(object_id=invoices[1].id).update(result=ExportItem.RESULT_FAILURE)
+        responses.add(responses.POST, API_URL, body=SUCCESS_RESPONSE, content_type='application/xml')
+
+        mrp_v2_tasks.send_invoices_to_mrp(export.id, manager)
+
+        assert len(responses.calls) == 2
+        assert set(_signalled_results()) == {invoices[1].id, invoices[2].id}
+
+    @responses.activate
+    def test_resume_skips_uncertain_items(self, mrp_export, mailoutbox):
+        export, manager = mrp_export(2, RETRIES=2, BACKOFF=0)
+        timed_out, other = Invoice.objects.order_by('pk')
+        responses.add(responses.POST, API_URL, body=requests.exceptions.ReadTimeout('Read timed out'))
+        mrp_v2_tasks.send_invoices_to_mrp(export.id, manager)
+        # results are stored by receiver of the signal in production
+        for object_id, (result, detail) in _signalled_results().items():
+            export.items.filter(object_id=object_id).update(result=result, detail=detail)
+        export.items.filter(object_id=other.id).update(result=ExportItem.RESULT_FAILURE, detail='Network error')
+        assert export.items.get(object_id=timed_out.id).detail.startswith(mrp_v2_tasks.UNCERTAIN_MARKER)
+
+        responses.reset()
+        responses.add(responses.POST, API_URL, body=SUCCESS_RESPONSE, content_type='application/xml')
+        export_item_changed.reset_mock()
+
+        mrp_v2_tasks.send_invoices_to_mrp(export.id, manager)
+
+        assert len(responses.calls) == 1
+        assert set(_signalled_results()) == {other.id}
+        assert 'Not resent, check them in MRP: 1' in mailoutbox[-1].body
+
+        mrp_v2_tasks.send_invoices_to_mrp(export.id, manager, resend_uncertain=True)
+
+        assert len(responses.calls) == 3
+
+    @responses.activate
+    def test_sending_starts_before_all_outputs_are_generated(self, mrp_export):
+        export, manager = mrp_export(3)
+        events = []
+        exporter_class = type(export.exporter)
+        get_output_per_item = exporter_class.get_output_per_item
+
+        def tracking_get_output_per_item(exporter, invoice):
+            events.append(('generate', invoice.number))
+            return get_output_per_item(exporter, invoice)
+
+        def callback(request):
+            number = etree.fromstring(request.body).findtext('.//DocumentNumber')
+            events.append(('send', number))
+            return 200, {'Content-Type': 'application/xml'}, SUCCESS_RESPONSE
+
+        responses.add_callback(responses.POST, API_URL, callback=callback)
+
+        with patch.object(exporter_class, 'get_output_per_item', tracking_get_output_per_item):
+            mrp_v2_tasks.send_invoices_to_mrp(export.id, manager)
+
+        numbers = [event[1] for event in events[::2]]
+        assert len(numbers) == 3
+        assert events == [(action, number) for number in numbers for action in ('generate', 'send')]
+
+
+@pytest.mark.django_db
+@pytest.mark.exporters
+class TestIterOutputsPerItem:
+    def test_same_outputs_as_export(self, mrp_export):
+        export, manager = mrp_export(3)
+
+        exporter = export.exporter
+        exporter.export_per_item = True
+        exporter.export()
+        iterated = list(export.exporter.iter_outputs_per_item(chunk_size=2))
+
+        assert [output['invoice'] for output in iterated] == [output['invoice'] for output in exporter.get_outputs_per_item()]
+        assert all(b'<DocumentNumber>' in output['xml_string'] for output in iterated)
+
+    def test_lazy_chunked_queryset(self, mrp_export, django_assert_max_num_queries):
+        export, manager = mrp_export(5)
+        exporter = export.exporter
+        outputs = exporter.iter_outputs_per_item(chunk_size=2)
+
+        # only first chunk of invoices (and their items) is fetched for the first output
+        with django_assert_max_num_queries(2):
+            first = next(outputs)
+
+        assert 'xml_string' in first
+        assert len([first, *outputs]) == 5
@@ -1,9 +1,15 @@
 """
 Tests for MRP v2 utility functions.
 """
+import os
+import time
+
 import pytest
+from lxml import etree
 
+from invoicing.exporters.mrp.v2.list import IssuedInvoiceMrpListExporter
 from invoicing.exporters.mrp.v2.utils import (
+    get_xsd_schema,
     sanitize_forbidden_chars,
     sanitize_uppercase_only,
     sanitize_zipcode,
@@ -151,3 +157,49 @@ class TestMRPUtils:
         result = sanitize_city(None)
         assert result == ""
 
+
+XSD_INT = b'<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema"><xs:element name="value" type="xs:int"/></xs:schema>'
+XSD_STRING = b'<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema"><xs:element name="value" type="xs:string"/></xs:schema>'
+
+
+@pytest.mark.exporters
+@pytest.mark.unit
+class TestXsdSchemaCache:
+    """Tests for cached loading of XSD schemas."""
+
+    def test_schema_compiled_once(self, tmp_path):
+        xsd_path = str(tmp_path / 'schema.xsd')
+        with open(xsd_path, 'wb') as xsd_file:
+            xsd_file.write(XSD_INT)
+
+        assert get_xsd_schema(xsd_path) is get_xsd_schema(xsd_path)
+
+    def test_changed_schema_reloaded(self, tmp_path):
+        xsd_path = str(tmp_path / 'schema.xsd')
+        with open(xsd_path, 'wb') as xsd_file:
+            xsd_file.write(XSD_INT)
+
+        assert not get_xsd_schema(xsd_path).validate(etree.XML(b'<value>text</value>'))
+
+        with open(xsd_path, 'wb') as xsd_file:
+            xsd_file.write(XSD_STRING)
+        os.utime(xsd_path, (time.time() + 10, time.time() + 10))
+
+        assert get_xsd_schema(xsd_path).validate(etree.XML(b'<value>text</value>'))
+
+    def test_missing_schema(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            get_xsd_schema(str(tmp_path / 'missing.xsd'))
+
+    def test_exporter_uses_cached_schema(self):
+        exporter = IssuedInvoiceMrpListExporter(user=None, recipients=[])
+
+        assert exporter.get_xsd_schema() is exporter.get_xsd_schema()
+
+    def test_validation_errors(self):
+        exporter = IssuedInvoiceMrpListExporter(user=None, recipients=[])
+        xml = etree.Element("MRPKSData", version="2.0")
+        etree.SubElement(etree.SubElement(xml, "IssuedInvoices"), "Unknown")
+
+        with pytest.raises(ValueError, match='XML validation failed against MRP XSD schema'):
+            exporter.validate_xml(xml)
@@ -0,0 +1,89 @@
+"""
+Query count benchmarks of list exporters.
+"""
+from decimal import Decimal
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from invoicing.exporters.isdoc.list import InvoiceISDOCXmlListExporter
+from invoicing.exporters.mrp.v1.list import (
+    InvoiceFakvyXmlMrpExporter, InvoiceFakvypolXmlMrpExporter, InvoiceFvAdresXmlMrpExporter
+)
+from invoicing.exporters.mrp.v2.list import IssuedInvoiceMrpListExporter, ReceivedInvoiceMrpListExporter
+from invoicing.exporters.xlsx.list import InvoiceXlsxListExporter
+from invoicing.models import Invoice
+
+
+EXPORTERS = [
+    InvoiceXlsxListExporter,
+    InvoiceISDOCXmlListExporter,
+    InvoiceFakvyXmlMrpExporter,
+    InvoiceFakvypolXmlMrpExporter,
+    InvoiceFvAdresXmlMrpExporter,
+    IssuedInvoiceMrpListExporter,
+    ReceivedInvoiceMrpListExporter,
+]
+
+
+@pytest.mark.django_db
+@pytest.mark.exporters
+class TestExporterQueryCount:
+    """Tests that number of export queries doesn't depend on number of invoices."""
+
+    @staticmethod
+    def _create_invoices(invoice_factory, item_factory, count):
+        for i in range(count):
+            invoice = invoice_factory(origin=Invoice.ORIGIN.ISSUED if i % 2 else Invoice.ORIGIN.RECEIVED)
+            item_factory(invoice=invoice, tax_rate=Decimal('20.0'))
+            item_factory(invoice=invoice, tax_rate=Decimal('10.0'), discount=Decimal('5.0'))
+            item_factory(invoice=invoice, tax_rate=None)
+
+    @staticmethod
+    def _count_export_queries(exporter_class):
+        exporter = exporter_class(user=None, recipients=[], queryset=Invoice.objects.all())
+
+        with CaptureQueriesContext(connection) as context:
+            exporter.export()
+
+        return len(context.captured_queries)
+
+    @pytest.mark.parametrize('exporter_class', EXPORTERS, ids=lambda exporter_class: exporter_class.__name__)
+    def test_query_count_is_constant(self, settings_override, invoice_factory, item_factory, exporter_class, monkeypatch):
+        # XLSX exporter writes pages in threads (with own connections) when there are more invoices than threads
+        monkeypatch.setattr('outputs.settings.NUMBER_OF_THREADS', 100)
+
+        self._create_invoices(invoice_factory, item_factory, 2)
+        few_invoices_queries = self._count_export_queries(exporter_class)
+
+        self._create_invoices(invoice_factory, item_factory, 8)
+        many_invoices_queries = self._count_export_queries(exporter_class)
+
+        assert many_invoices_queries == few_invoices_queries
+
+
+@pytest.mark.django_db
+@pytest.mark.models
+class TestPrefetchedVatSummary:
+    """Tests VAT summary computed from prefetched items."""
+
+    def test_matches_database_summary(self, invoice_factory, item_factory):
+        invoice = invoice_factory()
+        item_factory(invoice=invoice, quantity=Decimal('3'), unit_price=Decimal('10.05'), tax_rate=Decimal('20.0'))
+        item_factory(invoice=invoice, quantity=Decimal('1.5'), unit_price=Decimal('3.33'), discount=Decimal('12.5'), tax_rate=Decimal('20.0'))
+        item_factory(invoice=invoice, quantity=Decimal('2'), unit_price=Decimal('7.77'), tax_rate=Decimal('5.0'))
+        item_factory(invoice=invoice, unit_price=Decimal('100'), tax_rate=None)
+
+        database_summary = Invoice.objects.get(pk=invoice.pk).vat_summary
+        prefetched_summary = Invoice.objects.prefetch_related('item_set').get(pk=invoice.pk).vat_summary
+
+        def key(summary):
+            return str(summary['rate'])
+
+        assert len(prefetched_summary) == len(database_summary) == 3
+
+        for prefetched, database in zip(sorted(prefetched_summary, key=key), sorted(database_summary, key=key)):
+            assert prefetched['rate'] == database['rate']
+            assert prefetched['base'] == database['base']
+            assert prefetched['vat'] == database['vat']
@@ -2,9 +2,11 @@
 Tests for formatters.
 """
 import pytest
+from django.core.exceptions import ImproperlyConfigured
 from django.http import HttpResponse
 
 from invoicing.formatters.html import HTMLFormatter, BootstrapHTMLFormatter
+from invoicing.formatters.pdf import PDFFormatter
 
 
 @pytest.mark.django_db
@@ -41,6 +43,58 @@ class TestHTMLFormatter:
         assert isinstance(response, HttpResponse)
 
 
+@pytest.mark.django_db
+@pytest.mark.unit
+class TestHTMLFormatterQueries:
+    """Tests for query budget of HTMLFormatter."""
+
+    def _render(self, invoice_id):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        from invoicing.models import Invoice
+
+        invoice = Invoice.objects.get(pk=invoice_id)
+
+        with CaptureQueriesContext(connection) as context:
+            response = HTMLFormatter(invoice).get_response()
+
+        return response, len(context.captured_queries)
+
+    def _create_invoice(self, invoice_factory, item_factory, items_count):
+        from decimal import Decimal
+
+        invoice = invoice_factory(customer_vat_id='SK1234567890')
+        for i in range(items_count):
+            item_factory(invoice=invoice, title=f'Item {i}', discount=Decimal(i % 3), tax_rate=None if i % 2 else Decimal('20.0'))
+        return invoice
+
+    def test_query_budget(self, invoice_factory, item_factory):
+        """Test rendering takes constant number of queries regardless of item count."""
+        small = self._create_invoice(invoice_factory, item_factory, 1)
+        large = self._create_invoice(invoice_factory, item_factory, 20)
+
+        small_response, small_queries = self._render(small.pk)
+        large_response, large_queries = self._render(large.pk)
+
+        # items and VAT summary
+        assert small_queries <= 2
+        assert large_queries == small_queries
+        assert large_response.content.count(b'Item ') == 20
+
+    def test_context(self, invoice_factory, item_factory):
+        """Test precomputed context matches invoice properties."""
+        invoice = self._create_invoice(invoice_factory, item_factory, 3)
+        data = HTMLFormatter(invoice).get_data()
+
+        assert data['items'] == list(invoice.item_set.all())
+        assert data['subtotal'] == invoice.subtotal
+        assert data['has_discount'] is True
+        assert data['discount'] == invoice.discount
+        assert data['total_before_discount'] == invoice.total_before_discount
+        assert data['discount_percentage'] == invoice.discount_percentage
+
+
 @pytest.mark.django_db
 @pytest.mark.unit
 class TestBootstrapHTMLFormatter:
@@ -69,3 +123,118 @@ class TestBootstrapHTMLFormatter:
         
         assert isinstance(response, HttpResponse)
 
+
+@pytest.mark.django_db
+@pytest.mark.unit
+class TestPDFFormatter:
+    """Tests for PDFFormatter."""
+
+    def test_content_type(self):
+        """Test formatters declare content type of their output."""
+        assert PDFFormatter.content_type == 'application/pdf'
+        assert HTMLFormatter.content_type == 'text/html'
+
+    def test_get_content(self, invoice_factory, item_factory):
+        """Test PDF document generation with embedded font."""
+        invoice = invoice_factory()
+        item_factory(invoice=invoice, title='Consulting')
+        content = PDFFormatter(invoice).get_content()
+
+        assert content.startswith(b'%PDF')
+        assert content.rstrip().endswith(b'%%EOF')
+        assert b'/Count 1' in content
+        assert b'/FontFile2' in content
+        assert b'DejaVuSans' in content
+
+    def test_text_is_kept(self, invoice_factory, item_factory):
+        """Test characters out of Latin-1 aren't replaced."""
+        invoice = invoice_factory(customer_name='Ľubomír Ďurčo (s.r.o.)', customer_city='Košice')
+        item_factory(invoice=invoice, title='Služby – ĺ, ŕ, ľ')
+        formatter = PDFFormatter(invoice)
+        pages = formatter.paginate(formatter.get_rows(formatter.get_data()), formatter.get_fonts())
+
+        texts = [text for page in pages for x, y, size, bold, text in page]
+
+        assert 'Ľubomír Ďurčo (s.r.o.)' in texts
+        assert 'Služby – ĺ, ŕ, ľ' in texts
+
+    def test_long_text_is_wrapped(self, invoice_factory, item_factory):
+        """Test long texts are wrapped to the width of their column."""
+        from reportlab.pdfbase.pdfmetrics import stringWidth
+
+        title = ' '.join(['Consulting'] * 30)
+        invoice = invoice_factory()
+        item_factory(invoice=invoice, title=title)
+        formatter = PDFFormatter(invoice)
+        fonts = formatter.get_fonts()
+        description, quantity = formatter.columns[:2]
+
+        pages = formatter.paginate(formatter.get_rows(formatter.get_data()), fonts)
+        title_runs = [run for run in pages[0] if run[0] == description and run[4].startswith('Consulting')]
+
+        assert len(title_runs) > 1
+        assert ' '.join(run[4] for run in title_runs) == title
+        assert all(stringWidth(run[4], fonts[0], run[2]) <= quantity - description for run in title_runs)
+
+    def test_missing_glyphs(self, invoice_factory, item_factory, caplog):
+        """Test characters missing in font are replaced with a warning, the invoice is still rendered."""
+        invoice = invoice_factory(customer_name='Zákazník 中')
+        formatter = PDFFormatter(invoice)
+        pages = formatter.paginate(formatter.get_rows(formatter.get_data()), formatter.get_fonts())
+
+        texts = [text for page in pages for x, y, size, bold, text in page]
+
+        assert 'Zákazník \ufffd' in texts
+        assert '中' in caplog.text
+        assert PDFFormatter(invoice).get_content().startswith(b'%PDF')
+
+    def test_missing_font(self, settings, invoice_factory):
+        """Test font file which can't be loaded."""
+        settings.INVOICING_PDF_FONT = '/nonexistent/font.ttf'
+
+        with pytest.raises(ImproperlyConfigured):
+            PDFFormatter(invoice_factory()).get_content()
+
+    def test_font_found_in_font_dirs(self, settings, tmp_path, monkeypatch):
+        """Test default fonts are looked up in font directories."""
+        from invoicing.formatters import pdf
+
+        (tmp_path / 'dejavu').mkdir()
+        for file_name in [pdf.DEFAULT_FONT, pdf.DEFAULT_FONT_BOLD]:
+            (tmp_path / 'dejavu' / file_name).write_bytes(b'')
+        monkeypatch.setattr(pdf, 'FONT_DIRS', ('/nonexistent', str(tmp_path)))
+        pdf.find_font.cache_clear()
+
+        try:
+            assert pdf.get_font_paths() == [
+                str(tmp_path / 'dejavu' / pdf.DEFAULT_FONT), str(tmp_path / 'dejavu' / pdf.DEFAULT_FONT_BOLD)]
+        finally:
+            pdf.find_font.cache_clear()
+
+    def test_fonts_checked_on_startup(self, settings):
+        """Test missing font of configured PDFFormatter is reported on startup."""
+        from django.apps import apps
+
+        settings.INVOICING_FORMATTER = 'invoicing.formatters.pdf.PDFFormatter'
+        settings.INVOICING_PDF_FONT_BOLD = '/nonexistent/font.ttf'
+
+        with pytest.raises(ImproperlyConfigured):
+            apps.get_app_config('invoicing').ready()
+
+    def test_pagination(self, invoice_factory, item_factory):
+        """Test long invoices are split into multiple pages."""
+        invoice = invoice_factory()
+        for i in range(80):
+            item_factory(invoice=invoice, title=f'Item {i}')
+
+        content = PDFFormatter(invoice).get_content()
+
+        assert b'/Count 2' in content
+
+    def test_get_response(self, invoice_factory):
+        """Test response generation."""
+        invoice = invoice_factory()
+        response = PDFFormatter(invoice).get_response()
+
+        assert response['Content-Type'] == 'application/pdf'
+        assert response.content.startswith(b'%PDF')
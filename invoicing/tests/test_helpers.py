@@ -1,13 +1,15 @@
 """
 Tests for helper functions.
 """
+import io
+
 import pytest
 from datetime import date
 from django.core.exceptions import ImproperlyConfigured
 from django.test import override_settings
 
-from invoicing.helpers import sequence_generator, number_formatter
-from invoicing.models import Invoice
+from invoicing.helpers import sequence_generator, counter_sequence_generator, number_formatter
+from invoicing.models import Invoice, SequenceCounter
 
 
 @pytest.mark.django_db
@@ -173,6 +175,68 @@ class TestSequenceGenerator:
             )
 
 
+@pytest.mark.django_db
+@pytest.mark.unit
+class TestCounterSequenceGenerator:
+    """Tests for counter_sequence_generator function."""
+
+    @pytest.fixture(autouse=True)
+    def counter_generator(self, settings):
+        settings.INVOICING_SEQUENCE_GENERATOR = 'invoicing.helpers.counter_sequence_generator'
+        settings.INVOICING_COUNTER_PERIOD = 'YEARLY'
+        return settings
+
+    def test_sequences_are_consecutive(self, invoice_factory):
+        """Test invoices get consecutive sequences from the counter."""
+        invoices = [invoice_factory(sequence=None, number=None, date_issue=date(2024, 3, 1)) for _ in range(3)]
+
+        assert [invoice.sequence for invoice in invoices] == [1, 2, 3]
+        assert SequenceCounter.objects.get(period='2024', type='', number_prefix='').value == 3
+
+    def test_counter_is_seeded_from_existing_invoices(self, invoice_factory):
+        """Test missing counter continues after existing invoices."""
+        invoice_factory(sequence=41, date_issue=date(2024, 3, 1))
+
+        sequence = counter_sequence_generator(type=None, important_date=date(2024, 5, 1))
+
+        assert sequence == 42
+
+    def test_counters_per_period_and_prefix(self, invoice_factory):
+        """Test periods and number prefixes use separate counters."""
+        assert counter_sequence_generator(type=None, important_date=date(2024, 1, 1)) == 1
+        assert counter_sequence_generator(type=None, important_date=date(2025, 1, 1)) == 1
+        assert counter_sequence_generator(type=None, important_date=date(2024, 1, 1), number_prefix='X') == 1
+        assert counter_sequence_generator(type=None, important_date=date(2024, 12, 31)) == 2
+
+    @override_settings(INVOICING_COUNTER_PER_TYPE=True)
+    def test_counter_per_type(self):
+        """Test types use separate counters when INVOICING_COUNTER_PER_TYPE is enabled."""
+        assert counter_sequence_generator(type=Invoice.TYPE.INVOICE, important_date=date(2024, 1, 1)) == 1
+        assert counter_sequence_generator(type=Invoice.TYPE.CREDIT_NOTE, important_date=date(2024, 1, 1)) == 1
+        assert counter_sequence_generator(type=Invoice.TYPE.INVOICE, important_date=date(2024, 1, 1)) == 2
+
+    def test_improperly_configured(self):
+        """Test invalid counter period."""
+        with pytest.raises(ImproperlyConfigured):
+            counter_sequence_generator(type=None, important_date=date.today(), counter_period='INVALID')
+
+    def test_seed_command(self, invoice_factory):
+        """Test management command seeds counters from existing invoices."""
+        from django.core.management import call_command
+
+        invoice_factory(sequence=5, number='A-5', date_issue=date(2023, 6, 1))
+        invoice_factory(sequence=7, number='A-7', date_issue=date(2023, 7, 1))
+        invoice_factory(sequence=3, number='B-3', date_issue=date(2024, 1, 1))
+        SequenceCounter.objects.create(period='2024', value=10)
+
+        call_command('seed_invoice_counters', number_prefixes=['A-'], stdout=io.StringIO())
+
+        assert SequenceCounter.objects.get(period='2023', number_prefix='').value == 7
+        assert SequenceCounter.objects.get(period='2023', number_prefix='A-').value == 7
+        assert SequenceCounter.objects.get(period='2024', number_prefix='').value == 10
+        assert not SequenceCounter.objects.filter(period='2024', number_prefix='A-').exists()
+
+
 @pytest.mark.django_db
 @pytest.mark.unit
 class TestNumberFormatter:
@@ -211,3 +275,43 @@ class TestNumberFormatter:
         
         assert '123' in number
 
+    @pytest.mark.parametrize('number_format', [
+        "{{ invoice.date_issue|date:'Y' }}/{{ invoice.sequence }}",
+        "{{ invoice.date_issue|date:'y' }}{{ invoice.date_issue|date:'m' }}-{{ invoice.sequence|stringformat:'04d' }}",
+        'INV-{{invoice.date_tax_point|date:"Ymd"}}-{{ invoice.sequence|stringformat:"06d" }}',
+        "<{{ invoice.sequence }}>",
+    ])
+    def test_number_formatter_fast_path(self, invoice_factory, number_format):
+        """Test compiled formatter renders the same number as the template."""
+        from django.template import Context, Template
+        from invoicing.helpers import compile_number_format
+
+        invoice = invoice_factory(date_issue=date(2024, 3, 5), date_tax_point=date(2024, 3, 4), sequence=1234)
+        formatter = compile_number_format(number_format)
+
+        assert formatter is not None
+        assert formatter(invoice) == Template(number_format).render(Context({'invoice': invoice}))
+
+    @pytest.mark.parametrize('number_format', [
+        "{{ invoice.sequence }}-{{ invoice.type }}",
+        "{{ invoice.date_issue|date:'Y' }}/{{ invoice.sequence|add:'1' }}",
+        "{% if invoice.sequence %}{{ invoice.sequence }}{% endif %}",
+        "{{ invoice.sequence | stringformat:'03d' }}",
+    ])
+    def test_number_formatter_fast_path_unsupported(self, number_format):
+        """Test formats with other template syntax are left to the template engine."""
+        from invoicing.helpers import compile_number_format
+
+        assert compile_number_format(number_format) is None
+
+    @override_settings(INVOICING_NUMBER_FORMAT="{{ invoice.sequence|add:'1' }}")
+    def test_number_formatter_caches_template(self, invoice_factory):
+        """Test template of the format is compiled only once."""
+        from invoicing.helpers import get_number_template
+
+        invoice = invoice_factory(sequence=7)
+        get_number_template.cache_clear()
+
+        assert number_formatter(invoice) == '8'
+        assert number_formatter(invoice) == '8'
+        assert get_number_template.cache_info().misses == 1
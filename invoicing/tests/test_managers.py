@@ -2,7 +2,12 @@
 Tests for manager classes.
 """
 import builtins
+import json
+import threading
+import time
 import pytest
+import requests
+import responses
 from decimal import Decimal
 from unittest.mock import Mock, MagicMock, patch
 
@@ -275,39 +280,36 @@ class TestIKrosManager:
         with pytest.raises((builtins.EnvironmentError, ImproperlyConfigured, AttributeError)):
             manager.export_via_api(request, queryset)
 
-    @patch('invoicing.exporters.ikros.managers.requests.post')
-    def test_export_via_api_success(self, mock_post, invoice_factory, item_factory, settings):
-        """Test successful API export."""
+    def test_export_via_api_queued(self, invoice_factory, item_factory):
+        """Test IKROS API export queues send_invoices_to_ikros task."""
+        import invoicing.exporters.ikros.tasks as ikros_tasks
+
         invoicing_settings.INVOICING_MANAGERS = {
             'invoicing.exporters.ikros.managers.IKrosManager': {
                 'API_URL': 'https://api.example.com',
                 'API_KEY': 'test-key'
             }
         }
-        
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = {
-            'documents': [{'downloadUrl': 'https://example.com/file.pdf'}]
-        }
-        mock_post.return_value = mock_response
-        
+
+        mock_export = MagicMock()
+        mock_export.id = 99
+
         manager = IKrosManager()
         request = Mock()
         request.user = Mock()
-        messages = Mock()
-        request._messages = messages
-        
+        request.user.id = 1
+        request.GET = {}
+
         invoice = invoice_factory()
         item_factory(invoice=invoice, quantity=Decimal('1.0'), unit_price=Decimal('100.00'))
-        
+
         queryset = Invoice.objects.filter(id=invoice.id)
-        
-        result = manager.export_via_api(request, queryset)
 
-        # In the test environment we mainly care that the call succeeds and
-        # returns some value; the low-level HTTP call is mocked elsewhere.
-        assert isinstance(result, (str, type(None)))
+        with patch.object(ikros_tasks, 'send_invoices_to_ikros') as mock_task, \
+                patch('outputs.mixins.ExporterMixin.save_export', return_value=mock_export):
+            manager.export_via_api(request, queryset)
+
+        mock_task.delay.assert_called_once_with(mock_export.id, manager)
 
 
 @pytest.mark.django_db
@@ -345,9 +347,10 @@ class TestProfit365Manager:
         with pytest.raises((builtins.EnvironmentError, ImproperlyConfigured, AttributeError)):
             manager.export_via_api(request, queryset)
 
-    @patch('invoicing.exporters.profit365.managers.requests.post')
-    def test_export_via_api_success(self, mock_post, invoice_factory, item_factory, settings):
-        """Test successful API export."""
+    def test_export_via_api_queued(self, invoice_factory, item_factory):
+        """Test Profit365 API export queues send_invoices_to_profit365 task."""
+        import invoicing.exporters.profit365.tasks as profit365_tasks
+
         invoicing_settings.INVOICING_MANAGERS = {
             'invoicing.exporters.profit365.managers.Profit365Manager': {
                 'API_URL': 'https://api.example.com',
@@ -359,25 +362,101 @@ class TestProfit365Manager:
                 }
             }
         }
-        
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.reason = 'OK'
-        mock_post.return_value = mock_response
-        
+
+        mock_export = MagicMock()
+        mock_export.id = 99
+
         manager = Profit365Manager()
         request = Mock()
         request.user = Mock()
-        
+        request.user.id = 1
+        request.GET = {}
+
         invoice = invoice_factory()
         item_factory(invoice=invoice, quantity=Decimal('1.0'), unit_price=Decimal('100.00'))
-        
+
         queryset = Invoice.objects.filter(id=invoice.id)
-        
-        result = manager.export_via_api(request, queryset)
-        
-        assert mock_post.called
-        assert isinstance(result, list)
+
+        with patch.object(profit365_tasks, 'send_invoices_to_profit365') as mock_task, \
+                patch('outputs.mixins.ExporterMixin.save_export', return_value=mock_export):
+            manager.export_via_api(request, queryset)
+
+        mock_task.delay.assert_called_once_with(mock_export.id, manager)
+
+    @responses.activate
+    def test_send_invoices_concurrently(self, invoice_factory, item_factory):
+        """Invoices are sent one per request by a pool of CONCURRENCY threads and all results are collected."""
+        invoicing_settings.INVOICING_MANAGERS = {
+            'invoicing.exporters.profit365.managers.Profit365Manager': {
+                'API_URL': 'https://api.example.com',
+                'API_DATA': {
+                    'Authorization': 'Bearer token',
+                    'ClientID': 'client-id',
+                    'ClientSecret': 'client-secret',
+                    'CompanyID': 'company-id',
+                    'bankAccountId': 'account-id'
+                },
+                'CONCURRENCY': 3,
+                'TIMEOUT': 5,
+            }
+        }
+        lock = threading.Lock()
+        state = {'active': 0, 'max_active': 0}
+
+        def callback(request):
+            with lock:
+                state['active'] += 1
+                state['max_active'] = max(state['max_active'], state['active'])
+
+            time.sleep(0.05)
+
+            with lock:
+                state['active'] -= 1
+
+            if json.loads(request.body)['recordNumber'] == failing.number:
+                return 400, {}, 'Bad Request'
+
+            assert request.headers['CompanyID'] == 'company-id'
+            assert request.req_kwargs['timeout'] == 5
+            return 200, {}, '{}'
+
+        responses.add_callback(responses.POST, 'https://api.example.com/sales/invoices', callback=callback)
+
+        invoices = [invoice_factory() for _ in range(6)]
+        for invoice in invoices:
+            item_factory(invoice=invoice, quantity=Decimal('1.0'), unit_price=Decimal('100.00'))
+        failing = invoices[2]
+
+        results = Profit365Manager().send_invoices(Invoice.objects.all())
+
+        assert len(responses.calls) == 6
+        assert 1 < state['max_active'] <= 3
+        assert sorted(r['invoice'] for r in results) == sorted(invoice.number for invoice in invoices)
+        assert [r['invoice'] for r in results if r['status_code'] != 200] == [failing.number]
+
+    @responses.activate
+    def test_send_invoices_request_error(self, invoice_factory):
+        """Request errors are collected as results with no status code."""
+        invoicing_settings.INVOICING_MANAGERS = {
+            'invoicing.exporters.profit365.managers.Profit365Manager': {
+                'API_URL': 'https://api.example.com',
+                'API_DATA': {
+                    'Authorization': 'Bearer token',
+                    'ClientID': 'client-id',
+                    'ClientSecret': 'client-secret',
+                    'bankAccountId': 'account-id'
+                },
+            }
+        }
+        responses.add(
+            responses.POST, 'https://api.example.com/sales/invoices',
+            body=requests.exceptions.ConnectTimeout('Timed out')
+        )
+        invoice = invoice_factory()
+
+        results = Profit365Manager().send_invoices(Invoice.objects.all())
+
+        assert results == [{'invoice': invoice.number, 'invoice_id': invoice.id, 'status_code': None, 'reason': 'Timed out'}]
 
 
 @pytest.mark.django_db
@@ -5,7 +5,7 @@ import pytest
 from decimal import Decimal
 from datetime import date, timedelta
 
-from invoicing.models import Invoice
+from invoicing.models import Invoice, Item
 
 
 @pytest.mark.django_db
@@ -492,3 +492,350 @@ class TestItem:
         # Tax rate should be set from invoice
         assert item.tax_rate is not None
 
+
+@pytest.mark.django_db
+@pytest.mark.models
+class TestDeferredRecalculation:
+    """Tests for batched recalculation of invoice totals."""
+
+    def test_totals_recalculated_once_on_exit(self, invoice_factory, item_factory):
+        """Test totals are stored only after the block exits."""
+        invoice = invoice_factory()
+
+        with Invoice.deferred_recalculation():
+            for _ in range(3):
+                item_factory(invoice=invoice, unit_price=Decimal('100.00'), tax_rate=Decimal('20.0'))
+
+            invoice.refresh_from_db()
+            assert invoice.total == Decimal('0.00')
+
+        invoice.refresh_from_db()
+        assert invoice.total == Decimal('360.00')
+        assert invoice.vat == Decimal('60.00')
+
+    def test_nested_blocks(self, invoice_factory, item_factory):
+        """Test only the outermost block recalculates."""
+        invoice = invoice_factory()
+
+        with Invoice.deferred_recalculation():
+            with Invoice.deferred_recalculation():
+                item_factory(invoice=invoice, unit_price=Decimal('100.00'), tax_rate=None)
+
+            invoice.refresh_from_db()
+            assert invoice.total == Decimal('0.00')
+
+        invoice.refresh_from_db()
+        assert invoice.total == Decimal('100.00')
+
+    def test_item_delete(self, sample_invoice):
+        """Test deleted items are reflected after the block exits."""
+        with Invoice.deferred_recalculation():
+            sample_invoice.item_set.all().delete()
+
+        sample_invoice.refresh_from_db()
+        assert sample_invoice.total == Decimal('0.00')
+
+    def test_deleted_invoice_is_skipped(self, sample_invoice):
+        """Test invoice deleted within the block does not break recalculation."""
+        with Invoice.deferred_recalculation():
+            sample_invoice.delete()
+
+        assert not Invoice.objects.filter(number=sample_invoice.number).exists()
+
+    def test_bulk_create_items(self, invoice_factory):
+        """Test bulk creation of items recalculates totals once."""
+        from invoicing.models import Item
+
+        invoice = invoice_factory()
+        items = invoice.bulk_create_items([
+            Item(title=f'Item {i}', quantity=Decimal('2.0'), unit_price=Decimal('10.00'), tax_rate=Decimal('20.0'))
+            for i in range(5)
+        ])
+
+        assert len(items) == 5
+        assert all(item.pk for item in items)
+        invoice.refresh_from_db()
+        assert invoice.total == Decimal('120.00')
+        assert invoice.vat == Decimal('20.00')
+
+    def test_bulk_create_items_checks_tax_rate(self, invoice_factory):
+        """Test bulk creation refuses taxed items without supplier VAT ID."""
+        from invoicing.models import Item
+
+        invoice = invoice_factory(supplier_vat_id='')
+
+        with pytest.raises(ValueError):
+            invoice.bulk_create_items([Item(title='Item', unit_price=Decimal('10.00'), tax_rate=Decimal('20.0'))])
+
+        assert invoice.item_set.count() == 0
+
+
+def _count_item_queries(queries):
+    return len([query for query in queries if 'invoicing_items' in query['sql']])
+
+
+@pytest.mark.django_db
+@pytest.mark.models
+class TestVatSummaryCache:
+    """Tests for memoized VAT breakdown."""
+
+    def test_calculations_share_one_query(self, sample_invoice):
+        """Test calculate_vat and calculate_total reuse single aggregate query."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        invoice = Invoice.objects.get(pk=sample_invoice.pk)
+
+        with CaptureQueriesContext(connection) as context:
+            invoice.calculate_total()
+            invoice.calculate_vat()
+            invoice.vat_summary
+
+        assert _count_item_queries(context.captured_queries) == 1
+
+    def test_item_save_runs_one_aggregate_query(self, sample_invoice, item_factory):
+        """Test saving an item recalculates the invoice with one aggregate query."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as context:
+            item_factory(invoice=sample_invoice, unit_price=Decimal('10.00'), tax_rate=None)
+
+        # insert of the item and one aggregate query
+        assert _count_item_queries(context.captured_queries) == 2
+        assert sample_invoice.total == Decimal('250.00')
+
+    def test_invalidated_by_item_change(self, sample_invoice, item_factory):
+        """Test memoized summary is dropped when items of the same instance change."""
+        assert len(sample_invoice.vat_summary) == 1
+
+        item_factory(invoice=sample_invoice, unit_price=Decimal('10.00'), tax_rate=None)
+
+        assert len(sample_invoice.vat_summary) == 2
+
+    def test_invalidated_by_refresh_from_db(self, sample_invoice):
+        """Test refresh_from_db drops memoized summary."""
+        assert len(sample_invoice.vat_summary) == 1
+
+        sample_invoice.item_set.all().update(tax_rate=None)
+        sample_invoice.refresh_from_db()
+
+        assert sample_invoice.vat_summary[0]['vat'] is None
+
+    def test_invalidated_by_recalculation_on_save(self, invoice_factory):
+        """Test recalculation on save doesn't reuse summary outdated by items saved via other instances."""
+        invoice = invoice_factory()
+        assert invoice.vat_summary == []
+
+        Item.objects.create(invoice_id=invoice.pk, title='Item', unit_price=Decimal('50.00'), tax_rate=None)
+        invoice.credit = Decimal('5.00')
+        invoice.save()
+
+        invoice.refresh_from_db()
+        assert invoice.total == Decimal('45.00')
+
+    def test_unsaved_invoice(self):
+        """Test unsaved invoice does not query items."""
+        invoice = Invoice(credit=Decimal('10.00'))
+        assert invoice.vat_summary == []
+        assert invoice.calculate_total() == Decimal('-10.00')
+
+
+@pytest.mark.django_db
+@pytest.mark.models
+class TestTotalsRecalculationOnSave:
+    """Tests for skipping recalculation of totals on invoice saves."""
+
+    def test_status_update_skips_recalculation(self, sample_invoice):
+        """Test status-only save doesn't query items."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        invoice = Invoice.objects.get(pk=sample_invoice.pk)
+        invoice.status = Invoice.STATUS.PAID
+
+        with CaptureQueriesContext(connection) as context:
+            invoice.save(update_fields=['status'])
+
+        assert _count_item_queries(context.captured_queries) == 0
+
+    def test_full_save_skips_recalculation(self, sample_invoice):
+        """Test full save without changed credit doesn't query items."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        invoice = Invoice.objects.get(pk=sample_invoice.pk)
+        invoice.status = Invoice.STATUS.SENT
+
+        with CaptureQueriesContext(connection) as context:
+            invoice.save()
+
+        assert _count_item_queries(context.captured_queries) == 0
+        invoice.refresh_from_db()
+        assert invoice.status == Invoice.STATUS.SENT
+        assert invoice.total == sample_invoice.total
+
+    def test_full_save_keeps_django_semantics(self, sample_invoice):
+        """Test full save passes no update_fields, so deleted invoice is inserted again."""
+        from django.db.models.signals import post_save
+
+        invoice = Invoice.objects.get(pk=sample_invoice.pk)
+        Invoice.objects.filter(pk=invoice.pk).delete()
+        saved_update_fields = []
+
+        def receiver(update_fields, **kwargs):
+            saved_update_fields.append(update_fields)
+
+        post_save.connect(receiver, sender=Invoice)
+        try:
+            invoice.save()
+        finally:
+            post_save.disconnect(receiver, sender=Invoice)
+
+        assert saved_update_fields == [None]
+        assert Invoice.objects.filter(pk=invoice.pk).exists()
+
+    def test_credit_change_recalculates(self, sample_invoice):
+        """Test changed credit recalculates totals."""
+        invoice = Invoice.objects.get(pk=sample_invoice.pk)
+        invoice.credit = Decimal('20.00')
+        invoice.save()
+
+        invoice.refresh_from_db()
+        assert invoice.total == sample_invoice.total - Decimal('20.00')
+
+    def test_credit_in_update_fields_recalculates(self, sample_invoice):
+        """Test credit in update_fields stores recalculated totals too."""
+        invoice = Invoice.objects.get(pk=sample_invoice.pk)
+        invoice.credit = Decimal('20.00')
+        invoice.save(update_fields=['credit'])
+
+        invoice.refresh_from_db()
+        assert invoice.total == sample_invoice.total - Decimal('20.00')
+
+    def test_explicit_recalculation(self, sample_invoice):
+        """Test recalculation can be requested explicitly."""
+        sample_invoice.item_set.all().update(unit_price=Decimal('10.00'))
+
+        invoice = Invoice.objects.get(pk=sample_invoice.pk)
+        invoice.save(recalculate_totals=True)
+
+        invoice.refresh_from_db()
+        assert invoice.total == Decimal('36.00')
+
+    def test_item_change_ignores_prefetched_items(self, invoice_factory, item_factory):
+        """Test totals aren't recalculated from outdated prefetched items."""
+        invoice = invoice_factory()
+        item_factory(invoice=invoice, unit_price=Decimal('100.00'), tax_rate=None)
+        invoice = Invoice.objects.prefetch_related('item_set').get(pk=invoice.pk)
+
+        Item.objects.create(invoice=invoice, title='Item', unit_price=Decimal('50.00'), tax_rate=None)
+
+        assert invoice.total == Decimal('150.00')
+        invoice.refresh_from_db()
+        assert invoice.total == Decimal('150.00')
+
+    def test_explicit_recalculation_ignores_prefetched_items(self, sample_invoice):
+        """Test explicit recalculation after queryset update ignores prefetched items."""
+        invoice = Invoice.objects.prefetch_related('item_set').get(pk=sample_invoice.pk)
+
+        Item.objects.filter(invoice=sample_invoice).update(unit_price=Decimal('10.00'))
+        invoice.save(recalculate_totals=True)
+
+        invoice.refresh_from_db()
+        assert invoice.total == Decimal('36.00')
+
+    def test_explicit_recalculation_drops_memoized_summary(self, sample_invoice):
+        """Test explicit recalculation doesn't reuse already computed summary."""
+        invoice = Invoice.objects.get(pk=sample_invoice.pk)
+        invoice.vat_summary
+
+        invoice.item_set.update(unit_price=Decimal('10.00'))
+        invoice.save(recalculate_totals=True)
+
+        assert invoice.total == Decimal('36.00')
+        invoice.refresh_from_db()
+        assert invoice.total == Decimal('36.00')
+
+    def test_new_invoice_totals(self, invoice_factory):
+        """Test new invoice gets totals without querying items."""
+        invoice = invoice_factory(total=Decimal('99.00'), credit=Decimal('10.00'))
+        assert invoice.total == Decimal('-10.00')
+        assert invoice.vat == 0
+
+
+@pytest.mark.django_db
+@pytest.mark.models
+class TestItemAggregates:
+    """Tests for prefetch-aware and annotated item aggregates."""
+
+    PROPERTIES = ['has_discount', 'has_unit', 'max_quantity', 'sum_quantity', 'all_items_with_single_quantity']
+
+    @pytest.fixture
+    def invoices(self, invoice_factory, item_factory):
+        from invoicing.models import Item
+
+        with_discount = invoice_factory()
+        item_factory(invoice=with_discount, quantity=Decimal('2.0'), discount=Decimal('10.0'), unit=Item.UNIT_EMPTY)
+        item_factory(invoice=with_discount, quantity=Decimal('3.5'))
+
+        single = invoice_factory()
+        item_factory(invoice=single, unit=Item.UNIT_EMPTY)
+        item_factory(invoice=single, unit=Item.UNIT_EMPTY)
+
+        empty = invoice_factory()
+
+        return [with_discount, single, empty]
+
+    def _values(self, invoice):
+        return {name: getattr(invoice, name) for name in self.PROPERTIES}
+
+    def test_values(self, invoices):
+        """Test aggregates computed by a query."""
+        with_discount, single, empty = [Invoice.objects.get(pk=invoice.pk) for invoice in invoices]
+
+        assert self._values(with_discount) == {
+            'has_discount': True, 'has_unit': True, 'max_quantity': Decimal('3.5'),
+            'sum_quantity': Decimal('5.5'), 'all_items_with_single_quantity': False}
+        assert self._values(single) == {
+            'has_discount': False, 'has_unit': False, 'max_quantity': Decimal('1'),
+            'sum_quantity': Decimal('2'), 'all_items_with_single_quantity': True}
+        assert self._values(empty) == {
+            'has_discount': False, 'has_unit': False, 'max_quantity': None,
+            'sum_quantity': 0, 'all_items_with_single_quantity': True}
+
+    def test_single_query_without_prefetch(self, invoices, django_assert_num_queries):
+        """Test all properties share single aggregate query."""
+        invoice = Invoice.objects.get(pk=invoices[0].pk)
+
+        with django_assert_num_queries(1):
+            self._values(invoice)
+
+    def test_prefetched_items(self, invoices, django_assert_num_queries):
+        """Test prefetched items are aggregated without queries."""
+        expected = [self._values(Invoice.objects.get(pk=invoice.pk)) for invoice in invoices]
+        prefetched = list(Invoice.objects.filter(pk__in=[invoice.pk for invoice in invoices]).order_by('pk').prefetch_related('item_set'))
+
+        with django_assert_num_queries(0):
+            assert [self._values(invoice) for invoice in prefetched] == expected
+
+    def test_with_item_aggregates(self, invoices, django_assert_num_queries):
+        """Test annotated aggregates are used without queries."""
+        expected = [self._values(Invoice.objects.get(pk=invoice.pk)) for invoice in invoices]
+        annotated = list(Invoice.objects.filter(pk__in=[invoice.pk for invoice in invoices]).order_by('pk').with_item_aggregates())
+
+        with django_assert_num_queries(0):
+            assert [self._values(invoice) for invoice in annotated] == expected
+
+    def test_with_item_aggregates_and_other_joins(self, invoices):
+        """Test annotated aggregates aren't multiplied by other multi-valued joins."""
+        expected = self._values(Invoice.objects.get(pk=invoices[0].pk))
+        annotated = Invoice.objects \
+            .filter(pk=invoices[0].pk) \
+            .with_item_aggregates() \
+            .filter(item__quantity__gt=0) \
+            .distinct() \
+            .get()
+
+        assert annotated.item_count == 2
+        assert self._values(annotated) == expected
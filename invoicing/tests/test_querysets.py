@@ -3,7 +3,8 @@ Tests for InvoiceQuerySet and ItemQuerySet.
 """
 import pytest
 from decimal import Decimal
-from datetime import timedelta
+from datetime import date, timedelta
+from django.db.transaction import TransactionManagementError
 from django.utils.timezone import now
 
 from invoicing.models import Invoice, Item
@@ -329,6 +330,165 @@ class TestInvoiceQuerySet:
         assert invoice2 in result
 
 
+@pytest.mark.django_db
+@pytest.mark.querysets
+class TestAnnotateOverdue:
+    """Tests for annotate_overdue."""
+
+    def test_annotations_match_properties(self, invoice_factory, item_factory):
+        """Test annotated values equal Invoice.is_overdue and Invoice.overdue_days."""
+        today = now().date()
+        variants = [
+            {'date_due': today - timedelta(days=10)},
+            {'date_due': today + timedelta(days=5)},
+            {'date_due': today},
+            {'date_due': today - timedelta(days=3), 'status': Invoice.STATUS.PAID},
+            {'date_due': today - timedelta(days=3), 'type': Invoice.TYPE.CREDIT_NOTE},
+        ]
+
+        for kwargs in variants:
+            invoice = invoice_factory(status=kwargs.pop('status', Invoice.STATUS.SENT), **kwargs)
+            item_factory(invoice=invoice)
+
+        # zero total
+        invoice_factory(date_due=today - timedelta(days=10))
+
+        for invoice in Invoice.objects.annotate_overdue():
+            assert invoice.annotated_is_overdue == invoice.is_overdue
+            assert invoice.annotated_overdue_days == invoice.overdue_days
+            assert isinstance(invoice.annotated_overdue_days, int)
+
+    def test_filter_by_annotation(self, invoice_factory, item_factory):
+        """Test annotation can be used to filter overdue invoices."""
+        overdue = invoice_factory(status=Invoice.STATUS.SENT, date_due=now().date() - timedelta(days=1))
+        item_factory(invoice=overdue)
+        not_overdue = invoice_factory(status=Invoice.STATUS.SENT)
+        item_factory(invoice=not_overdue)
+
+        invoices = Invoice.objects.annotate_overdue().filter(annotated_is_overdue=True)
+
+        assert list(invoices) == list(Invoice.objects.overdue())
+        assert list(invoices) == [overdue]
+
+
+@pytest.mark.django_db
+@pytest.mark.querysets
+class TestCounterPeriodLookups:
+    """Tests for in_counter_period and max_sequence."""
+
+    @pytest.fixture
+    def invoices(self, invoice_factory):
+        return [
+            invoice_factory(sequence=1, date_issue=date(2023, 12, 31)),
+            invoice_factory(sequence=5, date_issue=date(2024, 1, 10)),
+            invoice_factory(sequence=7, date_issue=date(2024, 1, 11)),
+            invoice_factory(sequence=9, date_issue=date(2024, 2, 1)),
+        ]
+
+    @pytest.mark.parametrize('counter_period, expected', [
+        (Invoice.COUNTER_PERIOD.DAILY, 5),
+        (Invoice.COUNTER_PERIOD.MONTHLY, 7),
+        (Invoice.COUNTER_PERIOD.YEARLY, 9),
+        (Invoice.COUNTER_PERIOD.INFINITE, 9),
+    ])
+    def test_max_sequence_in_counter_period(self, invoices, counter_period, expected):
+        """Test highest sequence of every counter period."""
+        invoices = Invoice.objects.in_counter_period(date(2024, 1, 10), counter_period)
+        assert invoices.max_sequence() == expected
+
+    def test_max_sequence_empty(self, invoices):
+        """Test empty period has no sequence."""
+        assert Invoice.objects.in_counter_period(date(2022, 1, 1), Invoice.COUNTER_PERIOD.YEARLY).max_sequence() is None
+
+    def test_invalid_counter_period(self):
+        """Test invalid counter period."""
+        from django.core.exceptions import ImproperlyConfigured
+
+        with pytest.raises(ImproperlyConfigured):
+            Invoice.objects.in_counter_period(date(2024, 1, 1), 'WEEKLY')
+
+
+@pytest.mark.django_db
+@pytest.mark.querysets
+class TestSequenceReservation:
+    """Tests for reserve_sequences and bulk_issue."""
+
+    def _build_invoice(self, **kwargs):
+        defaults = {
+            'language': 'en',
+            'date_tax_point': kwargs['date_issue'],
+            'date_due': kwargs['date_issue'] + timedelta(days=14),
+            'currency': 'EUR',
+            'supplier_name': 'Test Supplier Ltd.',
+            'supplier_country': 'SK',
+            'customer_name': 'Test Customer Ltd.',
+            'customer_country': 'SK',
+            'payment_method': Invoice.PAYMENT_METHOD.BANK_TRANSFER,
+            'bank_iban': 'SK0000000000000000000028',
+        }
+        defaults.update(kwargs)
+        return Invoice(**defaults)
+
+    def test_reserve_sequences(self, invoice_factory, settings_yearly_counter):
+        """Test reserved range continues after existing invoices."""
+        invoice_factory(sequence=10, date_issue=date(2024, 1, 10))
+
+        sequences = Invoice.objects.reserve_sequences(5, type=Invoice.TYPE.INVOICE, important_date=date(2024, 2, 1))
+
+        assert sequences == range(11, 16)
+
+    def test_consecutive_reservations(self, invoice_factory, settings_yearly_counter):
+        """Test reserved ranges of one transaction don't overlap, not even with saved invoices."""
+        invoice_factory(sequence=1, date_issue=date(2024, 1, 10))
+
+        first = Invoice.objects.reserve_sequences(5, type=None, important_date=date(2024, 2, 1))
+        second = Invoice.objects.reserve_sequences(5, type=None, important_date=date(2024, 2, 1))
+        invoice = invoice_factory(date_issue=date(2024, 2, 1))
+
+        assert first == range(2, 7)
+        assert second == range(7, 12)
+        assert invoice.sequence == 12
+
+    @pytest.mark.django_db(transaction=True)
+    def test_reserve_sequences_requires_transaction(self, settings_yearly_counter):
+        """Test sequences aren't reserved outside of atomic block."""
+        with pytest.raises(TransactionManagementError):
+            Invoice.objects.reserve_sequences(5, type=Invoice.TYPE.INVOICE, important_date=date(2024, 2, 1))
+
+    def test_reserve_sequences_with_counter_generator(self, settings_yearly_counter):
+        """Test counter generator keeps reserved ranges apart."""
+        settings_yearly_counter.INVOICING_SEQUENCE_GENERATOR = 'invoicing.helpers.counter_sequence_generator'
+
+        first = Invoice.objects.reserve_sequences(3, type=None, important_date=date(2024, 2, 1))
+        second = Invoice.objects.reserve_sequences(2, type=None, important_date=date(2024, 2, 1))
+
+        assert first == range(1, 4)
+        assert second == range(4, 6)
+
+    def test_bulk_issue(self, invoice_factory, settings_override):
+        """Test bulk issue assigns consecutive sequences and numbers."""
+        invoice_factory(sequence=10, date_issue=date(2024, 1, 10))
+        invoices = [self._build_invoice(date_issue=date(2024, 1, day)) for day in [11, 11, 12]]
+
+        issued = Invoice.objects.bulk_issue(invoices)
+
+        assert [invoice.sequence for invoice in issued] == [11, 12, 13]
+        assert [invoice.number for invoice in issued] == ['2024/11', '2024/12', '2024/13']
+        assert all(invoice.pk for invoice in issued)
+        assert Invoice.objects.filter(date_issue__year=2024).count() == 4
+
+    def test_bulk_issue_keeps_preset_sequence(self, settings_override):
+        """Test invoices with sequence are inserted as they are."""
+        invoice = self._build_invoice(date_issue=date(2024, 1, 10), credit=Decimal('5.00'))
+        invoice.sequence = 99
+
+        issued, = Invoice.objects.bulk_issue([invoice])
+
+        assert issued.sequence == 99
+        assert issued.number == '2024/99'
+        assert issued.total == Decimal('-5.00')
+
+
 @pytest.mark.django_db
 @pytest.mark.querysets
 class TestItemQuerySet:
@@ -190,3 +190,99 @@ class TestEUTaxationPolicy:
             assert isinstance(rate, Decimal)
             assert rate >= Decimal(0)
 
+
+@pytest.mark.taxation
+class TestVIESCache:
+    """Tests for caching of VIES results in EUTaxationPolicy."""
+
+    def test_valid_vat_id_cached(self, vies_responder):
+        vies_responder.valid.add('CZ25596641')
+
+        assert EUTaxationPolicy.get_tax_rate('SK2020273893', 'CZ25596641') is None
+        assert EUTaxationPolicy.get_tax_rate('SK2020273893', 'CZ25596641') is None
+        assert vies_responder.requests == ['CZ25596641']
+
+    def test_invalid_vat_id_cached(self, vies_responder):
+        assert EUTaxationPolicy.get_tax_rate('SK2020273893', 'CZ25596641', date(2024, 1, 1)) == Decimal(20)
+        assert EUTaxationPolicy.get_tax_rate('SK2020273893', 'CZ25596641', date(2024, 1, 1)) == Decimal(20)
+        assert vies_responder.requests == ['CZ25596641']
+
+    def test_unconfirmed_result_not_cached(self, vies_responder):
+        vies_responder.unreachable = True
+
+        # unreachable VIES doesn't block reverse charge, but the result is checked again next time
+        assert EUTaxationPolicy.is_valid_in_VIES('CZ25596641') is True
+        assert EUTaxationPolicy.is_valid_in_VIES('CZ25596641') is True
+        assert len(vies_responder.requests) == 2
+
+    def test_separate_ttls(self, vies_responder, settings):
+        from unittest.mock import patch
+
+        settings.INVOICING_VIES_CACHE_TTL = 1000
+        settings.INVOICING_VIES_CACHE_NEGATIVE_TTL = 10
+        vies_responder.valid.add('CZ25596641')
+
+        with patch('django.core.cache.backends.locmem.LocMemCache.set') as cache_set:
+            EUTaxationPolicy.is_valid_in_VIES('CZ25596641')
+            EUTaxationPolicy.is_valid_in_VIES('DE136695976')
+
+        assert [call.args[1:] for call in cache_set.call_args_list] == [(True, 1000), (False, 10)]
+
+    def test_negative_entry_expires(self, vies_responder, settings):
+        settings.INVOICING_VIES_CACHE_NEGATIVE_TTL = 0
+
+        assert EUTaxationPolicy.is_valid_in_VIES('CZ25596641') is False
+        vies_responder.valid.add('CZ25596641')
+        assert EUTaxationPolicy.is_valid_in_VIES('CZ25596641') is True
+
+    @pytest.mark.django_db
+    def test_recalculate_tax_checks_vies_once(self, vies_responder, invoice_factory, item_factory, settings):
+        settings.INVOICING_TAXATION_POLICY = 'invoicing.taxation.eu.EUTaxationPolicy'
+        vies_responder.valid.add('CZ25596641')
+        invoice = invoice_factory(
+            supplier_country='SK',
+            customer_country='CZ',
+            supplier_vat_id='SK2020273893',
+            customer_vat_id='CZ25596641',
+        )
+
+        for _ in range(3):
+            item_factory(invoice=invoice, quantity=Decimal('1.0'), unit_price=Decimal('100.00'))
+
+        invoice.recalculate_tax()
+
+        assert vies_responder.requests == ['CZ25596641']
+        assert all(item.tax_rate is None for item in invoice.item_set.all())
+
+    def test_prevalidate_vat_ids(self, vies_responder):
+        vies_responder.valid.update({'CZ25596641', 'DE136695976'})
+        vies_responder.delay = 0.05
+        vat_ids = ['CZ25596641', 'DE136695976', 'HU12892312', 'CZ25596641', None, '', 'ATU13585627', 'DE136695976']
+
+        results = EUTaxationPolicy.prevalidate_vat_ids(vat_ids, max_workers=2)
+
+        assert results == {'CZ25596641': True, 'DE136695976': True, 'HU12892312': False, 'ATU13585627': False}
+        assert sorted(vies_responder.requests) == ['ATU13585627', 'CZ25596641', 'DE136695976', 'HU12892312']
+        assert vies_responder.max_active == 2
+
+        # tax resolution uses the cache only
+        assert EUTaxationPolicy.get_tax_rate('SK2020273893', 'CZ25596641') is None
+        assert EUTaxationPolicy.get_tax_rate('SK2020273893', 'HU12892312', date(2024, 1, 1)) == Decimal(20)
+        assert len(vies_responder.requests) == 4
+
+    def test_prevalidate_vat_ids_skips_cached(self, vies_responder, settings):
+        settings.INVOICING_VIES_WORKERS = 3
+        vies_responder.valid.add('CZ25596641')
+        EUTaxationPolicy.is_valid_in_VIES('CZ25596641')
+
+        results = EUTaxationPolicy.prevalidate_vat_ids(['CZ25596641', 'DE136695976'])
+
+        assert results == {'CZ25596641': True, 'DE136695976': False}
+        assert vies_responder.requests == ['CZ25596641', 'DE136695976']
+
+    def test_prevalidate_vat_ids_unconfirmed(self, vies_responder):
+        vies_responder.unreachable = True
+
+        assert EUTaxationPolicy.prevalidate_vat_ids(['CZ25596641']) == {'CZ25596641': True}
+        assert EUTaxationPolicy.prevalidate_vat_ids(['CZ25596641']) == {'CZ25596641': True}
+        assert len(vies_responder.requests) == 2
@@ -1,10 +1,24 @@
 """
 Tests for utility functions.
 """
+import io
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
 import pytest
+import responses
 from decimal import Decimal
 
-from invoicing.utils import format_decimal, deprecated
+from django.http import HttpResponse
+
+from invoicing.formatters import InvoiceFormatter
+from invoicing.utils import (
+    format_decimal, deprecated, get_invoices_in_pdf, get_pdf_converter, iter_concurrently, iter_invoices_in_pdf,
+    write_zip_archive, HTTPPDFConverter, LocalPDFConverter, get_pdf_base_url, get_executor
+)
 
 
 @pytest.mark.unit
@@ -41,3 +55,255 @@ class TestDeprecated:
         # Decorator should not break function execution
         result = old_function()
         assert result == "test"
+
+
+def html_to_pdf_with_pid(content):
+    return b'%PDF-1.4 ' + str(os.getpid()).encode() + b' ' + content
+
+
+class PDFBytesFormatter(InvoiceFormatter):
+    def get_response(self):
+        return HttpResponse(b'%PDF-1.4 ' + str(self.invoice.pk).encode())
+
+
+class PlainHTMLFormatter(InvoiceFormatter):
+    def get_response(self):
+        return HttpResponse(b'<html>' + str(self.invoice.pk).encode() + b'</html>')
+
+
+@pytest.mark.unit
+class TestIterConcurrently:
+    """Tests for iter_concurrently helper."""
+
+    def test_inline_with_single_worker(self):
+        thread_ids = set()
+
+        def func(item):
+            thread_ids.add(threading.get_ident())
+            return item * 2
+
+        assert list(iter_concurrently(func, range(3))) == [(0, 0), (1, 2), (2, 4)]
+        assert thread_ids == {threading.get_ident()}
+
+    def test_yields_all_results(self):
+        results = iter_concurrently(lambda item: item * 2, range(20), max_workers=4)
+        assert sorted(results) == [(item, item * 2) for item in range(20)]
+
+    def test_yields_as_completed(self):
+        def func(item):
+            time.sleep(0.2 if item == 0 else 0)
+            return item
+
+        results = [item for item, result in iter_concurrently(func, range(3), max_workers=3)]
+        assert results[-1] == 0
+
+    def test_bounds_pending_calls(self):
+        consumed = []
+        max_pending = 3
+
+        def items():
+            for item in range(10):
+                consumed.append(item)
+                yield item
+
+        for yielded, result in enumerate(iter_concurrently(lambda item: item, items(), max_workers=2, max_pending=max_pending)):
+            # items are consumed lazily, only bounded number of calls is ahead of the results
+            assert len(consumed) <= yielded + max_pending
+
+        assert len(consumed) == 10
+
+    def test_propagates_exceptions(self):
+        def func(item):
+            if item == 2:
+                raise ValueError(item)
+            return item
+
+        with pytest.raises(ValueError):
+            list(iter_concurrently(func, range(5), max_workers=2))
+
+    def test_worker_finalizer(self):
+        func_threads = set()
+        finalized_threads = []
+
+        def func(item):
+            func_threads.add(threading.get_ident())
+            time.sleep(0.01)
+            return item
+
+        def finalizer():
+            finalized_threads.append(threading.get_ident())
+
+        results = iter_concurrently(func, range(20), max_workers=3, worker_finalizer=finalizer)
+
+        assert len(list(results)) == 20
+        # once per worker thread, not per call
+        assert len(finalized_threads) == len(set(finalized_threads)) == 3
+        assert func_threads <= set(finalized_threads)
+
+    def test_worker_finalizer_not_called_inline(self):
+        finalized_threads = []
+
+        results = iter_concurrently(lambda item: item, range(3), worker_finalizer=lambda: finalized_threads.append(1))
+
+        assert list(results) == [(0, 0), (1, 1), (2, 2)]
+        assert finalized_threads == []
+
+
+@pytest.mark.unit
+class TestWriteZipArchive:
+    """Tests for write_zip_archive helper."""
+
+    def test_streams_files_into_archive(self):
+        output = io.BytesIO()
+        files = ({'name': f'{i}.xml', 'content': b'<xml/>'} for i in range(3))
+
+        assert write_zip_archive(output, files) == 3
+
+        with zipfile.ZipFile(output) as archive:
+            assert archive.namelist() == ['0.xml', '1.xml', '2.xml']
+            assert archive.read('1.xml') == b'<xml/>'
+
+    def test_skips_empty_files(self):
+        output = io.BytesIO()
+        files = [{'name': 'a.pdf', 'content': b''}, {'name': '', 'content': b'x'}, {'name': 'b.pdf', 'content': b'x'}]
+
+        assert write_zip_archive(output, files) == 1
+
+        with zipfile.ZipFile(output) as archive:
+            assert archive.namelist() == ['b.pdf']
+
+
+@pytest.mark.django_db
+@pytest.mark.unit
+class TestGetInvoicesInPdf:
+    """Tests for PDF rendering pipeline."""
+
+    def test_pdf_formatter(self, settings, invoice_factory):
+        settings.INVOICING_FORMATTER = 'invoicing.tests.test_utils.PDFBytesFormatter'
+        invoices = [invoice_factory() for i in range(3)]
+
+        files = get_invoices_in_pdf(invoices)
+
+        assert sorted(file['name'] for file in files) == sorted(f'{invoice}.pdf' for invoice in invoices)
+        assert all(file['content'].startswith(b'%PDF') for file in files)
+
+    @responses.activate
+    def test_html_formatter_converted_by_api(self, settings, invoice_factory):
+        settings.INVOICING_FORMATTER = 'invoicing.tests.test_utils.PlainHTMLFormatter'
+        settings.HTMLTOPDF_API_URL = 'https://htmltopdf.example.com/'
+        settings.INVOICING_PDF_CONVERTER_WORKERS = 4
+
+        def convert(request):
+            return 200, {}, b'%PDF-1.4 ' + request.body
+
+        responses.add_callback(responses.POST, settings.HTMLTOPDF_API_URL, callback=convert)
+        invoices = [invoice_factory() for i in range(5)]
+
+        files = {file['name']: file['content'] for file in get_invoices_in_pdf(invoices)}
+
+        assert len(responses.calls) == 5
+        for invoice in invoices:
+            assert files[f'{invoice}.pdf'] == b'%PDF-1.4 <html>' + str(invoice.pk).encode() + b'</html>'
+
+    def test_native_pdf_formatter(self, settings, invoice_factory):
+        settings.INVOICING_FORMATTER = 'invoicing.formatters.pdf.PDFFormatter'
+        settings.HTMLTOPDF_API_URL = None
+        settings.PRINTMYWEB_URL = None
+        invoice = invoice_factory()
+
+        files = get_invoices_in_pdf([invoice])
+
+        assert files[0]['name'] == f'{invoice}.pdf'
+        assert files[0]['content'].startswith(b'%PDF')
+
+    def test_declared_html_formatter_without_api(self, settings, invoice_factory):
+        settings.INVOICING_FORMATTER = 'invoicing.formatters.html.HTMLFormatter'
+        settings.HTMLTOPDF_API_URL = None
+        settings.PRINTMYWEB_URL = None
+
+        with pytest.raises(NotImplementedError):
+            next(iter_invoices_in_pdf([]))
+
+    def test_html_formatter_without_api(self, settings, invoice_factory):
+        settings.INVOICING_FORMATTER = 'invoicing.tests.test_utils.PlainHTMLFormatter'
+        settings.HTMLTOPDF_API_URL = None
+        settings.PRINTMYWEB_URL = None
+
+        with pytest.raises(NotImplementedError):
+            get_invoices_in_pdf([invoice_factory()])
+
+
+@pytest.mark.unit
+class TestPDFConverters:
+    """Tests for PDF converter backends."""
+
+    def test_no_converter_by_default(self, settings):
+        settings.HTMLTOPDF_API_URL = None
+        settings.PRINTMYWEB_URL = None
+
+        assert get_pdf_converter() is None
+
+    def test_http_converter_selected_by_api_url(self, settings):
+        settings.PRINTMYWEB_URL = 'https://printmyweb.example.com/'
+        settings.INVOICING_PDF_CONVERTER_WORKERS = 5
+
+        converter = get_pdf_converter()
+
+        assert isinstance(converter, HTTPPDFConverter)
+        assert converter.url == settings.PRINTMYWEB_URL
+        assert converter.workers == 5
+
+    def test_converter_selected_by_setting(self, settings):
+        settings.INVOICING_PDF_CONVERTER = 'invoicing.utils.LocalPDFConverter'
+        settings.HTMLTOPDF_API_URL = 'https://htmltopdf.example.com/'
+
+        assert isinstance(get_pdf_converter(), LocalPDFConverter)
+
+    def test_pdf_base_url(self, settings, tmp_path):
+        settings.STATIC_ROOT = tmp_path
+        assert get_pdf_base_url() == f'{tmp_path}{os.sep}'
+
+        settings.INVOICING_PDF_BASE_URL = 'https://example.com/'
+        assert get_pdf_base_url() == 'https://example.com/'
+
+        settings.INVOICING_PDF_BASE_URL = None
+        settings.STATIC_ROOT = None
+        assert get_pdf_base_url() is None
+
+    def test_local_converter_in_worker_processes(self, settings):
+        settings.INVOICING_PDF_LOCAL_RENDERER = 'invoicing.tests.test_utils.html_to_pdf_with_pid'
+        documents = [(object(), f'<html>{i}</html>'.encode()) for i in range(6)]
+
+        with LocalPDFConverter(workers=2) as converter:
+            results = dict(converter.convert_all(iter(documents)))
+
+        for key, content in documents:
+            prefix, pid, converted_content = results[key].split(b' ', 2)
+            assert prefix == b'%PDF-1.4'
+            assert int(pid) != os.getpid()
+            assert converted_content == content
+
+    def test_worker_processes_are_spawned(self):
+        with get_executor(ProcessPoolExecutor, 2) as executor:
+            assert executor._mp_context.get_start_method() == 'spawn'
+
+    def test_local_converter_inline_with_single_worker(self, settings):
+        settings.INVOICING_PDF_LOCAL_RENDERER = 'invoicing.tests.test_utils.html_to_pdf_with_pid'
+
+        with LocalPDFConverter(workers=1) as converter:
+            results = list(converter.convert_all([('key', b'<html/>')]))
+
+        assert results == [('key', b'%PDF-1.4 ' + str(os.getpid()).encode() + b' <html/>')]
+
+    @pytest.mark.django_db
+    def test_pipeline_with_local_converter(self, settings, invoice_factory):
+        settings.INVOICING_FORMATTER = 'invoicing.formatters.html.HTMLFormatter'
+        settings.INVOICING_PDF_CONVERTER = 'invoicing.utils.LocalPDFConverter'
+        settings.INVOICING_PDF_LOCAL_RENDERER = 'invoicing.tests.test_utils.html_to_pdf_with_pid'
+        settings.INVOICING_PDF_CONVERTER_WORKERS = 2
+        invoices = [invoice_factory() for i in range(3)]
+
+        files = {file['name']: file['content'] for file in get_invoices_in_pdf(invoices)}
+
+        assert sorted(files) == sorted(f'{invoice}.pdf' for invoice in invoices)
+        assert all(content.startswith(b'%PDF') for content in files.values())
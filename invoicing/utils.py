@@ -1,67 +1,345 @@
 import functools
+import multiprocessing
+import os
+import threading
 import warnings
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from decimal import Decimal
 
-import binascii
-
 from django.conf import settings
+from django.db import connections
 from django.utils.module_loading import import_string
-from requests_futures import sessions
+
+from invoicing.cache import get_pdf_cache
+
+
+PDF_CONTENT_TYPE = 'application/pdf'
+
+
+def iter_concurrently(func, iterable, max_workers=1, max_pending=None, executor_class=ThreadPoolExecutor, worker_finalizer=None):
+    """
+    Calls ``func`` for every item of ``iterable`` in a pool of ``max_workers`` threads
+    (or processes, if ``executor_class`` is ``ProcessPoolExecutor``) and yields ``(item, result)``
+    pairs as the calls complete (not in input order).
+
+    Items are consumed lazily and at most ``max_pending`` calls (twice the number of workers
+    by default) are in flight at once, so the iterable may be a generator over a large queryset.
+    With a single worker the calls run inline in the calling thread.
+
+    ``worker_finalizer`` is called once in every worker thread when the pool shuts down
+    (e.g. to close database connections of the thread). It is not called inline nor in processes.
+
+    Worker processes are spawned (not forked) and set up Django on start, see ``get_executor()``.
+    """
+    if max_workers <= 1:
+        for item in iterable:
+            yield item, func(item)
+        return
+
+    max_pending = max(max_pending or max_workers * 2, max_workers)
+    pending = {}
+
+    def iter_completed(return_when):
+        done, not_done = wait(pending, return_when=return_when)
+        for future in done:
+            yield pending.pop(future), future.result()
+
+    with get_executor(executor_class, max_workers) as executor:
+        try:
+            for item in iterable:
+                pending[executor.submit(func, item)] = item
+
+                if len(pending) >= max_pending:
+                    yield from iter_completed(FIRST_COMPLETED)
+
+            while pending:
+                yield from iter_completed(FIRST_COMPLETED)
+        finally:
+            # generator closed early or a call failed
+            for future in pending:
+                future.cancel()
+
+            if worker_finalizer is not None and executor_class is ThreadPoolExecutor:
+                _finalize_workers(executor, max_workers, worker_finalizer)
+
+
+def get_executor(executor_class, max_workers):
+    """
+    Returns executor of ``max_workers``. Process pools use ``spawn`` start method: forking a process
+    which runs other threads (e.g. render workers holding database connections and locks) may deadlock.
+    """
+    if issubclass(executor_class, ProcessPoolExecutor):
+        return executor_class(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_setup_worker_process
+        )
+
+    return executor_class(max_workers=max_workers)
+
+
+def _setup_worker_process():
+    # spawned process starts with fresh interpreter
+    import django
+    django.setup()
+
+
+def _finalize_workers(executor, max_workers, worker_finalizer, timeout=30):
+    # every call waits until all workers take one, so each thread runs the finalizer once
+    barrier = threading.Barrier(max_workers, timeout=timeout)
+
+    def finalize():
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            pass
+        worker_finalizer()
+
+    for _ in range(max_workers):
+        executor.submit(finalize)
+
+
+def get_http_session(pool_size=1):
+    """
+    Returns ``requests.Session`` with connection pool large enough to be shared by ``pool_size`` threads.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, 1))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
 
 
 def get_invoices_in_pdf(invoices):
+    return list(iter_invoices_in_pdf(invoices))
+
+
+def iter_invoices_in_pdf(invoices):
+    """
+    Yields ``{'name': ..., 'content': ...}`` PDF file for every invoice as soon as it is ready.
+
+    Invoices are rendered by ``INVOICING_FORMATTER`` in ``INVOICING_PDF_RENDER_WORKERS`` threads
+    (inline by default). Unless the formatter declares PDF ``content_type``, its output is converted
+    to PDF by the converter returned by ``get_pdf_converter()``, so both stages overlap.
+    Files are yielded in order of completion.
+
+    If PDF cache is enabled, cached documents are used instead of rendering and new documents are cached.
+    """
     # TODO: replace with invoicing_settings
     invoicing_formatter = getattr(settings, 'INVOICING_FORMATTER', 'invoicing.formatters.html.BootstrapHTMLFormatter')
     formatter_class = import_string(invoicing_formatter)
-    htmltopdf_api_url = getattr(settings, 'HTMLTOPDF_API_URL', None)
-    printmyweb_url = getattr(settings, 'PRINTMYWEB_URL', None)
-    printmyweb_token = getattr(settings, 'PRINTMYWEB_TOKEN', None)
-    requests = []
-    export_files = []
+    render_workers = getattr(settings, 'INVOICING_PDF_RENDER_WORKERS', 1)
+    content_type = getattr(formatter_class, 'content_type', None)
+    converter = get_pdf_converter() if content_type != PDF_CONTENT_TYPE else None
+
+    if content_type not in (None, PDF_CONTENT_TYPE) and converter is None:
+        raise NotImplementedError(f'Invoice content is {content_type} and PDF converter is not set!')
+
+    pdf_cache = get_pdf_cache()
+    cached_invoices = set()
+
+    def render(invoice):
+        if pdf_cache is not None:
+            cached_content = pdf_cache.get(invoice, formatter_class)
+
+            if cached_content is not None:
+                # PDF content is passed through conversion
+                cached_invoices.add(invoice.pk)
+                return cached_content
+
+        return formatter_class(invoice).get_content()
+
+    def get_file(invoice, pdf_content):
+        if pdf_cache is not None and invoice.pk not in cached_invoices:
+            pdf_cache.set(invoice, formatter_class, pdf_content)
 
-    print_api_url = htmltopdf_api_url or printmyweb_url
+        return {'name': str(invoice) + '.pdf', 'content': pdf_content}
 
-    for invoice in invoices:
-        formatter = formatter_class(invoice)
-        invoice_content = formatter.get_response().content
+    # worker threads have their own database connections, reused for all invoices of the export
+    rendered_invoices = iter_concurrently(render, invoices, max_workers=render_workers, worker_finalizer=connections.close_all)
 
-        hex_4_bytes = binascii.hexlify(invoice_content)[0:8]
+    if content_type == PDF_CONTENT_TYPE:
+        # native PDF needs no conversion
+        yield from (get_file(invoice, content) for invoice, content in rendered_invoices)
+        return
+
+    if converter is None:
+        # formatter without declared content type which may still produce PDF
+        converter = PDFConverter()
+
+    with converter:
+        for invoice, pdf_content in converter.convert_all(rendered_invoices):
+            yield get_file(invoice, pdf_content)
+
+
+def get_pdf_converter():
+    """
+    Returns instance of ``INVOICING_PDF_CONVERTER`` class. By default it is ``HTTPPDFConverter``
+    if HTMLTOPDF/PrintMyWeb API URL is set, otherwise no converter (None).
+    """
+    converter_path = getattr(settings, 'INVOICING_PDF_CONVERTER', None)
+
+    if converter_path is None:
+        if not (getattr(settings, 'HTMLTOPDF_API_URL', None) or getattr(settings, 'PRINTMYWEB_URL', None)):
+            return None
+
+        converter_path = 'invoicing.utils.HTTPPDFConverter'
+
+    return import_string(converter_path)(workers=getattr(settings, 'INVOICING_PDF_CONVERTER_WORKERS', 3))
+
+
+class PDFConverter(object):
+    """
+    Converts rendered invoices to PDF in a pool of ``workers``. Subclasses implement ``convert()``,
+    content which already is PDF is passed through.
+
+    Use converter as context manager around ``convert_all()`` to open and release its resources.
+    """
+    executor_class = ThreadPoolExecutor
+
+    def __init__(self, workers=1):
+        self.workers = workers
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def convert(self, content):
+        raise NotImplementedError('Invoice content is not PDF and PDF converter is not set!')
+
+    def convert_document(self, document):
+        index, content = document
 
         # Look at the first 4 bytes of the file.
         # PDF has "%PDF" (hex 25 50 44 46) and ZIP has hex 50 4B 03 04.
-        is_pdf = hex_4_bytes == b'25504446'
+        if content[:4] == b'%PDF':
+            return content
+
+        return self.convert(content)
+
+    def convert_all(self, documents):
+        """
+        Yields ``(key, pdf_content)`` for every ``(key, content)`` document as conversions complete.
+        Only indexed content is passed to workers, so keys don't have to be picklable.
+        """
+        keys = {}
+
+        def iter_indexed_contents():
+            for index, (key, content) in enumerate(documents):
+                keys[index] = key
+                yield index, content
 
-        if is_pdf:
-            export_files.append({'name': str(invoice) + '.pdf', 'content': invoice_content})
-        else:
-            if print_api_url is None:
-                raise NotImplementedError('Invoice content is not PDF and print_api_url is not set!')
-            else:
-                requests.append({'invoice': str(invoice), 'html_content': invoice_content})
+        results = iter_concurrently(
+            self.convert_document, iter_indexed_contents(), max_workers=self.workers, executor_class=self.executor_class
+        )
+
+        for (index, content), pdf_content in results:
+            yield keys.pop(index), pdf_content
+
+
+class HTTPPDFConverter(PDFConverter):
+    """
+    Converts HTML by HTMLTOPDF (``HTMLTOPDF_API_URL``) or PrintMyWeb (``PRINTMYWEB_URL``, ``PRINTMYWEB_TOKEN``) API
+    in worker threads sharing one pooled HTTP session.
+    """
+    def __init__(self, workers=1):
+        super().__init__(workers)
+        self.url = getattr(settings, 'HTMLTOPDF_API_URL', None) or getattr(settings, 'PRINTMYWEB_URL', None)
+        self.token = getattr(settings, 'PRINTMYWEB_TOKEN', None)
+        self.session = None
+
+    def open(self):
+        self.session = get_http_session(self.workers)
 
-    if len(requests) > 0:
-        session = sessions.FuturesSession(max_workers=3)
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
 
+    def convert(self, content):
         kwargs = {}
-        if printmyweb_token:
+        if self.token:
             kwargs['headers'] = {
-                'api-key': printmyweb_token
+                'api-key': self.token
             }
 
-        futures = [
-            {'invoice': request.get('invoice'), 'future': session.post(
-                url=print_api_url,
-                data=request.get('html_content'),
-                **kwargs
-            )}
-            for request in requests]
+        return self.session.post(url=self.url, data=content, **kwargs).content
+
+
+class LocalPDFConverter(PDFConverter):
+    """
+    Converts HTML in a pool of local worker processes by ``INVOICING_PDF_LOCAL_RENDERER`` function
+    (``content -> pdf_content``), without network round trips.
+    """
+    executor_class = ProcessPoolExecutor
+
+    def __init__(self, workers=1):
+        super().__init__(workers)
+        self.renderer = getattr(settings, 'INVOICING_PDF_LOCAL_RENDERER', 'invoicing.utils.weasyprint_html_to_pdf')
+
+    def convert(self, content):
+        return import_string(self.renderer)(content)
+
+
+def weasyprint_html_to_pdf(content):
+    """
+    Renders HTML to PDF by WeasyPrint (optional dependency).
+    Relative URLs of the document are resolved against ``get_pdf_base_url()``.
+    """
+    from weasyprint import HTML
+    return HTML(string=content.decode('utf-8'), base_url=get_pdf_base_url()).write_pdf()
+
+
+def get_pdf_base_url():
+    """
+    Returns ``INVOICING_PDF_BASE_URL`` (``STATIC_ROOT`` by default) used to resolve relative URLs
+    (logo, stylesheets, static files) of HTML documents converted locally.
+    Directory paths get trailing separator, so relative URLs resolve inside the directory.
+    """
+    base_url = getattr(settings, 'INVOICING_PDF_BASE_URL', None) or getattr(settings, 'STATIC_ROOT', None)
+
+    if not base_url:
+        return None
+
+    base_url = str(base_url)
+
+    if '://' not in base_url:
+        base_url = os.path.join(base_url, '')
+
+    return base_url
+
+
+def write_zip_archive(output, files):
+    """
+    Writes ``{'name': ..., 'content': ...}`` files into ZIP archive on ``output`` one by one,
+    so only single file content is held in memory when ``files`` is a generator.
+    Files without name or content are skipped. Returns number of archived files.
+    """
+    count = 0
+
+    with zipfile.ZipFile(output, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for file in files:
+            name = file.get('name', None)
+            content = file.get('content', None)
 
-        for f in futures:
-            file_name = f.get('invoice')
-            result = f.get('future').result()
-            export_files.append({'name': file_name + '.pdf', 'content': result.content})
+            if name and content:
+                archive.writestr(name, content)
+                count += 1
 
-    return export_files
+    return count
 
 
 def deprecated(func):
@@ -1,12 +1,14 @@
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseForbidden
+from django.http import HttpResponse, HttpResponseForbidden
 from django.shortcuts import get_object_or_404
 from django.utils.decorators import method_decorator
 from django.utils.module_loading import import_string
 from django.views.generic import DetailView
 
+from invoicing.cache import get_pdf_cache
 from invoicing.models import Invoice
+from invoicing.utils import PDF_CONTENT_TYPE
 
 
 class InvoiceDetailView(DetailView):
@@ -23,4 +25,17 @@ class InvoiceDetailView(DetailView):
         invoicing_formatter = getattr(settings, 'INVOICING_FORMATTER', 'invoicing.formatters.html.BootstrapHTMLFormatter')
         formatter_class = import_string(invoicing_formatter)
         formatter = formatter_class(invoice)
-        return formatter.get_response()
+        pdf_cache = get_pdf_cache()
+
+        if pdf_cache is None or getattr(formatter, 'content_type', None) != PDF_CONTENT_TYPE:
+            return formatter.get_response()
+
+        content = pdf_cache.get(invoice, formatter_class)
+
+        if content is None:
+            content = formatter.get_content()
+            pdf_cache.set(invoice, formatter_class, content)
+
+        response = HttpResponse(content, content_type=PDF_CONTENT_TYPE)
+        response['Content-Disposition'] = f'inline; filename="{invoice}.pdf"'
+        return response
@@ -21,6 +21,8 @@ setup(
     ),
     extras_require={
         'exporters': ['django-outputs', 'django-pragmatic'],  # optional umbrella for all exporters
+        'pdf': ['reportlab'],  # invoicing.formatters.pdf.PDFFormatter
+        'weasyprint': ['weasyprint'],  # invoicing.utils.LocalPDFConverter
     },
     classifiers=[
         'Programming Language :: Python',